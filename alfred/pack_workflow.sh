@@ -7,10 +7,19 @@ OUT="$WF_DIR/GmailTrashMover.alfredworkflow"
 TMP=$(mktemp -d)
 trap 'rm -rf "$TMP"' EXIT
 
+# A malformed plist imports as an empty workflow, so catch it here
+if command -v plutil >/dev/null 2>&1; then
+  plutil -lint -s "$WF_DIR/info.plist"
+else
+  python3 -c 'import plistlib, sys; plistlib.load(open(sys.argv[1], "rb"))' "$WF_DIR/info.plist"
+fi
+
 cp "$WF_DIR/info.plist" "$TMP/info.plist"
 
 # Optional icons can be added here in the future.
 
+# zip adds to an existing archive, which would keep files removed from the workflow
+rm -f "$OUT"
 (cd "$TMP" && zip -q -r "$OUT" .)
 
 echo "Created: $OUT"
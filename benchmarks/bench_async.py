@@ -0,0 +1,72 @@
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.fake_gmail import FakeGmail  # noqa: E402
+from benchmarks.stub_server import StubGmailServer, discovery_for  # noqa: E402
+from src import gmail_ops  # noqa: E402
+
+
+def _sync_factory(root_url: str):
+    import httplib2
+    from googleapiclient.discovery import build_from_document
+
+    doc = discovery_for(root_url)
+    return lambda: build_from_document(doc, http=httplib2.Http())
+
+
+def run(label: str, service, factory, workers: int, query: str, fetch: int, calls) -> dict:
+    before = dict(calls)
+    started = time.perf_counter()
+    ids = gmail_ops.search_message_ids(service, "me", query)
+    metas = gmail_ops.get_messages_metadata(service, "me", ids[:fetch], workers=workers, service_factory=factory)
+    elapsed = time.perf_counter() - started
+    return {
+        "transport": label,
+        "workers": workers,
+        "ids": len(ids),
+        "metas": len(metas),
+        "wall_s": round(elapsed, 3),
+        "calls": {k: v - before.get(k, 0) for k, v in calls.items() if v != before.get(k, 0)},
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare the httplib2 batch path with the async httpx facade against a local stub")
+    parser.add_argument("--size", type=int, default=5000)
+    parser.add_argument("--fetch", type=int, default=1000, help="metadata gets per run")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="simulated round trip per HTTP request")
+    parser.add_argument("--item-ms", type=float, default=1.0, help="simulated server work per message")
+    parser.add_argument("--concurrency", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    try:
+        from src.async_client import AsyncGmailClient, SyncGmailService
+        import httpx  # noqa: F401
+    except ImportError:
+        sys.stderr.write("httpx is required: pip install 'httpx[http2]'\n")
+        return 1
+
+    backend = FakeGmail(args.size)
+    query = "category:promotions"
+    results = []
+    with StubGmailServer(backend, latency=args.latency_ms / 1000, item_latency=args.item_ms / 1000) as stub:
+        factory = _sync_factory(stub.root_url)
+        for workers in (1, 4):
+            results.append(run("httplib2-batch", factory(), factory, workers, query, args.fetch, backend.calls))
+        facade = SyncGmailService(lambda: AsyncGmailClient(root_url=stub.root_url, concurrency=args.concurrency))
+        try:
+            for workers in (1, 4):
+                results.append(run("httpx-async", facade, lambda: facade, workers, query, args.fetch, backend.calls))
+        finally:
+            facade.close()
+    print(json.dumps({"benchmark": "async", "size": args.size, "latency_ms": args.latency_ms, "item_ms": args.item_ms, "results": results}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
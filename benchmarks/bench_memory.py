@@ -0,0 +1,64 @@
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.fake_gmail import FakeGmail  # noqa: E402
+from src import gmail_ops  # noqa: E402
+from src.meta_store import MetaStore  # noqa: E402
+
+
+def _retained(build) -> tuple[object, float]:
+    # Bytes still allocated once build() returns, i.e. what the run keeps holding
+    gc.collect()
+    tracemalloc.start()
+    result = build()
+    gc.collect()
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, round(size / 2**20, 2)
+
+
+def _timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return round(best, 4)
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Memory and filter cost of metadata dicts versus the compact MetaStore")
+    parser.add_argument("--size", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args(argv)
+
+    backend = FakeGmail(args.size)
+    # Encoded once up front; decoding gives each message fresh strings, as a real HTTP response would
+    bodies = [json.dumps(backend.get(mid)) for mid in backend.order]
+    # The store packs responses one at a time, so only one dict is alive at once
+    dicts, dict_mb = _retained(lambda: [json.loads(b) for b in bodies])
+    store, store_mb = _retained(lambda: MetaStore(json.loads(b) for b in bodies))
+    assert gmail_ops.classify_ids(dicts) == gmail_ops.classify_ids(store)
+    assert gmail_ops.senders_from_metas(dicts) == gmail_ops.senders_from_metas(store)
+
+    rows = {}
+    for label, metas, mb in (("dicts", dicts, dict_mb), ("meta_store", store, store_mb)):
+        rows[label] = {
+            "retained_mb": mb,
+            "classify_s": _timed(lambda: gmail_ops.classify_ids(metas), args.repeat),
+            "filter_s": _timed(lambda: gmail_ops.filter_ids_for_trash(metas), args.repeat),
+            "senders_s": _timed(lambda: gmail_ops.senders_from_metas(metas), args.repeat),
+        }
+    print(json.dumps({"benchmark": "memory", "size": args.size, "results": rows}, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
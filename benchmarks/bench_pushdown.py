@@ -0,0 +1,58 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from benchmarks.fake_gmail import FakeGmail  # noqa: E402
+from src import gmail_trash  # noqa: E402
+
+
+def run(size: int, extra_args: list[str]) -> dict:
+    backend = FakeGmail(size)
+    started = time.perf_counter()
+    # Each run gets its own config directory: a label cache left by another backend
+    # holds IDs this one answers with 404, which forces a rerun and skews the counts
+    with tempfile.TemporaryDirectory() as tmp, mock.patch.object(gmail_trash, "get_credentials", return_value=object()), mock.patch.object(
+        gmail_trash, "build_service", return_value=backend
+    ), contextlib.redirect_stdout(io.StringIO()) as out:
+        argv = ["--query", "category:promotions", "--quota-units", "0", "--token-path", os.path.join(tmp, "token.json"), *extra_args]
+        code = gmail_trash.main(argv)
+    return {
+        "args": extra_args,
+        "exit": code,
+        "wall_s": round(time.perf_counter() - started, 3),
+        "messages_get": backend.calls["messages.get"],
+        "messages_list": backend.calls["messages.list"],
+        "batch_modify": backend.calls["messages.batchModify"],
+        "output": out.getvalue().strip().splitlines(),
+    }
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Compare metadata fetches with and without --pushdown")
+    parser.add_argument("--size", type=int, default=20000)
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ascii_only = os.path.join(tmp, "keywords.txt")
+        with open(ascii_only, "w", encoding="utf-8") as f:
+            f.write("password\nverification code\notp\n")
+        results = [
+            run(args.size, []),
+            run(args.size, ["--pushdown"]),
+            run(args.size, ["--sensitive-keywords-file", ascii_only]),
+            run(args.size, ["--pushdown", "--sensitive-keywords-file", ascii_only]),
+        ]
+    print(json.dumps({"benchmark": "pushdown", "size": args.size, "results": results}, ensure_ascii=False, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
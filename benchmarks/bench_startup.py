@@ -0,0 +1,64 @@
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def _run(args: list[str]) -> subprocess.CompletedProcess:
+    return subprocess.run([sys.executable, *args], cwd=ROOT, capture_output=True, text=True)
+
+
+def import_profile(top: int) -> dict:
+    # -X importtime writes "self | cumulative | name" lines (microseconds) to stderr
+    proc = _run(["-X", "importtime", "-c", "import src.gmail_trash"])
+    rows = []
+    for line in proc.stderr.splitlines():
+        m = re.match(r"import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)", line)
+        if m:
+            rows.append((int(m.group(2)), len(m.group(3)), m.group(4)))
+            if m.group(4) == "site":
+                # Interpreter startup, not ours
+                rows = []
+    total = next((us for us, _, name in rows if name == "src.gmail_trash"), None)
+    heaviest = sorted((r for r in rows if r[1] <= 4 and r[2] != "src.gmail_trash"), reverse=True)[:top]
+    return {
+        "total_ms": round(total / 1000, 1) if total is not None else None,
+        "heaviest": [{"module": name, "ms": round(us / 1000, 1)} for us, _, name in heaviest],
+    }
+
+
+def wall_clock(args: list[str], repeat: int) -> dict:
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        _run(["-m", "src.gmail_trash", *args])
+        samples.append((time.perf_counter() - started) * 1000)
+    return {"args": args, "median_ms": round(statistics.median(samples), 1), "min_ms": round(min(samples), 1)}
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Measure cold-start cost of the CLI")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--top", type=int, default=8)
+    parser.add_argument("--max-ms", type=float, default=None, help="Fail when a median wall clock exceeds this")
+    args = parser.parse_args(argv)
+
+    runs = [wall_clock(["--help"], args.repeat), wall_clock(["--query", " "], args.repeat)]
+    result = {"benchmark": "startup", "imports": import_profile(args.top), "runs": runs}
+    print(json.dumps(result, ensure_ascii=False, indent=2))
+    if args.max_ms is not None:
+        slow = [r for r in runs if r["median_ms"] > args.max_ms]
+        if slow:
+            sys.stderr.write(f"startup regression: {slow} exceeds {args.max_ms} ms\n")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
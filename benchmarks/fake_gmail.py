@@ -0,0 +1,343 @@
+from __future__ import annotations
+
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from src.query import And, Not, Or, Term, parse  # noqa: E402
+from src.ratelimit import method_cost  # noqa: E402
+
+
+SUBJECTS = (
+    "Weekly deals just for you",
+    "Your order has shipped",
+    "Newsletter: what's new this month",
+    "Flash sale ends tonight",
+    "Reset password request",
+    "您的驗證碼",
+    "Event invitation",
+    "Your monthly statement",
+)
+SENDERS = (
+    "Shop <deals@shop.example.com>",
+    "news@news.example.org",
+    "Bank <alerts@bank.example.com>",
+    "noreply@social.example.net",
+    "Travel <offers@travel.example.co.uk>",
+)
+_UNITS = {"d": 86400, "m": 30 * 86400, "y": 365 * 86400}
+
+
+def _message(i: int, rng: random.Random, now: int, starred: float, important: float) -> dict:
+    labels = ["INBOX", rng.choice(["CATEGORY_PROMOTIONS", "CATEGORY_UPDATES", "CATEGORY_SOCIAL"])]
+    if rng.random() < starred:
+        labels.append("STARRED")
+    if rng.random() < important:
+        labels.append("IMPORTANT")
+    subject = rng.choice(SUBJECTS)
+    return {
+        "id": f"{i:08x}",
+        "labelIds": labels,
+        "snippet": f"{subject.lower()} - message {i}",
+        "internalDate": str((now - i * 3600) * 1000),
+        "from": rng.choice(SENDERS),
+        "subject": subject,
+    }
+
+
+def http_error(status: int, retry_after: str | None = None):
+    import httplib2
+    from googleapiclient.errors import HttpError
+
+    headers = {"status": status}
+    if retry_after is not None:
+        headers["retry-after"] = retry_after
+    return HttpError(httplib2.Response(headers), b"{}")
+
+
+def partial_response(res: dict, fields: str | None) -> dict:
+    # Enough of Gmail's fields= selector for "key" and "key/subkey" paths
+    if not fields:
+        return res
+    out: dict = {}
+    for path in fields.split(","):
+        key, _, sub = path.strip().partition("/")
+        if key not in res:
+            continue
+        value = res[key]
+        if sub and isinstance(value, list):
+            value = [{sub: item[sub]} for item in value if sub in item]
+        out[key] = value
+    return out
+
+
+class FakeRequest:
+    def __init__(self, backend: "FakeGmail", method: str, fn):
+        self._backend = backend
+        self._method = method
+        self._fn = fn
+
+    def serve(self):
+        self._backend.account(self._method)
+        return self._fn()
+
+    def execute(self):
+        self._backend.round_trip()
+        return self.serve()
+
+
+class FakeBatch:
+    def __init__(self, backend: "FakeGmail", callback):
+        self._backend = backend
+        self._callback = callback
+        self._requests: list = []
+
+    def add(self, request, callback=None, request_id=None):
+        self._requests.append((request_id, request))
+
+    def execute(self):
+        # One round trip for the whole batch; each part is accounted (and may fail) on its own
+        self._backend.calls["batch"] += 1
+        self._backend.round_trip()
+        for request_id, request in self._requests:
+            try:
+                response = request.serve()
+            except Exception as e:
+                if "HttpError" not in e.__class__.__name__:
+                    raise
+                self._callback(request_id, None, e)
+            else:
+                self._callback(request_id, response, None)
+
+
+class _Messages:
+    def __init__(self, backend: "FakeGmail"):
+        self._b = backend
+
+    def list(self, userId=None, q=None, pageToken=None, maxResults=None, fields=None, **kwargs):  # noqa: N802
+        return FakeRequest(self._b, "messages.list", lambda: partial_response(self._b.list_page(q or "", pageToken, maxResults or 100), fields))
+
+    def get(self, userId=None, id=None, format=None, metadataHeaders=None, **kwargs):  # noqa: N802, A002
+        return FakeRequest(self._b, "messages.get", lambda: self._b.get(id, metadataHeaders))
+
+    def batchModify(self, userId=None, body=None):  # noqa: N802
+        return FakeRequest(self._b, "messages.batchModify", lambda: self._b.batch_modify(body))
+
+
+class _Labels:
+    def __init__(self, backend: "FakeGmail"):
+        self._b = backend
+
+    def list(self, userId=None):  # noqa: N802
+        return FakeRequest(self._b, "labels.list", lambda: {"labels": list(self._b.labels)})
+
+    def create(self, userId=None, body=None):  # noqa: N802
+        def _create():
+            label = {"id": f"Label_{len(self._b.labels) + 1}", "name": body["name"]}
+            self._b.labels.append(label)
+            return label
+
+        return FakeRequest(self._b, "labels.create", _create)
+
+
+class _History:
+    def __init__(self, backend: "FakeGmail"):
+        self._b = backend
+
+    def list(self, userId=None, startHistoryId=None, pageToken=None, historyTypes=None):  # noqa: N802
+        return FakeRequest(self._b, "history.list", lambda: self._b.list_history(startHistoryId, pageToken))
+
+
+class _Users:
+    def __init__(self, backend: "FakeGmail"):
+        self._b = backend
+
+    def messages(self):
+        return _Messages(self._b)
+
+    def labels(self):
+        return _Labels(self._b)
+
+    def history(self):
+        return _History(self._b)
+
+    def getProfile(self, userId=None):  # noqa: N802
+        return FakeRequest(self._b, "getProfile", lambda: {"historyId": str(self._b.history_id)})
+
+
+class FakeGmail:
+    # In-memory mailbox answering the subset of the Gmail API used by gmail_ops
+    def __init__(
+        self,
+        size: int = 10000,
+        *,
+        seed: int = 0,
+        starred: float = 0.05,
+        important: float = 0.2,
+        latency: float = 0.0,
+        throttle_rate: float = 0.0,
+    ):
+        rng = random.Random(seed)
+        now = int(time.time())
+        self.now = now
+        self._rng = rng
+        self._starred = starred
+        self._important = important
+        self.messages = {}
+        for i in range(size):
+            m = _message(i, rng, now, starred, important)
+            self.messages[m["id"]] = m
+        self.order = list(self.messages)
+        self.labels = [{"id": "STARRED", "name": "STARRED"}, {"id": "IMPORTANT", "name": "IMPORTANT"}]
+        self.history_id = 1000
+        # Records older than this have expired, as Gmail does after about a week
+        self.history_floor = self.history_id
+        self.history: list = []
+        # Seconds per HTTP round trip (a batch is one round trip)
+        self.latency = latency
+        # Fraction of calls (and batch parts) answered with 429
+        self.throttle_rate = throttle_rate
+        self._throttle_rng = random.Random(seed + 1)
+        self.calls: Counter = Counter()
+        self.units: Counter = Counter()
+        self.throttled: Counter = Counter()
+        self._query_cache: dict = {}
+
+    @property
+    def total_units(self) -> int:
+        return sum(self.units.values())
+
+    def reset_counters(self) -> None:
+        self.calls.clear()
+        self.units.clear()
+        self.throttled.clear()
+
+    def round_trip(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def account(self, method: str) -> None:
+        self.calls[method] += 1
+        if self.throttle_rate and self._throttle_rng.random() < self.throttle_rate:
+            self.throttled[method] += 1
+            raise http_error(429, retry_after="0")
+        # Only served calls draw on the quota
+        self.units[method] += method_cost(method)
+
+    def deliver(self, count: int) -> list:
+        # New mail arrives newest-first, as messages.list returns it
+        start = len(self.messages)
+        fresh = [_message(start + i, self._rng, self.now, self._starred, self._important) for i in range(count)]
+        for m in fresh:
+            m["internalDate"] = str(self.now * 1000)
+            self.messages[m["id"]] = m
+        self.order = [m["id"] for m in fresh] + self.order
+        self._record("messagesAdded", [{"message": {"id": m["id"]}} for m in fresh])
+        return [m["id"] for m in fresh]
+
+    def _record(self, key: str, items: list) -> None:
+        self.history_id += 1
+        self.history.append({"id": str(self.history_id), key: items})
+        self._query_cache.clear()
+
+    def list_history(self, start_history_id, page_token=None, page_size: int = 100) -> dict:
+        if int(start_history_id) < self.history_floor:
+            raise http_error(404)
+        records = [r for r in self.history if int(r["id"]) > int(start_history_id)]
+        start = int(page_token or 0)
+        res: dict = {"history": records[start : start + page_size], "historyId": str(self.history_id)}
+        if start + page_size < len(records):
+            res["nextPageToken"] = str(start + page_size)
+        return res
+
+    def users(self):
+        return _Users(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    def list_page(self, q: str, page_token, max_results: int) -> dict:
+        if q not in self._query_cache:
+            node = parse(q) if q.strip() else And([])
+            self._query_cache[q] = [mid for mid in self.order if "TRASH" not in self.messages[mid]["labelIds"] and self.matches(node, self.messages[mid])]
+        ids = self._query_cache[q]
+        start = int(page_token or 0)
+        res: dict = {"messages": [{"id": mid} for mid in ids[start : start + max_results]], "resultSizeEstimate": len(ids)}
+        if start + max_results < len(ids):
+            res["nextPageToken"] = str(start + max_results)
+        return res
+
+    def get(self, mid: str, headers=None) -> dict:
+        m = self.messages[mid]
+        wanted = {h.lower() for h in (headers or ("From", "Subject"))}
+        hdrs = [{"name": n, "value": m[n.lower()]} for n in ("From", "Subject") if n.lower() in wanted]
+        return {
+            "id": mid,
+            "labelIds": list(m["labelIds"]),
+            "snippet": m["snippet"],
+            "internalDate": m["internalDate"],
+            "payload": {"headers": hdrs},
+        }
+
+    def batch_modify(self, body: dict) -> dict:
+        added = body.get("addLabelIds", [])
+        removed = body.get("removeLabelIds", [])
+        # User labels must still exist; system labels are always there
+        user_labels = {lb["id"] for lb in self.labels}
+        if any(lid.startswith("Label_") and lid not in user_labels for lid in (*added, *removed)):
+            raise http_error(404)
+        for mid in body["ids"]:
+            labels = self.messages[mid]["labelIds"]
+            for lid in added:
+                if lid not in labels:
+                    labels.append(lid)
+            for lid in removed:
+                if lid in labels:
+                    labels.remove(lid)
+        if added:
+            self._record("labelsAdded", [{"message": {"id": mid}, "labelIds": list(added)} for mid in body["ids"]])
+        if removed:
+            self._record("labelsRemoved", [{"message": {"id": mid}, "labelIds": list(removed)} for mid in body["ids"]])
+        return {}
+
+    def matches(self, node, m: dict) -> bool:
+        if isinstance(node, And):
+            return all(self.matches(c, m) for c in node.children)
+        if isinstance(node, Or):
+            return any(self.matches(c, m) for c in node.children)
+        if isinstance(node, Not):
+            return not self.matches(node.child, m)
+        return self._term(node, m)
+
+    def _term(self, term: Term, m: dict) -> bool:
+        field, value = term.field, term.value.lower()
+        if field == "is":
+            return value.upper() in m["labelIds"]
+        if field == "label":
+            return any(value.replace("-", "_") in lid.lower() for lid in m["labelIds"])
+        if field == "category":
+            return f"CATEGORY_{value.upper()}" in m["labelIds"]
+        if field == "from":
+            return value in m["from"].lower()
+        if field == "subject":
+            return _words(value, m["subject"])
+        if field in ("after", "before"):
+            ts = int(m["internalDate"]) // 1000
+            return ts > int(value) if field == "after" else ts < int(value)
+        if field in ("older_than", "newer_than"):
+            age = self.now - int(m["internalDate"]) // 1000
+            limit = int(value[:-1]) * _UNITS[value[-1]]
+            return age > limit if field == "older_than" else age < limit
+        if field is None:
+            return _words(value, f"{m['subject']} {m['snippet']} {m['from']}")
+        return True
+
+
+def _words(needle: str, haystack: str) -> bool:
+    # Gmail full-text search matches whole words, not substrings
+    return re.search(r"(?<!\w)" + re.escape(needle) + r"(?!\w)", haystack.lower()) is not None
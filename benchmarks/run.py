@@ -0,0 +1,181 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_gmail import FakeGmail  # noqa: E402
+from src import gmail_ops, gmail_trash  # noqa: E402
+
+# Each scenario builds its own backend in setup (not measured) and returns a
+# callable for the measured part plus the backend whose counters it reports.
+
+
+def scenario_pagination(args):
+    backend = FakeGmail(args.size, latency=args.latency)
+
+    def run():
+        return {"ids": len(gmail_ops.search_message_ids(backend, "me", "in:inbox"))}
+
+    return backend, run
+
+
+def scenario_metadata(args):
+    backend = FakeGmail(args.size, latency=args.latency)
+    ids = backend.order[: args.fetch]
+
+    def run():
+        metas = gmail_ops.get_messages_metadata(backend, "me", ids, workers=args.workers, service_factory=lambda: backend)
+        return {"metas": len(metas)}
+
+    return backend, run
+
+
+def scenario_metadata_throttled(args):
+    backend = FakeGmail(args.size, latency=args.latency, throttle_rate=args.throttle_rate)
+    ids = backend.order[: args.fetch]
+
+    def run():
+        # Backoff sleeps are recorded rather than slept so the scenario measures work, not waiting
+        slept = []
+        with mock.patch("time.sleep", side_effect=slept.append):
+            metas = gmail_ops.get_messages_metadata(backend, "me", ids)
+        return {"metas": len(metas), "throttled": sum(backend.throttled.values()), "backoff_s": round(sum(slept), 1)}
+
+    return backend, run
+
+
+def scenario_classify(args):
+    backend = FakeGmail(args.classify_size)
+    metas = [backend.get(mid) for mid in backend.order]
+    backend.reset_counters()
+
+    def run():
+        classes = gmail_ops.classify_ids(metas)
+        trash_ids, skipped = gmail_ops.filter_ids_for_trash(metas)
+        return {"metas": len(metas), "trash": len(trash_ids), "sensitive": len(classes["sensitive"]), "skipped": skipped}
+
+    return backend, run
+
+
+def _main_scenario(extra: list):
+    def scenario(args):
+        backend = FakeGmail(args.size, latency=args.latency)
+        # A fresh config directory per backend: a label cache from an earlier backend would hold IDs this one 404s
+        token_path = os.path.join(tempfile.mkdtemp(dir=args.tmp), "token.json")
+        argv = ["--query", "category:promotions", "--quota-units", "0", "--token-path", token_path, *extra]
+
+        def run():
+            with mock.patch.object(gmail_trash, "get_credentials", return_value=object()), mock.patch.object(
+                gmail_trash, "build_service", return_value=backend
+            ), contextlib.redirect_stdout(io.StringIO()) as out:
+                code = gmail_trash.main(argv)
+            return {"exit": code, "output": out.getvalue().strip().splitlines()[:2]}
+
+        return backend, run
+
+    return scenario
+
+
+SCENARIOS = {
+    "pagination": scenario_pagination,
+    "metadata": scenario_metadata,
+    "metadata_throttled": scenario_metadata_throttled,
+    "classify": scenario_classify,
+    "main_dry_run": _main_scenario(["--dry-run", "--list-from"]),
+    "main_trash": _main_scenario([]),
+}
+
+
+def measure(factory, args) -> dict:
+    backend, run = factory(args)
+    gc.collect()
+    started = time.perf_counter()
+    result = run()
+    wall = time.perf_counter() - started
+    out = {
+        "wall_s": round(wall, 4),
+        "calls": dict(sorted(backend.calls.items())),
+        "units": backend.total_units,
+        "result": result,
+    }
+    if args.memory:
+        # Separate pass: tracemalloc slows allocation-heavy code too much to time it
+        backend, run = factory(args)
+        gc.collect()
+        tracemalloc.start()
+        run()
+        out["peak_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        tracemalloc.stop()
+    return out
+
+
+def _commit() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: dict, baseline: dict) -> dict:
+    # Ratios above 1 mean the current run is slower / calls more / uses more
+    deltas = {}
+    for name, cur in current["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if not base:
+            continue
+        row = {}
+        for key in ("wall_s", "units", "peak_mb"):
+            if base.get(key) and cur.get(key) is not None:
+                row[key] = round(cur[key] / base[key], 3)
+        row["calls"] = {k: cur["calls"].get(k, 0) - base["calls"].get(k, 0) for k in set(cur["calls"]) | set(base["calls"]) if cur["calls"].get(k, 0) != base["calls"].get(k, 0)}
+        deltas[name] = row
+    return deltas
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark suite over the simulated Gmail backend")
+    parser.add_argument("--only", nargs="*", choices=sorted(SCENARIOS), help="scenarios to run (default: all)")
+    parser.add_argument("--size", type=int, default=20000, help="mailbox size")
+    parser.add_argument("--fetch", type=int, default=5000, help="metadata gets in the metadata scenarios")
+    parser.add_argument("--classify-size", type=int, default=100000)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds per simulated round trip")
+    parser.add_argument("--throttle-rate", type=float, default=0.02)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--no-memory", dest="memory", action="store_false", help="skip the tracemalloc pass")
+    parser.add_argument("--out", help="also write the JSON report here")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    params = {k: v for k, v in vars(args).items() if k not in ("only", "out", "compare")}
+    with tempfile.TemporaryDirectory() as tmp:
+        # Job journals and other CONFIG_DIR state stay out of the real data directory
+        args.tmp = tmp
+        scenarios = {name: measure(SCENARIOS[name], args) for name in (args.only or SCENARIOS)}
+    report = {"benchmark": "suite", "commit": _commit(), "python": platform.python_version(), "params": params, "scenarios": scenarios}
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            report["compare"] = compare(report, json.load(f))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
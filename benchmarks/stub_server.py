@@ -0,0 +1,166 @@
+from __future__ import annotations
+
+import json
+import re
+import threading
+import time
+import uuid
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from benchmarks.fake_gmail import FakeGmail, partial_response
+from src.auth import trim_discovery
+
+_USER_PATH = re.compile(r"^/gmail/v1/users/[^/]+/(.*)$")
+
+
+class StubError(Exception):
+    def __init__(self, status: int, message: str = ""):
+        super().__init__(message)
+        self.status = status
+
+
+def dispatch(backend: FakeGmail, method: str, target: str, body: bytes = b"") -> tuple[int, dict]:
+    # Maps one Gmail REST call onto the in-memory backend; also used for batch parts
+    url = urlsplit(target)
+    m = _USER_PATH.match(url.path)
+    if not m:
+        raise StubError(404, url.path)
+    route = m.group(1)
+    qs = parse_qs(url.query)
+
+    def one(name, default=None):
+        return qs.get(name, [default])[0]
+
+    if route == "messages" and method == "GET":
+        backend.calls["messages.list"] += 1
+        return 200, partial_response(backend.list_page(one("q", ""), one("pageToken"), int(one("maxResults", 100))), one("fields"))
+    if route == "messages/batchModify" and method == "POST":
+        backend.calls["messages.batchModify"] += 1
+        return 200, backend.batch_modify(json.loads(body or b"{}"))
+    if route.startswith("messages/") and method == "GET":
+        backend.calls["messages.get"] += 1
+        mid = route.split("/", 1)[1]
+        if mid not in backend.messages:
+            raise StubError(404, "Not Found")
+        return 200, backend.get(mid, qs.get("metadataHeaders"))
+    if route == "labels" and method == "GET":
+        backend.calls["labels.list"] += 1
+        return 200, {"labels": list(backend.labels)}
+    if route == "labels" and method == "POST":
+        backend.calls["labels.create"] += 1
+        label = {"id": f"Label_{len(backend.labels) + 1}", "name": json.loads(body)["name"]}
+        backend.labels.append(label)
+        return 200, label
+    if route == "profile":
+        backend.calls["getProfile"] += 1
+        return 200, {"historyId": str(backend.history_id)}
+    if route == "history":
+        backend.calls["history.list"] += 1
+        if int(one("startHistoryId", 0)) < backend.history_floor:
+            raise StubError(404, "Not Found")
+        return 200, backend.list_history(one("startHistoryId"), one("pageToken"))
+    raise StubError(404, route)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body in one segment; otherwise delayed ACKs add ~40 ms per keep-alive request
+    disable_nagle_algorithm = True
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self) -> bytes:
+        length = int(self.headers.get("Content-Length") or 0)
+        return self.rfile.read(length) if length else b""
+
+    def _send(self, status: int, payload: bytes, content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def _handle(self, method: str) -> None:
+        stub = self.server.stub
+        body = self._body()
+        time.sleep(stub.latency)
+        if self.path.startswith("/batch"):
+            self._batch(body)
+            return
+        status, payload = stub.call(method, self.path, body)
+        self._send(status, json.dumps(payload).encode("utf-8"))
+
+    def _batch(self, body: bytes) -> None:
+        # multipart/mixed in, multipart/mixed out, the way googleapiclient's BatchHttpRequest speaks it
+        stub = self.server.stub
+        message = BytesParser(policy=HTTP).parsebytes(b"Content-Type: " + self.headers["Content-Type"].encode() + b"\r\n\r\n" + body)
+        boundary = uuid.uuid4().hex
+        out = []
+        for part in message.iter_parts():
+            text = part.get_payload(decode=True).decode("utf-8").replace("\r\n", "\n")
+            request_line, _, rest = text.partition("\n")
+            method, target, _ = request_line.strip().split(" ", 2)
+            sub_body = rest.split("\n\n", 1)[1].encode("utf-8") if "\n\n" in rest else b""
+            status, payload = stub.call(method, target, sub_body)
+            content_id = part["Content-ID"].replace("<", "<response-", 1)
+            out.append(
+                f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: {content_id}\r\n\r\n"
+                f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n\r\n{json.dumps(payload)}\r\n"
+            )
+        out.append(f"--{boundary}--\r\n")
+        self._send(200, "".join(out).encode("utf-8"), f"multipart/mixed; boundary={boundary}")
+
+    def do_GET(self):  # noqa: N802
+        self._handle("GET")
+
+    def do_POST(self):  # noqa: N802
+        self._handle("POST")
+
+
+class StubGmailServer:
+    # Local HTTP server speaking the Gmail REST endpoints (and batch) over a FakeGmail backend
+    def __init__(self, backend: FakeGmail, *, latency: float = 0.0, item_latency: float = 0.0):
+        self.backend = backend
+        # Per HTTP request (a round trip) and per message handled (server-side work)
+        self.latency = latency
+        self.item_latency = item_latency
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+        self._server.daemon_threads = True
+        self._server.stub = self
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+
+    @property
+    def root_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def call(self, method: str, target: str, body: bytes = b"") -> tuple[int, dict]:
+        time.sleep(self.item_latency)
+        try:
+            with self._lock:
+                return dispatch(self.backend, method, target, body)
+        except StubError as e:
+            return e.status, {"error": {"code": e.status, "message": str(e)}}
+
+    def __enter__(self) -> "StubGmailServer":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def discovery_for(root_url: str) -> dict:
+    # The trimmed discovery document pointed at the stub, for the googleapiclient path
+    from googleapiclient.discovery_cache import get_static_doc
+
+    doc = trim_discovery(json.loads(get_static_doc("gmail", "v1")))
+    doc["rootUrl"] = root_url
+    doc["baseUrl"] = root_url
+    return doc
@@ -0,0 +1,122 @@
+from __future__ import annotations
+
+import contextlib
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Sequence
+
+try:
+    from .util import resolve_config_path
+except Exception:  # pragma: no cover - fallback when run as script
+    from util import resolve_config_path  # type: ignore
+
+
+ACCOUNTS_FILENAME = "accounts.json"
+# Accounts are network-bound, so this caps memory rather than CPU
+DEFAULT_PROCESSES = 8
+# Same value as gmail_trash.EXIT_UNKNOWN_ERROR; imported lazily there, so repeated here
+_EXIT_UNKNOWN_ERROR = 4
+
+
+class AccountsError(ValueError):
+    pass
+
+
+def accounts_path(path: Optional[str] = None) -> str:
+    return path or resolve_config_path(ACCOUNTS_FILENAME)
+
+
+def load_accounts(path: str) -> dict:
+    # {"accounts": {"work": {"token_path": ..., "credentials_path": ...}, "home": "home/token.json"}}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except OSError as e:
+        raise AccountsError(f"無法讀取帳號設定檔：{e}") from None
+    except ValueError as e:
+        raise AccountsError(f"帳號設定檔 JSON 解析失敗：{e}") from None
+    raw = data.get("accounts") if isinstance(data, dict) else None
+    if not isinstance(raw, dict) or not raw:
+        raise AccountsError("帳號設定檔需包含非空的 accounts 物件")
+    # Relative paths are relative to the config file, not to wherever the command runs
+    base = os.path.dirname(os.path.abspath(path))
+    accounts = {}
+    # Label cache, journals, checkpoints and indexes all live next to the token
+    owners: dict = {}
+    for name, entry in raw.items():
+        if isinstance(entry, str):
+            entry = {"token_path": entry}
+        if not isinstance(entry, dict) or not entry.get("token_path"):
+            raise AccountsError(f"帳號 {name} 缺少 token_path")
+        accounts[name] = {
+            key: os.path.join(base, os.path.expanduser(entry[key]))
+            for key in ("token_path", "credentials_path")
+            if entry.get(key)
+        }
+        config_dir = os.path.dirname(os.path.normpath(accounts[name]["token_path"]))
+        if config_dir in owners:
+            raise AccountsError(f"帳號 {owners[config_dir]} 與 {name} 的 token 位於同一目錄 {config_dir}；每個帳號的狀態存放在 token 所在目錄，請分開放置")
+        owners[config_dir] = name
+    return accounts
+
+
+def select_accounts(accounts: dict, names: Optional[Sequence[str]]) -> dict:
+    if names is None:
+        return accounts
+    unknown = [n for n in names if n not in accounts]
+    if unknown:
+        raise AccountsError(f"未知帳號：{', '.join(unknown)}（可用：{', '.join(accounts)}）")
+    return {n: accounts[n] for n in dict.fromkeys(names)}
+
+
+def run_account(name: str, account: dict, argv: Sequence[str]) -> dict:
+    # Runs in a worker process: its own service, quota limiter and label registry
+    try:
+        from .gmail_trash import main
+    except Exception:  # pragma: no cover - fallback when run as script
+        from gmail_trash import main  # type: ignore
+
+    args = [*argv, "--token-path", account["token_path"]]
+    if account.get("credentials_path"):
+        args += ["--credentials-path", account["credentials_path"]]
+    out, err = io.StringIO(), io.StringIO()
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        try:
+            code = main(args)
+        except SystemExit as e:
+            code = e.code if isinstance(e.code, int) else _EXIT_UNKNOWN_ERROR
+        except Exception as e:
+            err.write(f"未預期錯誤：{e}\n")
+            code = _EXIT_UNKNOWN_ERROR
+    return {"name": name, "exit": code, "out": out.getvalue(), "err": err.getvalue(), "elapsed": time.perf_counter() - started}
+
+
+def run_accounts(accounts: dict, argv: Sequence[str], *, processes: Optional[int] = None, mp_context=None) -> List[dict]:
+    # One process per account at most; accounts finish independently and results keep config order
+    workers = max(1, min(len(accounts), processes or DEFAULT_PROCESSES))
+    with ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as pool:
+        futures = {name: pool.submit(run_account, name, account, list(argv)) for name, account in accounts.items()}
+        results = []
+        for name, future in futures.items():
+            try:
+                results.append(future.result())
+            except Exception as e:
+                # A worker that dies breaks the pool; what it leaves unfinished is reported, the rest still is
+                results.append({"name": name, "exit": _EXIT_UNKNOWN_ERROR, "out": "", "err": f"未預期錯誤：{e!r}\n", "elapsed": 0.0})
+    return results
+
+
+def format_results(results: Sequence[dict], elapsed: float) -> str:
+    lines = []
+    for r in results:
+        status = "成功" if r["exit"] == 0 else f"失敗（結束碼 {r['exit']}）"
+        lines.append(f"帳號 {r['name']}：{status}，{r['elapsed']:.1f}s")
+        for text in (r["out"], r["err"]):
+            lines.extend(f"  {line}" for line in text.splitlines())
+    failed = sum(1 for r in results if r["exit"] != 0)
+    lines.append(f"合計：{len(results)} 個帳號，成功 {len(results) - failed}、失敗 {failed}，總耗時 {elapsed:.1f}s")
+    return "\n".join(lines)
@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import os
+import signal
+import time
+from typing import Callable, Optional
+
+try:
+    from .gmail_ops import estimate_message_ids, get_messages_metadata
+    from .query import QuerySyntaxError
+    from .senders import SenderStats
+    from .util import resolve_config_path
+except Exception:  # pragma: no cover - fallback when run as script
+    from gmail_ops import estimate_message_ids, get_messages_metadata  # type: ignore
+    from query import QuerySyntaxError  # type: ignore
+    from senders import SenderStats  # type: ignore
+    from util import resolve_config_path  # type: ignore
+
+
+PREVIEW_DIRNAME = "alfred"
+PREVIEW_FILENAME = "previews.json"
+INFLIGHT_FILENAME = "inflight.json"
+# Long enough to cover typing and backspacing over a query, short enough to notice new mail
+PREVIEW_TTL = 60.0
+# Alfred accepts 0.1 to 5.0 seconds
+RERUN_SECONDS = 0.3
+# One list page and one metadata batch: the counts and senders come from the newest matches
+PREVIEW_PAGE = 100
+TOP_SENDERS = 5
+SAMPLES = 3
+MAX_ENTRIES = 200
+
+
+def preview_state(token_path: Optional[str] = None) -> tuple["PreviewCache", "Inflight"]:
+    base = resolve_config_path(PREVIEW_DIRNAME, token_path)
+    return PreviewCache(os.path.join(base, PREVIEW_FILENAME)), Inflight(os.path.join(base, INFLIGHT_FILENAME))
+
+
+def normalize(query: str) -> str:
+    return " ".join(query.split())
+
+
+def _write_json(path: str, data) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+    os.replace(tmp, path)
+
+
+def _read_json(path: str):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class PreviewCache:
+    # query -> preview result, one small JSON file shared by the Script Filter and its workers
+    def __init__(self, path: str, ttl: float = PREVIEW_TTL, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.ttl = ttl
+        self._clock = clock
+
+    def _entries(self) -> dict:
+        data = _read_json(self.path)
+        return data if isinstance(data, dict) else {}
+
+    def get(self, query: str) -> Optional[dict]:
+        entry = self._entries().get(query)
+        if entry is None or self._clock() - entry["at"] >= self.ttl:
+            return None
+        return entry["result"]
+
+    def nearest(self, query: str) -> Optional[tuple[str, dict]]:
+        # Any age will do: it is only shown while the real answer is on its way.
+        # The longest typed-so-far prefix wins; after a backspace, the shortest extension
+        entries = {k: v for k, v in self._entries().items() if "error" not in v["result"]}
+        prefixes = [k for k in entries if query.startswith(k) and k != query]
+        if prefixes:
+            key = max(prefixes, key=len)
+        else:
+            longer = [k for k in entries if k.startswith(query) and k != query]
+            if not longer:
+                return None
+            key = min(longer, key=len)
+        return key, entries[key]["result"]
+
+    def put(self, query: str, result: dict) -> None:
+        entries = self._entries()
+        entries[query] = {"at": self._clock(), "result": result}
+        if len(entries) > MAX_ENTRIES:
+            newest = sorted(entries.items(), key=lambda kv: kv[1]["at"], reverse=True)[:MAX_ENTRIES]
+            entries = dict(newest)
+        _write_json(self.path, entries)
+
+
+class Inflight:
+    # The one lookup worth finishing: the query last typed and the worker computing it
+    def __init__(self, path: str):
+        self.path = path
+
+    def read(self) -> Optional[dict]:
+        data = _read_json(self.path)
+        return data if isinstance(data, dict) and "query" in data else None
+
+    def start(self, query: str, pid: int) -> None:
+        _write_json(self.path, {"query": query, "pid": pid})
+
+    def current(self, query: str) -> bool:
+        # By query, not pid: a worker forwarded to the daemon runs under another pid
+        marker = self.read()
+        return marker is not None and marker["query"] == query
+
+    def finish(self, query: str) -> None:
+        if self.current(query):
+            with contextlib.suppress(OSError):
+                os.remove(self.path)
+
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def summarize(count: int, estimated: bool, senders: SenderStats, metas) -> dict:
+    return {
+        "count": count,
+        "estimated": estimated,
+        "senders": senders.pairs(),
+        "samples": [[rec.subject, rec.sender or ""] for rec in metas[:SAMPLES]],
+    }
+
+
+def api_preview(
+    service,
+    user_id: str,
+    query: str,
+    *,
+    still_current: Callable[[], bool] = lambda: True,
+    workers: int = 1,
+    service_factory: Callable[[], object] | None = None,
+    cache=None,
+) -> Optional[dict]:
+    count, ids = estimate_message_ids(service, user_id, query, sample=PREVIEW_PAGE)
+    if not still_current():
+        # Superseded while listing; skip the metadata batch
+        return None
+    metas = get_messages_metadata(service, user_id, ids, workers=workers, service_factory=service_factory, cache=cache, compact=True)
+    # A short first page is the whole result, so its size is exact
+    estimated = len(ids) >= PREVIEW_PAGE
+    return summarize(count if estimated else len(ids), estimated, SenderStats(top=TOP_SENDERS).consume(metas), metas)
+
+
+def local_preview(index, query: str) -> dict:
+    # The index counts every match, not just the first page
+    senders = SenderStats(top=TOP_SENDERS)
+    for raw, n in index.sender_counts(query):
+        senders.add(raw, n)
+    return summarize(index.count(query), False, senders, index.search(query, SAMPLES))
+
+
+def refresh(service, user_id: str, query: str, previews: PreviewCache, inflight: Inflight, **kwargs) -> Optional[dict]:
+    # Worker side of the Script Filter: compute, publish, step aside
+    try:
+        result = api_preview(service, user_id, query, still_current=lambda: inflight.current(query), **kwargs)
+        if result is not None:
+            previews.put(query, result)
+        return result
+    finally:
+        inflight.finish(query)
+
+
+def record_failure(query: str, message: str, previews: PreviewCache, inflight: Inflight) -> None:
+    # Cached like a result, so Alfred's reruns show the error instead of respawning a worker every time
+    previews.put(query, {"error": message.strip().splitlines()[-1] if message.strip() else "未預期錯誤"})
+    inflight.finish(query)
+
+
+def render(query: str, result: Optional[dict], *, pending: bool = False, basis: Optional[str] = None) -> dict:
+    if result is None:
+        items = [{"title": "查詢中…", "subtitle": query, "valid": False}]
+    elif "error" in result:
+        items = [{"title": "查詢失敗", "subtitle": result["error"], "valid": False}]
+    else:
+        count = result["count"]
+        title = f"命中約 {count} 封" if result["estimated"] else f"命中 {count} 封"
+        if basis is not None:
+            subtitle = f"更新中…（暫列「{basis}」的結果）"
+        elif pending:
+            subtitle = "更新中…"
+        else:
+            subtitle = f"Enter：將符合「{query}」的郵件搬移至垃圾桶"
+        items = [{"title": title, "subtitle": subtitle, "arg": query, "valid": bool(count) and not pending}]
+        scope = f"最新 {PREVIEW_PAGE} 封中" if result["estimated"] else "命中郵件中"
+        for sender, n in result["senders"]:
+            items.append(
+                {
+                    "title": sender,
+                    "subtitle": f"{scope} {n} 封 · Tab 加上 from: 篩選",
+                    "autocomplete": f"{query} from:{sender}",
+                    "valid": False,
+                }
+            )
+        for subject, sender in result["samples"]:
+            items.append({"title": subject or "（無主旨）", "subtitle": sender, "valid": False})
+    out: dict = {"skipknowledge": True, "items": items}
+    if pending:
+        # Alfred runs the script again after this delay, picking up the worker's result
+        out["rerun"] = RERUN_SECONDS
+    return out
+
+
+def script_filter(query: str, previews: PreviewCache, inflight: Inflight, spawn: Callable[[], int], *, local=None) -> dict:
+    # Answers every keystroke from files alone; anything slower is left to a background worker
+    query = normalize(query)
+    if not query:
+        return {"items": [{"title": "輸入 Gmail 查詢", "subtitle": "例如 category:promotions older_than:6m", "valid": False}]}
+    hit = previews.get(query)
+    if hit is not None:
+        return render(query, hit)
+    if local is not None:
+        try:
+            result = local_preview(local, query)
+        except QuerySyntaxError:
+            # Half-typed or beyond the index; Gmail gets to judge it instead
+            pass
+        else:
+            previews.put(query, result)
+            return render(query, result)
+    marker = inflight.read()
+    if marker is None or marker["query"] != query or not _alive(marker["pid"]):
+        if marker is not None and marker["query"] != query and _alive(marker["pid"]):
+            # Superseded by the latest keystroke
+            with contextlib.suppress(OSError):
+                os.kill(marker["pid"], signal.SIGTERM)
+        # Claimed before the worker starts, so its own currency check never sees the old query
+        inflight.start(query, os.getpid())
+        inflight.start(query, spawn())
+    near = previews.nearest(query)
+    if near is None:
+        return render(query, None, pending=True)
+    return render(query, near[1], pending=True, basis=near[0])
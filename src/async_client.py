@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import asyncio
+import random
+import threading
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+try:
+    from .gmail_ops import BATCH_SIZE, ID_PAGE_FIELDS, METADATA_HEADERS
+    from .ratelimit import QuotaLimiter, method_cost
+    from .util import is_retryable, retry_after_seconds
+except Exception:  # pragma: no cover - fallback when run as script
+    from gmail_ops import BATCH_SIZE, ID_PAGE_FIELDS, METADATA_HEADERS  # type: ignore
+    from ratelimit import QuotaLimiter, method_cost  # type: ignore
+    from util import is_retryable, retry_after_seconds  # type: ignore
+
+
+GMAIL_ROOT_URL = "https://gmail.googleapis.com/"
+DEFAULT_CONCURRENCY = 10
+MAX_ATTEMPTS = 5
+
+
+def _import_httpx():
+    try:
+        import httpx
+    except ImportError as e:  # pragma: no cover - depends on the environment
+        raise ImportError("--async-http 需要 httpx：pip install 'httpx[http2]'") from e
+    return httpx
+
+
+def _http2_available() -> bool:
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def _http_error(status: int, headers: dict, content: bytes, uri: str):
+    # Same exception type as googleapiclient, so gmail_ops retry and 404 handling apply unchanged
+    import httplib2
+    from googleapiclient.errors import HttpError
+
+    resp = httplib2.Response({"status": status, **{k.lower(): v for k, v in headers.items()}})
+    return HttpError(resp, content, uri=uri)
+
+
+class AsyncGmailClient:
+    # One pooled (HTTP/2 when h2 is installed) connection shared by all coroutines;
+    # a semaphore caps requests in flight
+    def __init__(
+        self,
+        creds=None,
+        *,
+        root_url: str = GMAIL_ROOT_URL,
+        concurrency: int = DEFAULT_CONCURRENCY,
+        http2: bool = True,
+        limiter: Optional[QuotaLimiter] = None,
+        timeout: float = 30.0,
+        transport=None,
+    ):
+        httpx = _import_httpx()
+        self.creds = creds
+        self.concurrency = concurrency
+        self.limiter = limiter
+        self._client = httpx.AsyncClient(
+            base_url=root_url,
+            http2=http2 and _http2_available(),
+            limits=httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency),
+            timeout=timeout,
+            transport=transport,
+        )
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._refresh_lock: Optional[asyncio.Lock] = None
+
+    async def __aenter__(self) -> "AsyncGmailClient":
+        return self
+
+    async def __aexit__(self, *exc) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        await self._client.aclose()
+
+    async def _auth_headers(self) -> dict:
+        if self.creds is None:
+            return {}
+        if self._refresh_lock is None:
+            self._refresh_lock = asyncio.Lock()
+        async with self._refresh_lock:
+            if not self.creds.valid:
+                from google.auth.transport.requests import Request
+
+                await asyncio.to_thread(self.creds.refresh, Request())
+        return {"Authorization": f"Bearer {self.creds.token}"}
+
+    async def request(
+        self,
+        http_method: str,
+        path: str,
+        *,
+        params: Optional[dict] = None,
+        body: Optional[dict] = None,
+        api_method: Optional[str] = None,
+        attempts: int = MAX_ATTEMPTS,
+    ) -> dict:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.concurrency)
+        params = {k: v for k, v in (params or {}).items() if v is not None}
+        for attempt in range(1, attempts + 1):
+            if self.limiter is not None and api_method:
+                await asyncio.to_thread(self.limiter.acquire, method_cost(api_method))
+            async with self._semaphore:
+                resp = await self._client.request(http_method, path, params=params, json=body, headers=await self._auth_headers())
+            if resp.status_code < 400:
+                return resp.json() if resp.content else {}
+            error = _http_error(resp.status_code, dict(resp.headers), resp.content, str(resp.url))
+            if attempt == attempts or not is_retryable(error):
+                raise error
+            if self.limiter is not None and resp.status_code == 429:
+                self.limiter.on_throttle(retry_after_seconds(error))
+            # Same shape as the tenacity policy used by gmail_ops: exponential, at least 1s
+            delay = retry_after_seconds(error)
+            if delay is None:
+                delay = min(2 ** (attempt - 1), 30) * (1 + random.random() / 10)
+            await asyncio.sleep(delay)
+        raise AssertionError("unreachable")  # pragma: no cover
+
+    async def list_messages(
+        self, user_id: str, query: str, *, page_token: Optional[str] = None, max_results: int = 500, fields: Optional[str] = None
+    ) -> dict:
+        params = {"q": query, "pageToken": page_token, "maxResults": max_results, "fields": fields}
+        return await self.request("GET", f"gmail/v1/users/{user_id}/messages", params=params, api_method="messages.list")
+
+    async def search_message_ids(self, user_id: str, query: str, limit: Optional[int] = None, page_size: int = 500) -> List[str]:
+        # Pages depend on the previous token, so listing stays sequential
+        ids: List[str] = []
+        page_token = None
+        while True:
+            res = await self.list_messages(user_id, query, page_token=page_token, max_results=page_size, fields=ID_PAGE_FIELDS)
+            ids.extend(m["id"] for m in res.get("messages", []))
+            if limit is not None and len(ids) >= limit:
+                return ids[:limit]
+            page_token = res.get("nextPageToken")
+            if not page_token:
+                return ids
+
+    async def get_message(self, user_id: str, message_id: str, *, format: str = "metadata", headers: Sequence[str] = METADATA_HEADERS) -> dict:  # noqa: A002
+        params: Dict[str, Any] = {"format": format}
+        if format == "metadata":
+            params["metadataHeaders"] = list(headers)
+        return await self.request("GET", f"gmail/v1/users/{user_id}/messages/{message_id}", params=params, api_method="messages.get")
+
+    async def get_messages(self, user_id: str, ids: Sequence[str], **kwargs) -> List[dict]:
+        return list(await asyncio.gather(*(self.get_message(user_id, mid, **kwargs) for mid in ids)))
+
+    async def batch_modify(
+        self,
+        user_id: str,
+        ids: Sequence[str],
+        add_label_ids: Sequence[str] = ("TRASH",),
+        remove_label_ids: Sequence[str] = (),
+    ) -> int:
+        async def _chunk(chunk):
+            body = {"ids": list(chunk), "addLabelIds": list(add_label_ids), "removeLabelIds": list(remove_label_ids)}
+            await self.request("POST", f"gmail/v1/users/{user_id}/messages/batchModify", body=body, api_method="messages.batchModify")
+
+        chunks = [ids[i : i + BATCH_SIZE] for i in range(0, len(ids), BATCH_SIZE)]
+        await asyncio.gather(*(_chunk(c) for c in chunks))
+        return len(ids)
+
+
+# --- sync facade: the googleapiclient surface gmail_ops calls, backed by the async client ---
+
+
+class _Request:
+    def __init__(self, facade: "SyncGmailService", http_method: str, path: str, params: Optional[dict] = None, body: Optional[dict] = None):
+        self._facade = facade
+        self.args = (http_method, path)
+        self.kwargs = {"params": params, "body": body}
+
+    def coroutine(self):
+        # gmail_ops already retries and paces every call, so the client must not repeat either
+        return self._facade.client.request(*self.args, **self.kwargs, attempts=1)
+
+    def execute(self):
+        return self._facade.run(self.coroutine())
+
+
+class _Batch:
+    def __init__(self, facade: "SyncGmailService", callback: Optional[Callable]):
+        self._facade = facade
+        self._callback = callback
+        self._requests: list = []
+
+    def add(self, request: _Request, callback=None, request_id=None):
+        self._requests.append((request_id, request, callback))
+
+    def execute(self):
+        # Sub-requests go out concurrently over the pool instead of as one multipart call
+        async def _all():
+            return await asyncio.gather(*(r.coroutine() for _, r, _ in self._requests), return_exceptions=True)
+
+        for (request_id, _, callback), result in zip(self._requests, self._facade.run(_all())):
+            cb = callback or self._callback
+            if isinstance(result, Exception):
+                cb(request_id, None, result)
+            else:
+                cb(request_id, result, None)
+
+
+class _Messages:
+    def __init__(self, facade: "SyncGmailService"):
+        self._f = facade
+
+    def list(self, userId=None, q=None, pageToken=None, maxResults=None, fields=None):  # noqa: N802
+        params = {"q": q, "pageToken": pageToken, "maxResults": maxResults, "fields": fields}
+        return _Request(self._f, "GET", f"gmail/v1/users/{userId}/messages", params)
+
+    def get(self, userId=None, id=None, format=None, metadataHeaders=None, fields=None):  # noqa: N802, A002
+        params = {"format": format, "metadataHeaders": list(metadataHeaders) if metadataHeaders else None, "fields": fields}
+        return _Request(self._f, "GET", f"gmail/v1/users/{userId}/messages/{id}", params)
+
+    def batchModify(self, userId=None, body=None):  # noqa: N802
+        return _Request(self._f, "POST", f"gmail/v1/users/{userId}/messages/batchModify", body=body)
+
+
+class _Labels:
+    def __init__(self, facade: "SyncGmailService"):
+        self._f = facade
+
+    def list(self, userId=None):  # noqa: N802
+        return _Request(self._f, "GET", f"gmail/v1/users/{userId}/labels")
+
+    def get(self, userId=None, id=None):  # noqa: N802, A002
+        return _Request(self._f, "GET", f"gmail/v1/users/{userId}/labels/{id}")
+
+    def create(self, userId=None, body=None):  # noqa: N802
+        return _Request(self._f, "POST", f"gmail/v1/users/{userId}/labels", body=body)
+
+
+class _History:
+    def __init__(self, facade: "SyncGmailService"):
+        self._f = facade
+
+    def list(self, userId=None, startHistoryId=None, pageToken=None, historyTypes=None):  # noqa: N802
+        params = {"startHistoryId": startHistoryId, "pageToken": pageToken, "historyTypes": historyTypes}
+        return _Request(self._f, "GET", f"gmail/v1/users/{userId}/history", params)
+
+
+class _Users:
+    def __init__(self, facade: "SyncGmailService"):
+        self._f = facade
+
+    def messages(self):
+        return _Messages(self._f)
+
+    def labels(self):
+        return _Labels(self._f)
+
+    def history(self):
+        return _History(self._f)
+
+    def getProfile(self, userId=None):  # noqa: N802
+        return _Request(self._f, "GET", f"gmail/v1/users/{userId}/profile")
+
+
+class SyncGmailService:
+    # Drop-in for the googleapiclient service object. The event loop runs on its own
+    # thread, so worker threads can share one facade (and one connection pool).
+    def __init__(self, client_factory: Callable[[], AsyncGmailClient]):
+        self._loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._loop.run_forever, name="gmail-async", daemon=True)
+        self._thread.start()
+        try:
+            # The client must be created inside the loop that will drive it
+            self.client: AsyncGmailClient = self.run(self._make(client_factory))
+        except BaseException:
+            self._stop_loop()
+            raise
+
+    @staticmethod
+    async def _make(factory: Callable[[], AsyncGmailClient]) -> AsyncGmailClient:
+        return factory()
+
+    def run(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
+
+    def users(self):
+        return _Users(self)
+
+    def new_batch_http_request(self, callback=None):
+        return _Batch(self, callback)
+
+    def close(self) -> None:
+        self.run(self.client.aclose())
+        self._stop_loop()
+
+    def _stop_loop(self) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
@@ -1,38 +1,103 @@
-import os
-from typing import Optional
+from __future__ import annotations
 
-from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from google.auth.transport.requests import Request
-from googleapiclient.discovery import build
+import json
+import os
+import threading
+from typing import TYPE_CHECKING, Optional
 
 try:
-    from .util import resolve_paths
+    from .util import resolve_config_path, resolve_paths
 except Exception:  # pragma: no cover - fallback when run as script
-    from util import resolve_paths  # type: ignore
+    from util import resolve_config_path, resolve_paths  # type: ignore
+
+if TYPE_CHECKING:  # pragma: no cover
+    from google.oauth2.credentials import Credentials
 
+# The Google client libraries are imported inside the functions below: they cost
+# ~250 ms on a cold start, which an Alfred keystroke or an empty query never needs.
 
 SCOPES = ["https://www.googleapis.com/auth/gmail.modify"]
+DISCOVERY_FILENAME = "gmail-v1-discovery.json"
+# Only the parts of the API gmail_ops calls; parsing the full document dominates build()
+DISCOVERY_RESOURCES = ("messages", "labels", "history")
+DISCOVERY_METHODS = ("getProfile",)
 
+_discovery_docs: dict = {}
+_discovery_lock = threading.Lock()
+
+
+def get_credentials(credentials_path: Optional[str] = None, token_path: Optional[str] = None, scopes: Optional[list[str]] = None) -> "Credentials":
+    from google.oauth2.credentials import Credentials
 
-def get_service(credentials_path: Optional[str] = None, token_path: Optional[str] = None, scopes: Optional[list[str]] = None):
     cred_path, tok_path = resolve_paths(credentials_path, token_path)
     use_scopes = scopes or SCOPES
 
     creds: Optional[Credentials] = None
     if os.path.exists(tok_path):
         creds = Credentials.from_authorized_user_file(tok_path, use_scopes)
-    if not creds or not creds.valid:
-        if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
-        else:
-            if not os.path.exists(cred_path):
-                raise FileNotFoundError(f"找不到憑證檔案：{cred_path}")
-            flow = InstalledAppFlow.from_client_secrets_file(cred_path, use_scopes)
-            creds = flow.run_local_server(port=0)
-        os.makedirs(os.path.dirname(tok_path), exist_ok=True)
-        with open(tok_path, "w", encoding="utf-8") as f:
-            f.write(creds.to_json())
-
-    service = build("gmail", "v1", credentials=creds)
-    return service
+    if creds and creds.valid:
+        # Still-valid token: no refresh round trip, no rewrite of token.json
+        return creds
+    if creds and creds.expired and creds.refresh_token:
+        from google.auth.transport.requests import Request
+
+        creds.refresh(Request())
+    else:
+        if not os.path.exists(cred_path):
+            raise FileNotFoundError(f"找不到憑證檔案：{cred_path}")
+        from google_auth_oauthlib.flow import InstalledAppFlow
+
+        flow = InstalledAppFlow.from_client_secrets_file(cred_path, use_scopes)
+        creds = flow.run_local_server(port=0)
+    os.makedirs(os.path.dirname(tok_path), exist_ok=True)
+    with open(tok_path, "w", encoding="utf-8") as f:
+        f.write(creds.to_json())
+    return creds
+
+
+def trim_discovery(doc: dict) -> dict:
+    users = doc["resources"]["users"]
+    users["resources"] = {k: v for k, v in users.get("resources", {}).items() if k in DISCOVERY_RESOURCES}
+    users["methods"] = {k: v for k, v in users.get("methods", {}).items() if k in DISCOVERY_METHODS}
+    return doc
+
+
+def load_discovery(path: Optional[str] = None) -> dict:
+    path = path or resolve_config_path(DISCOVERY_FILENAME)
+    with _discovery_lock:
+        if path in _discovery_docs:
+            return _discovery_docs[path]
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                doc = json.load(f)
+        except (OSError, ValueError):
+            # Seed from the copy bundled with googleapiclient; no network fetch
+            from googleapiclient.discovery_cache import get_static_doc
+
+            doc = trim_discovery(json.loads(get_static_doc("gmail", "v1")))
+            try:
+                os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+                tmp = f"{path}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(doc, f, separators=(",", ":"))
+                os.replace(tmp, path)
+            except OSError:
+                pass
+        _discovery_docs[path] = doc
+        return doc
+
+
+def build_service(creds: "Credentials", discovery_path: Optional[str] = None):
+    import httplib2
+    from google_auth_httplib2 import AuthorizedHttp
+    from googleapiclient.discovery import build_from_document
+
+    # Each service gets its own httplib2.Http; the underlying connection is not thread-safe
+    http = AuthorizedHttp(creds, http=httplib2.Http())
+    return build_from_document(load_discovery(discovery_path), http=http)
+
+
+def get_service(credentials_path: Optional[str] = None, token_path: Optional[str] = None, scopes: Optional[list[str]] = None):
+    creds = get_credentials(credentials_path, token_path, scopes)
+    _, tok_path = resolve_paths(credentials_path, token_path)
+    return build_service(creds, resolve_config_path(DISCOVERY_FILENAME, tok_path))
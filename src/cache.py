@@ -0,0 +1,139 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+import threading
+from typing import Iterable, Optional, Sequence
+
+try:
+    from .gmail_ops import METADATA_HEADERS, get_history_id, list_history_message_ids
+    from .util import http_status
+except Exception:  # pragma: no cover - fallback when run as script
+    from gmail_ops import METADATA_HEADERS, get_history_id, list_history_message_ids  # type: ignore
+    from util import http_status  # type: ignore
+
+
+CACHE_FILENAME = "metadata_cache.sqlite3"
+# Headers stored per message; requests for other headers bypass the cache
+CACHE_HEADERS = METADATA_HEADERS
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id TEXT PRIMARY KEY,
+    label_ids TEXT NOT NULL,
+    snippet TEXT NOT NULL,
+    from_header TEXT,
+    subject TEXT,
+    internal_date TEXT
+);
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+def _header(meta: dict, name: str) -> Optional[str]:
+    for h in meta.get("payload", {}).get("headers", []):
+        if h.get("name", "").lower() == name.lower():
+            return h.get("value")
+    return None
+
+
+class MetadataCache:
+    headers = CACHE_HEADERS
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.executescript(_SCHEMA)
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def covers(self, headers: Sequence[str] | None) -> bool:
+        wanted = {h.lower() for h in (headers or self.headers)}
+        return wanted <= {h.lower() for h in self.headers}
+
+    @property
+    def history_id(self) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM state WHERE key = 'history_id'").fetchone()
+        return row[0] if row else None
+
+    @history_id.setter
+    def history_id(self, value: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES ('history_id', ?)", (str(value),))
+
+    def get_many(self, ids: Iterable[str]) -> dict:
+        ids = list(ids)
+        found: dict = {}
+        # Stay well under SQLite's bound-parameter limit
+        for i in range(0, len(ids), 500):
+            chunk = ids[i : i + 500]
+            marks = ",".join("?" * len(chunk))
+            rows = self._conn.execute(
+                f"SELECT id, label_ids, snippet, from_header, subject, internal_date FROM messages WHERE id IN ({marks})",
+                chunk,
+            ).fetchall()
+            for mid, label_ids, snippet, from_header, subject, internal_date in rows:
+                headers = []
+                if from_header is not None:
+                    headers.append({"name": "From", "value": from_header})
+                if subject is not None:
+                    headers.append({"name": "Subject", "value": subject})
+                meta = {"id": mid, "labelIds": json.loads(label_ids), "snippet": snippet, "payload": {"headers": headers}}
+                if internal_date is not None:
+                    meta["internalDate"] = internal_date
+                found[mid] = meta
+        return found
+
+    def put_many(self, metas: Iterable[dict]) -> None:
+        rows = [
+            (
+                m["id"],
+                json.dumps(m.get("labelIds", [])),
+                m.get("snippet", ""),
+                _header(m, "From"),
+                _header(m, "Subject"),
+                m.get("internalDate"),
+            )
+            for m in metas
+            if m.get("id")
+        ]
+        with self._lock, self._conn:
+            self._conn.executemany("INSERT OR REPLACE INTO messages VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+    def invalidate(self, ids: Iterable[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM messages WHERE id = ?", [(mid,) for mid in ids])
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages")
+
+    def sync(self, service, user_id: str) -> int:
+        start = self.history_id
+        if start is None:
+            self._reset(service, user_id)
+            return 0
+        try:
+            changed, latest = list_history_message_ids(service, user_id, start)
+        except Exception as e:
+            # startHistoryId too old: Gmail only keeps about a week of history
+            if http_status(e) != 404:
+                raise
+            self._reset(service, user_id)
+            return 0
+        self.invalidate(changed)
+        self.history_id = latest
+        return len(changed)
+
+    def _reset(self, service, user_id: str) -> None:
+        # Baseline is taken before anything is cached, so later changes are always seen
+        history_id = get_history_id(service, user_id)
+        self.clear()
+        self.history_id = history_id
@@ -0,0 +1,271 @@
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+import threading
+import time
+from typing import Callable, Optional, TextIO
+
+try:
+    from .util import resolve_config_path, resolve_paths, setup_logger
+except Exception:  # pragma: no cover - fallback when run as script
+    from util import resolve_config_path, resolve_paths, setup_logger  # type: ignore
+
+# Kept to stdlib at import time: the client side runs on every Alfred keystroke
+
+SOCKET_FILENAME = "daemon.sock"
+DEFAULT_IDLE_TIMEOUT = 30 * 60
+
+
+def socket_path(token_path: Optional[str] = None) -> str:
+    return resolve_config_path(SOCKET_FILENAME, token_path)
+
+
+def forward(argv: list[str], path: str, out: Optional[TextIO] = None, err: Optional[TextIO] = None) -> Optional[int]:
+    # None means no daemon is listening and the caller should run locally
+    out = out or sys.stdout
+    err = err or sys.stderr
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return None
+    with sock, sock.makefile("rwb") as f:
+        f.write(json.dumps({"argv": argv}).encode("utf-8") + b"\n")
+        f.flush()
+        for line in f:
+            msg = json.loads(line)
+            if "out" in msg:
+                out.write(msg["out"])
+                out.flush()
+            elif "err" in msg:
+                err.write(msg["err"])
+                err.flush()
+            elif "exit" in msg:
+                return int(msg["exit"])
+    raise ConnectionError("連線在回傳結束碼前關閉")
+
+
+def is_running(path: str) -> bool:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+        return True
+    except OSError:
+        return False
+    finally:
+        sock.close()
+
+
+def stop(path: str) -> bool:
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+        return False
+    with sock:
+        sock.sendall(json.dumps({"cmd": "stop"}).encode("utf-8") + b"\n")
+        sock.recv(64)
+    return True
+
+
+class _Stream(io.TextIOBase):
+    # Relays each write to the client as it happens instead of buffering the whole run
+    def __init__(self, send: Callable[[dict], None], key: str):
+        self._send = send
+        self._key = key
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, s: str) -> int:
+        if s:
+            self._send({self._key: s})
+        return len(s)
+
+
+class WarmSession:
+    # Credentials, the authorised service (and its HTTP connection) and the metadata
+    # cache are built on first use and then kept for every later request
+    def __init__(
+        self,
+        credentials_path: Optional[str] = None,
+        token_path: Optional[str] = None,
+        *,
+        service=None,
+        service_factory: Optional[Callable[[], object]] = None,
+    ):
+        self.credentials_path, self.token_path = resolve_paths(credentials_path, token_path)
+        self._service = service
+        self._service_factory = service_factory
+        self._cache = None
+
+    def service(self):
+        if self._service is None:
+            try:
+                from .auth import DISCOVERY_FILENAME, build_service, get_credentials
+            except Exception:  # pragma: no cover - fallback when run as script
+                from auth import DISCOVERY_FILENAME, build_service, get_credentials  # type: ignore
+
+            creds = get_credentials(self.credentials_path, self.token_path, None)
+            discovery_path = resolve_config_path(DISCOVERY_FILENAME, self.token_path)
+            self._service = build_service(creds, discovery_path)
+            self._service_factory = lambda: build_service(creds, discovery_path)
+        return self._service
+
+    def cache(self):
+        if self._cache is None:
+            try:
+                from .cache import CACHE_FILENAME, MetadataCache
+            except Exception:  # pragma: no cover - fallback when run as script
+                from cache import CACHE_FILENAME, MetadataCache  # type: ignore
+
+            self._cache = MetadataCache(resolve_config_path(CACHE_FILENAME, self.token_path))
+        return self._cache
+
+    def mismatch(self, args) -> Optional[str]:
+        # The warm service is one account over one transport; a request for anything else
+        # must not quietly run as this session
+        cred_path, tok_path = resolve_paths(args.credentials_path, args.token_path)
+        if os.path.abspath(tok_path) != os.path.abspath(self.token_path):
+            return f"背景服務使用 {self.token_path} 認證，無法處理 --token-path {tok_path}"
+        if os.path.abspath(cred_path) != os.path.abspath(self.credentials_path):
+            return f"背景服務使用 {self.credentials_path} 認證，無法處理 --credentials-path {cred_path}"
+        if args.async_http:
+            return "背景服務不支援 --async-http"
+        return None
+
+    def run(self, argv: list[str]) -> int:
+        try:
+            from .gmail_trash import EXIT_AUTH_ERROR, EXIT_INPUT_ERROR, EXIT_UNKNOWN_ERROR, main, parse_args
+        except Exception:  # pragma: no cover - fallback when run as script
+            from gmail_trash import EXIT_AUTH_ERROR, EXIT_INPUT_ERROR, EXIT_UNKNOWN_ERROR, main, parse_args  # type: ignore
+
+        try:
+            problem = self.mismatch(parse_args(argv))
+        except SystemExit as e:
+            # argparse exits on --help and bad arguments; that must not stop the daemon
+            return e.code if isinstance(e.code, int) else EXIT_INPUT_ERROR
+        if problem is not None:
+            sys.stderr.write(f"參數錯誤：{problem}；請不加 --use-daemon 執行\n")
+            return EXIT_INPUT_ERROR
+        try:
+            service = self.service()
+        except Exception as e:
+            sys.stderr.write(f"認證失敗：{e}\n")
+            return EXIT_AUTH_ERROR
+        try:
+            cache = self.cache() if "--cache" in argv else None
+            return main(argv, service=service, service_factory=self._service_factory, cache=cache)
+        except SystemExit as e:
+            # argparse exits on --help and bad arguments; that must not stop the daemon
+            return e.code if isinstance(e.code, int) else EXIT_INPUT_ERROR
+        except Exception as e:
+            sys.stderr.write(f"未預期錯誤：{e}\n")
+            return EXIT_UNKNOWN_ERROR
+
+    def close(self) -> None:
+        if self._cache is not None:
+            self._cache.close()
+            self._cache = None
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        line = self.rfile.readline()
+        if not line:
+            return
+        self.server.last_request = time.monotonic()
+        request = json.loads(line)
+        if request.get("cmd") == "stop":
+            self.wfile.write(b'{"stopped": true}\n')
+            self.server.stopping = True
+            return
+        lock = threading.Lock()
+
+        def send(msg: dict) -> None:
+            with lock:
+                self.wfile.write(json.dumps(msg, ensure_ascii=False).encode("utf-8") + b"\n")
+                self.wfile.flush()
+
+        # Requests are handled one at a time, so swapping the process-wide streams is safe
+        with contextlib.redirect_stdout(_Stream(send, "out")), contextlib.redirect_stderr(_Stream(send, "err")):
+            code = self.server.session.run(list(request.get("argv") or []))
+        send({"exit": code})
+
+
+class DaemonServer(socketserver.UnixStreamServer):
+    # Not threaded on purpose: the warm service and the sqlite cache are single-threaded
+    def __init__(self, path: str, session: WarmSession):
+        self.session = session
+        self.stopping = False
+        self.last_request = time.monotonic()
+        super().__init__(path, _Handler)
+        os.chmod(path, 0o600)
+
+    def handle_error(self, request, client_address):
+        # A client that hung up mid-stream must not bring the daemon down
+        setup_logger().exception("背景服務處理請求失敗")
+
+
+def serve(path: str, session: WarmSession, *, idle_timeout: float = DEFAULT_IDLE_TIMEOUT, ready: Optional[threading.Event] = None) -> None:
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    if os.path.exists(path):
+        # Left behind by a daemon that did not exit cleanly
+        os.remove(path)
+    server = DaemonServer(path, session)
+    # Wake up periodically to notice the idle timeout
+    server.timeout = min(idle_timeout, 1.0)
+    if ready is not None:
+        ready.set()
+    try:
+        with server:
+            while not server.stopping and time.monotonic() - server.last_request < idle_timeout:
+                server.handle_request()
+    finally:
+        session.close()
+        with contextlib.suppress(OSError):
+            os.remove(path)
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Alfred Gmail Trash Mover 背景服務")
+    parser.add_argument("--idle-timeout", type=float, default=DEFAULT_IDLE_TIMEOUT, help="閒置多少秒後自動結束（預設 1800）")
+    parser.add_argument("--stop", action="store_true", help="停止執行中的背景服務")
+    parser.add_argument("--credentials-path", default=None)
+    parser.add_argument("--token-path", default=None)
+    args = parser.parse_args(argv)
+
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    session = WarmSession(args.credentials_path, args.token_path)
+    path = socket_path(session.token_path)
+    if args.stop:
+        if not stop(path):
+            sys.stderr.write("背景服務未執行\n")
+            return 1
+        return 0
+    if is_running(path):
+        sys.stderr.write(f"背景服務已在執行：{path}\n")
+        return 1
+    try:
+        # Authenticate up front so the first forwarded request is already warm
+        session.service()
+    except Exception as e:
+        sys.stderr.write(f"認證失敗：{e}\n")
+        return 2
+    serve(path, session, idle_timeout=args.idle_timeout)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
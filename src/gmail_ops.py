@@ -1,59 +1,388 @@
 from __future__ import annotations
 
-from typing import List, Sequence
-
-from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception
+import functools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Sequence
 
 try:
-    from .util import is_retryable
+    from .labels import LabelRegistry
+    from .matcher import DEFAULT_MATCHER, KeywordMatcher
+    from .meta_store import MetaStore
+    from .ratelimit import QuotaLimiter, method_cost
+    from .senders import SenderStats
+    from .stats import RunStats
+    from .util import http_status, is_retryable, retry_after_seconds
 except Exception:  # pragma: no cover - fallback when run as script
-    from util import is_retryable  # type: ignore
+    from labels import LabelRegistry  # type: ignore
+    from matcher import DEFAULT_MATCHER, KeywordMatcher  # type: ignore
+    from meta_store import MetaStore  # type: ignore
+    from ratelimit import QuotaLimiter, method_cost  # type: ignore
+    from senders import SenderStats  # type: ignore
+    from stats import RunStats  # type: ignore
+    from util import http_status, is_retryable, retry_after_seconds  # type: ignore
 
 
 BATCH_SIZE = 1000
+# Gmail batch endpoint accepts up to 100 sub-requests per HTTP call
+BATCH_GET_SIZE = 100
+# One header set for every consumer, so each message is fetched (and cached) once
+METADATA_HEADERS = ("From", "Subject")
+
+# Partial responses: drop threadId and resultSizeEstimate from every ID page
+ID_PAGE_FIELDS = "messages/id,nextPageToken"
+
+# Shared by every call (and worker thread) in this module; None means unpaced
+_limiter: QuotaLimiter | None = None
+# None means no instrumentation; every hook below is a single None check then
+_stats: RunStats | None = None
+# Label name -> ID cache; None means ensure_label lists labels on every call
+_labels: LabelRegistry | None = None
+
+
+def _on_retry(method: str | None, retry_state) -> None:
+    stats = _stats
+    if stats is not None:
+        if method is None:
+            # Generic wrappers take the API method as their `method` argument
+            method = retry_state.kwargs.get("method") or retry_state.args[1]
+        sleep = retry_state.next_action.sleep if retry_state.next_action else 0.0
+        stats.record_retry(method, sleep)
+
+
+def _retry_api(method: str | None = None) -> Callable[[Callable], Callable]:
+    # method keys the retry stats; None reads it from the wrapped call's arguments
+    def decorate(fn: Callable) -> Callable:
+        # tenacity is only imported on the first API call, keeping it off the startup path
+        retrying = None
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            nonlocal retrying
+            if retrying is None:
+                from tenacity import retry, retry_if_exception, stop_after_attempt, wait_exponential
+
+                retrying = retry(
+                    stop=stop_after_attempt(5),
+                    wait=wait_exponential(multiplier=1, min=1),
+                    retry=retry_if_exception(is_retryable),
+                    before_sleep=functools.partial(_on_retry, method),
+                    reraise=True,
+                )(fn)
+            return retrying(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def set_quota_budget(units_per_sec: float | None) -> QuotaLimiter | None:
+    global _limiter
+    _limiter = QuotaLimiter(units_per_sec) if units_per_sec else None
+    return _limiter
+
+
+def set_stats(stats: RunStats | None) -> RunStats | None:
+    global _stats
+    _stats = stats
+    return stats
+
+
+def set_label_registry(registry: LabelRegistry | None) -> LabelRegistry | None:
+    global _labels
+    _labels = registry
+    return registry
+
+
+def _observe_error(error: Exception) -> None:
+    if _limiter is not None and http_status(error) == 429:
+        _limiter.on_throttle(retry_after_seconds(error))
+
+
+def _execute(request, method: str, count: int = 1):
+    limiter = _limiter
+    stats = _stats
+    if limiter is not None:
+        limiter.acquire(method_cost(method) * count)
+    # Latency excludes time spent waiting on the limiter
+    started = time.perf_counter() if stats is not None else 0.0
+    try:
+        res = request.execute()
+    except Exception as e:
+        _observe_error(e)
+        if stats is not None:
+            stats.record_call(method, count, time.perf_counter() - started, http_status(e))
+        raise
+    if stats is not None:
+        stats.record_call(method, count, time.perf_counter() - started)
+    if limiter is not None:
+        limiter.on_success()
+    return res
 
 
-def search_message_ids(service, user_id: str, query: str, limit: int | None = None) -> List[str]:
-    ids: List[str] = []
+@_retry_api()
+def _execute_with_retry(request, method: str):
+    return _execute(request, method)
+
+
+def get_history_id(service, user_id: str) -> str:
+    return str(_execute_with_retry(service.users().getProfile(userId=user_id), "getProfile")["historyId"])
+
+
+def iter_message_id_pages(
+    service,
+    user_id: str,
+    query: str,
+    limit: int | None = None,
+    page_size: int = 500,
+) -> Iterator[List[str]]:
+    seen = 0
     page_token = None
     while True:
-        max_results = 500
         req = (
             service.users()
             .messages()
-            .list(userId=user_id, q=query, pageToken=page_token, maxResults=max_results)
+            .list(userId=user_id, q=query, pageToken=page_token, maxResults=page_size, fields=ID_PAGE_FIELDS)
         )
-        res = req.execute()
-        for m in res.get("messages", []):
-            ids.append(m["id"])  # type: ignore[index]
-            if limit is not None and len(ids) >= limit:
-                return ids
+        res = _execute_with_retry(req, "messages.list")
+        page = [m["id"] for m in res.get("messages", [])]  # type: ignore[index]
+        if limit is not None:
+            page = page[: limit - seen]
+        if page:
+            yield page
+        seen += len(page)
+        if limit is not None and seen >= limit:
+            return
         page_token = res.get("nextPageToken")
         if not page_token:
-            break
+            return
+
+
+def search_message_ids(service, user_id: str, query: str, limit: int | None = None) -> List[str]:
+    ids: List[str] = []
+    for page in iter_message_id_pages(service, user_id, query, limit):
+        ids.extend(page)
     return ids
 
 
-@retry(stop=stop_after_attempt(5), wait=wait_exponential(multiplier=1, min=1), retry=retry_if_exception(is_retryable))
-def _batch_modify(service, user_id: str, batch_ids: Sequence[str]):
-    body = {"addLabelIds": ["TRASH"], "ids": list(batch_ids)}
-    return service.users().messages().batchModify(userId=user_id, body=body).execute()
+def estimate_message_ids(service, user_id: str, query: str, sample: int = 3) -> tuple[int, List[str]]:
+    # One list call: Gmail's resultSizeEstimate plus the first few IDs for the samples
+    req = service.users().messages().list(
+        userId=user_id, q=query, maxResults=max(sample, 1), fields="messages/id,resultSizeEstimate"
+    )
+    res = _execute_with_retry(req, "messages.list")
+    ids = [m["id"] for m in res.get("messages", [])][:sample]
+    # The estimate can undershoot a short result; what was returned is a floor
+    return max(int(res.get("resultSizeEstimate") or 0), len(ids)), ids
+
+
+def list_history_message_ids(
+    service,
+    user_id: str,
+    start_history_id: str,
+    history_types: Sequence[str] | None = None,
+) -> tuple[set, str]:
+    changed: set = set()
+    latest = str(start_history_id)
+    page_token = None
+    while True:
+        params = {"userId": user_id, "startHistoryId": start_history_id, "pageToken": page_token}
+        if history_types:
+            params["historyTypes"] = list(history_types)
+        res = _execute_with_retry(service.users().history().list(**params), "history.list")
+        for record in res.get("history", []):
+            for key in ("messages", "messagesAdded", "messagesDeleted", "labelsAdded", "labelsRemoved"):
+                for item in record.get(key, []):
+                    msg = item.get("message", item)
+                    if msg.get("id"):
+                        changed.add(msg["id"])
+        latest = str(res.get("historyId") or latest)
+        page_token = res.get("nextPageToken")
+        if not page_token:
+            return changed, latest
+
+
+def run_chunks(
+    service,
+    fn: Callable,
+    chunks: Sequence,
+    *,
+    workers: int = 1,
+    service_factory: Callable[[], object] | None = None,
+) -> list:
+    # Serial unless a factory is given: a googleapiclient service must not be shared across threads
+    if workers <= 1 or service_factory is None or len(chunks) <= 1:
+        return [fn(service, chunk) for chunk in chunks]
+    local = threading.local()
+
+    def _call(chunk):
+        svc = getattr(local, "service", None)
+        if svc is None:
+            svc = local.service = service_factory()
+        return fn(svc, chunk)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # map() yields in submission order, keeping results deterministic
+        return list(pool.map(_call, chunks))
+
+
+@_retry_api("messages.batchModify")
+def batch_modify(
+    service,
+    user_id: str,
+    batch_ids: Sequence[str],
+    add_label_ids: Sequence[str] = ("TRASH",),
+    remove_label_ids: Sequence[str] = (),
+):
+    # One batchModify call; callers keep batch_ids within BATCH_SIZE
+    body: dict = {"addLabelIds": list(add_label_ids), "ids": list(batch_ids)}
+    if remove_label_ids:
+        body["removeLabelIds"] = list(remove_label_ids)
+    return _execute(service.users().messages().batchModify(userId=user_id, body=body), "messages.batchModify")
+
+
+def _modify_in_chunks(
+    service,
+    user_id: str,
+    ids: Sequence[str],
+    add_label_ids: Sequence[str],
+    remove_label_ids: Sequence[str] = (),
+    *,
+    workers: int = 1,
+    service_factory: Callable[[], object] | None = None,
+) -> int:
+    chunks = [list(ids[i : i + BATCH_SIZE]) for i in range(0, len(ids), BATCH_SIZE)]
 
+    def _apply(svc, chunk):
+        batch_modify(svc, user_id, chunk, add_label_ids, remove_label_ids)
+        return len(chunk)
 
-def move_to_trash_batch(service, user_id: str, ids: Sequence[str]) -> int:
-    total = 0
-    for i in range(0, len(ids), BATCH_SIZE):
-        chunk = ids[i : i + BATCH_SIZE]
-        _batch_modify(service, user_id, chunk)
-        total += len(chunk)
-    return total
+    return sum(run_chunks(service, _apply, chunks, workers=workers, service_factory=service_factory))
 
 
-def get_snippets(service, user_id: str, ids: Sequence[str], sample: int = 3) -> List[str]:
+def move_to_trash_batch(
+    service,
+    user_id: str,
+    ids: Sequence[str],
+    *,
+    workers: int = 1,
+    service_factory: Callable[[], object] | None = None,
+) -> int:
+    return _modify_in_chunks(service, user_id, ids, ["TRASH"], workers=workers, service_factory=service_factory)
+
+
+@_retry_api("messages.get")
+def _execute_get_batch(
+    service,
+    user_id: str,
+    chunk: Sequence[str],
+    params: dict,
+    results: dict,
+    skip_missing: bool = False,
+) -> None:
+    # Only IDs without a result yet are (re)sent, so a retry repeats just the failed sub-requests
+    pending = [mid for mid in chunk if mid not in results]
+    if not pending:
+        return
+    errors: dict = {}
+
+    def _callback(request_id, response, exception):
+        mid = pending[int(request_id)]
+        if exception is not None and skip_missing and http_status(exception) == 404:
+            results[mid] = None
+        elif exception is not None:
+            _observe_error(exception)
+            if _stats is not None:
+                _stats.record_error("messages.get", http_status(exception))
+            errors[mid] = exception
+        else:
+            results[mid] = response
+
+    batch = service.new_batch_http_request(callback=_callback)
+    for i, mid in enumerate(pending):
+        batch.add(service.users().messages().get(userId=user_id, id=mid, **params), request_id=str(i))
+    # Each sub-request is billed like a standalone messages.get
+    _execute(batch, "messages.get", count=len(pending))
+    if errors:
+        # Surface a non-retryable failure first so tenacity stops immediately
+        failures = list(errors.values())
+        failures.sort(key=is_retryable)
+        raise failures[0]
+
+
+def batch_get_messages(
+    service,
+    user_id: str,
+    ids: Sequence[str],
+    *,
+    format: str = "metadata",  # noqa: A002
+    headers: Sequence[str] | None = None,
+    workers: int = 1,
+    service_factory: Callable[[], object] | None = None,
+    cache=None,
+    skip_missing: bool = False,
+    compact: bool = False,
+) -> List[dict] | MetaStore:
+    params: dict = {"format": format}
+    if headers is not None:
+        params["metadataHeaders"] = list(headers)
+    unique = list(dict.fromkeys(ids))
+    results: dict = {}
+    # Each response is packed as soon as its chunk lands, so the full dicts never pile up
+    store = MetaStore() if compact else None
+    use_cache = cache is not None and format == "metadata" and cache.covers(headers)
+    if use_cache:
+        # Misses are fetched with every cached header so stored rows are complete
+        params["metadataHeaders"] = list(cache.headers)
+        hits = cache.get_many(unique)
+        results.update({mid: store.pack(m) for mid, m in hits.items()} if store is not None else hits)
+        unique = [mid for mid in unique if mid not in results]
+    chunks = [unique[i : i + BATCH_GET_SIZE] for i in range(0, len(unique), BATCH_GET_SIZE)]
+
+    def _fetch(svc, chunk):
+        chunk_results: dict = {}
+        _execute_get_batch(svc, user_id, chunk, params, chunk_results, skip_missing)
+        return chunk_results
+
+    for chunk_results in run_chunks(service, _fetch, chunks, workers=workers, service_factory=service_factory):
+        if use_cache:
+            cache.put_many(m for m in chunk_results.values() if m is not None)
+        if store is not None:
+            chunk_results = {mid: m and store.pack(m) for mid, m in chunk_results.items()}
+        results.update(chunk_results)
+    # Deleted messages (404) are dropped only when skip_missing is set
+    ordered = [results[mid] for mid in ids if results[mid] is not None]
+    if store is not None:
+        store.extend(ordered)
+        return store
+    return ordered
+
+
+def get_messages_metadata(
+    service,
+    user_id: str,
+    ids: Sequence[str],
+    headers: Sequence[str] | None = None,
+    *,
+    workers: int = 1,
+    service_factory: Callable[[], object] | None = None,
+    cache=None,
+    compact: bool = False,
+) -> List[dict] | MetaStore:
+    headers = list(headers or METADATA_HEADERS)
+    return batch_get_messages(
+        service, user_id, ids, headers=headers, workers=workers, service_factory=service_factory, cache=cache, compact=compact
+    )
+
+
+def snippets_from_metas(metas: Sequence[dict] | MetaStore, sample: int = 3) -> List[str]:
     result: List[str] = []
-    for mid in ids[: sample or 0]:
-        res = service.users().messages().get(userId=user_id, id=mid, format="metadata").execute()
-        snippet = res.get("snippet", "")
+    for res in metas[: sample or 0]:
+        if isinstance(metas, MetaStore):
+            mid, snippet = res.id, res.snippet
+        else:
+            mid, snippet = res.get("id"), res.get("snippet", "")
         snippet = snippet.replace("\n", " ").strip()
         if len(snippet) > 200:
             snippet = snippet[:200] + "…"
@@ -61,6 +390,11 @@ def get_snippets(service, user_id: str, ids: Sequence[str], sample: int = 3) ->
     return result
 
 
+def get_snippets(service, user_id: str, ids: Sequence[str], sample: int = 3, *, cache=None) -> List[str]:
+    metas = get_messages_metadata(service, user_id, ids[: sample or 0], cache=cache)
+    return snippets_from_metas(metas, sample)
+
+
 def _extract_from_header(payload_headers: list[dict]) -> str | None:
     for h in payload_headers:
         if h.get("name", "").lower() == "from":
@@ -68,20 +402,11 @@ def _extract_from_header(payload_headers: list[dict]) -> str | None:
     return None
 
 
-def get_from_addresses(service, user_id: str, ids: Sequence[str]) -> List[str]:
+def from_addresses_from_metas(metas: Sequence[dict] | MetaStore) -> List[str]:
+    if isinstance(metas, MetaStore):
+        return [rec.sender for rec in metas if rec.sender]
     addrs: List[str] = []
-    for mid in ids:
-        res = (
-            service.users()
-            .messages()
-            .get(
-                userId=user_id,
-                id=mid,
-                format="metadata",
-                metadataHeaders=["From"],
-            )
-            .execute()
-        )
+    for res in metas:
         payload = res.get("payload", {})
         headers = payload.get("headers", [])
         from_raw = _extract_from_header(headers)
@@ -90,156 +415,238 @@ def get_from_addresses(service, user_id: str, ids: Sequence[str]) -> List[str]:
     return addrs
 
 
-def count_unique_senders(service, user_id: str, ids: Sequence[str]) -> list[tuple[str, int]]:
-    from email.utils import getaddresses
-    from collections import Counter
+def get_from_addresses(
+    service,
+    user_id: str,
+    ids: Sequence[str],
+    *,
+    workers: int = 1,
+    service_factory: Callable[[], object] | None = None,
+    cache=None,
+) -> List[str]:
+    metas = get_messages_metadata(service, user_id, ids, workers=workers, service_factory=service_factory, cache=cache, compact=True)
+    return from_addresses_from_metas(metas)
 
-    raw_list = get_from_addresses(service, user_id, ids)
-    parsed = []
-    for raw in raw_list:
-        # Extract just the email part
-        addrs = getaddresses([raw])
-        if not addrs:
-            continue
-        _, email_addr = addrs[0]
-        if email_addr:
-            parsed.append(email_addr.lower())
-    counts = Counter(parsed)
-    # Return sorted by count desc, then email asc
-    return sorted(counts.items(), key=lambda x: (-x[1], x[0]))
-
-
-def get_messages_metadata(service, user_id: str, ids: Sequence[str], headers: Sequence[str] | None = None) -> List[dict]:
-    headers = list(headers or ("From", "Subject"))
-    out: List[dict] = []
-    for mid in ids:
-        res = (
-            service.users()
-            .messages()
-            .get(userId=user_id, id=mid, format="metadata", metadataHeaders=headers)
-            .execute()
+
+def senders_from_metas(metas: Sequence[dict] | MetaStore) -> list[tuple[str, int]]:
+    # Sorted by count desc, then email asc
+    return SenderStats().consume(metas).pairs()
+
+
+def iter_metadata_pages(
+    service,
+    user_id: str,
+    ids: Sequence[str],
+    page_size: int = 500,
+    *,
+    workers: int = 1,
+    service_factory: Callable[[], object] | None = None,
+    cache=None,
+) -> Iterator[MetaStore]:
+    # One compact store per page, so a caller that only aggregates never holds them all
+    for i in range(0, len(ids), page_size):
+        yield get_messages_metadata(
+            service, user_id, ids[i : i + page_size], workers=workers, service_factory=service_factory, cache=cache, compact=True
         )
-        out.append(res)
-    return out
 
 
-def add_star_label_batch(service, user_id: str, ids: Sequence[str]) -> int:
-    total = 0
-    for i in range(0, len(ids), BATCH_SIZE):
-        chunk = ids[i : i + BATCH_SIZE]
-        body = {"addLabelIds": ["STARRED"], "ids": list(chunk)}
-        _ = service.users().messages().batchModify(userId=user_id, body=body).execute()
-        total += len(chunk)
-    return total
+def count_unique_senders(
+    service,
+    user_id: str,
+    ids: Sequence[str],
+    *,
+    workers: int = 1,
+    service_factory: Callable[[], object] | None = None,
+    cache=None,
+    group_by: str = "sender",
+    top: int | None = None,
+) -> list[tuple[str, int]]:
+    senders = SenderStats(group_by, top)
+    for metas in iter_metadata_pages(service, user_id, ids, workers=workers, service_factory=service_factory, cache=cache):
+        senders.consume(metas)
+    return senders.pairs()
+
+
+def modify_labels_batch(
+    service,
+    user_id: str,
+    ids: Sequence[str],
+    add_label_ids: Sequence[str],
+    remove_label_ids: Sequence[str] = (),
+    *,
+    workers: int = 1,
+    service_factory: Callable[[], object] | None = None,
+) -> int:
+    return _modify_in_chunks(
+        service, user_id, ids, add_label_ids, remove_label_ids, workers=workers, service_factory=service_factory
+    )
+
+
+def add_star_label_batch(
+    service,
+    user_id: str,
+    ids: Sequence[str],
+    *,
+    workers: int = 1,
+    service_factory: Callable[[], object] | None = None,
+) -> int:
+    return _modify_in_chunks(service, user_id, ids, ["STARRED"], workers=workers, service_factory=service_factory)
+
+
+def list_labels(service, user_id: str) -> List[dict]:
+    labels = _execute_with_retry(service.users().labels().list(userId=user_id), "labels.list").get("labels", [])
+    # Every full listing refreshes the shared registry
+    if _labels is not None:
+        _labels.replace(labels)
+    return labels
+
+
+def ensure_labels(service, user_id: str, names: Sequence[str]) -> dict:
+    # Resolves (creating where needed) many labels with at most one labels.list call
+    registry = _labels
+    found: dict = {}
+    if registry is not None:
+        for name in names:
+            label_id = registry.get(name)
+            if label_id is not None:
+                found[name] = label_id
+    missing = [name for name in dict.fromkeys(names) if name not in found]
+    if not missing:
+        return found
+    existing: dict = {}
+    if registry is None or not (registry.listed and registry.fresh):
+        existing = {lb.get("name"): lb["id"] for lb in list_labels(service, user_id)}
+    for name in missing:
+        if name in existing:
+            found[name] = existing[name]
+            continue
+        body = {
+            "name": name,
+            "labelListVisibility": "labelShow",
+            "messageListVisibility": "show",
+        }
+        created = _execute_with_retry(service.users().labels().create(userId=user_id, body=body), "labels.create")
+        found[name] = created["id"]
+        if registry is not None:
+            registry.add(name, created["id"])
+    return found
 
 
 def ensure_label(service, user_id: str, name: str) -> str:
-    labels = service.users().labels().list(userId=user_id).execute().get("labels", [])
-    for lb in labels:
-        if lb.get("name") == name:
-            return lb["id"]
-    body = {
-        "name": name,
-        "labelListVisibility": "labelShow",
-        "messageListVisibility": "show",
-    }
-    created = service.users().labels().create(userId=user_id, body=body).execute()
-    return created["id"]
+    return ensure_labels(service, user_id, [name])[name]
 
 
-def add_label_batch(service, user_id: str, ids: Sequence[str], label_id: str) -> int:
-    total = 0
-    for i in range(0, len(ids), BATCH_SIZE):
-        chunk = ids[i : i + BATCH_SIZE]
-        if not chunk:
-            continue
-        body = {"addLabelIds": [label_id], "ids": list(chunk)}
-        service.users().messages().batchModify(userId=user_id, body=body).execute()
-        total += len(chunk)
-    return total
+def add_label_batch(
+    service,
+    user_id: str,
+    ids: Sequence[str],
+    label_id: str,
+    *,
+    workers: int = 1,
+    service_factory: Callable[[], object] | None = None,
+) -> int:
+    return _modify_in_chunks(service, user_id, ids, [label_id], workers=workers, service_factory=service_factory)
+
+
+def _subject_and_snippet(m: dict) -> str:
+    snippet = (m.get("snippet") or "").lower()
+    subject = ""
+    for h in m.get("payload", {}).get("headers", []):
+        if h.get("name", "").lower() == "subject":
+            subject = h.get("value", "").lower()
+            break
+    return f"{subject} {snippet}"
 
 
-def classify_ids(metas: Sequence[dict]) -> dict:
-    res = {"starred": [], "important": [], "sensitive": [], "other": []}
+def _flag_rows(metas: Sequence[dict] | MetaStore):
+    # (id, starred, important, record) per message, whichever representation came in
+    if isinstance(metas, MetaStore):
+        starred_bit, important_bit = metas.bit("STARRED"), metas.bit("IMPORTANT")
+        for rec in metas:
+            yield rec.id, rec.labels & starred_bit, rec.labels & important_bit, rec
+        return
     for m in metas:
-        mid = m.get("id")
+        label_ids = m.get("labelIds") or ()
+        yield m.get("id"), "STARRED" in label_ids, "IMPORTANT" in label_ids, m
+
+
+def _store_text(rec) -> str:
+    return f"{rec.subject.lower()} {rec.snippet.lower()}"
+
+
+def classify_for_trash(
+    metas: Sequence[dict] | MetaStore,
+    *,
+    skip_starred: bool = True,
+    skip_important: bool = True,
+    skip_sensitive: bool = True,
+    matcher: KeywordMatcher | None = None,
+) -> dict:
+    matcher = matcher or DEFAULT_MATCHER
+    res: dict = {
+        "trash_ids": [],
+        "skipped": {"starred": 0, "important": 0, "sensitive": 0},
+        "starred": [],
+        "important": [],
+        "sensitive": [],
+        "other": [],
+        # starred/important/sensitive in input order, for the review label
+        "flagged": [],
+    }
+    skipped = res["skipped"]
+    text_of = _store_text if isinstance(metas, MetaStore) else _subject_and_snippet
+    for mid, starred, important, m in _flag_rows(metas):
         if not mid:
             continue
-        label_ids = set(m.get("labelIds", []))
-        flagged_sensitive = False
-        snippet = (m.get("snippet") or "").lower()
-        subject = ""
-        payload = m.get("payload", {})
-        for h in payload.get("headers", []):
-            if h.get("name", "").lower() == "subject":
-                subject = h.get("value", "").lower()
-                break
-        text = f"{subject} {snippet}"
-        for kw in ("password", "密碼", "驗證碼", "verification code", "security code", "otp", "2fa", "帳號", "reset password", "token"):
-            if kw in text:
-                flagged_sensitive = True
-                break
-
-        if "STARRED" in label_ids:
+        # Keyword scan runs at most once per message, and only when its result matters
+        needs_bucket = not (starred or important)
+        needs_filter = skip_sensitive and not (skip_starred and starred) and not (skip_important and important)
+        sensitive = matcher.search(text_of(m)) if needs_bucket or needs_filter else False
+
+        if starred:
             res["starred"].append(mid)
-        elif "IMPORTANT" in label_ids:
+        elif important:
             res["important"].append(mid)
-        elif flagged_sensitive:
+        elif sensitive:
             res["sensitive"].append(mid)
         else:
             res["other"].append(mid)
+        if starred or important or sensitive:
+            res["flagged"].append(mid)
+
+        if skip_starred and starred:
+            skipped["starred"] += 1
+        elif skip_important and important:
+            skipped["important"] += 1
+        elif skip_sensitive and sensitive:
+            skipped["sensitive"] += 1
+        else:
+            res["trash_ids"].append(mid)
     return res
 
 
+def classify_ids(metas: Sequence[dict] | MetaStore, *, matcher: KeywordMatcher | None = None) -> dict:
+    res = classify_for_trash(metas, matcher=matcher)
+    return {k: res[k] for k in ("starred", "important", "sensitive", "other")}
+
+
 def filter_ids_for_trash(
-    metas: Sequence[dict],
+    metas: Sequence[dict] | MetaStore,
     *,
     skip_starred: bool = True,
     skip_important: bool = True,
     skip_sensitive: bool = True,
     sensitive_keywords: Sequence[str] | None = None,
+    matcher: KeywordMatcher | None = None,
 ) -> tuple[list[str], dict]:
-    sensitive_keywords = [
-        k.lower()
-        for k in (sensitive_keywords or (
-            "password",
-            "密碼",
-            "驗證碼",
-            "verification code",
-            "security code",
-            "otp",
-            "2fa",
-            "帳號",
-            "reset password",
-            "token",
-        ))
-    ]
-    trash_ids: list[str] = []
-    skipped = {"starred": 0, "important": 0, "sensitive": 0}
-
-    for m in metas:
-        mid = m.get("id")
-        if not mid:
-            continue
-        label_ids = set(m.get("labelIds", []))
-        if skip_starred and "STARRED" in label_ids:
-            skipped["starred"] += 1
-            continue
-        if skip_important and "IMPORTANT" in label_ids:
-            skipped["important"] += 1
-            continue
-        if skip_sensitive:
-            snippet = (m.get("snippet") or "").lower()
-            # Try subject if present
-            subject = ""
-            payload = m.get("payload", {})
-            for h in payload.get("headers", []):
-                if h.get("name", "").lower() == "subject":
-                    subject = h.get("value", "").lower()
-                    break
-            text = f"{subject} {snippet}"
-            if any(kw in text for kw in sensitive_keywords):
-                skipped["sensitive"] += 1
-                continue
-        trash_ids.append(mid)
-    return trash_ids, skipped
+    # An empty keyword list means the built-in one, as it always has
+    if matcher is None and sensitive_keywords:
+        matcher = KeywordMatcher(sensitive_keywords)
+    res = classify_for_trash(
+        metas,
+        skip_starred=skip_starred,
+        skip_important=skip_important,
+        skip_sensitive=skip_sensitive,
+        matcher=matcher,
+    )
+    return res["trash_ids"], res["skipped"]
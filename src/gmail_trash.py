@@ -1,30 +1,80 @@
 import argparse
+import contextlib
+import io
+import json
 import os
+import subprocess
 import sys
+import time
 from typing import Optional
 
 from dotenv import load_dotenv
 
 try:
-    from .auth import get_service
+    from .auth import DISCOVERY_FILENAME, get_credentials, build_service
     from .gmail_ops import (
         search_message_ids,
-        move_to_trash_batch,
-        get_snippets,
-        count_unique_senders,
-        BATCH_SIZE,
+        snippets_from_metas,
+        get_messages_metadata,
+        iter_metadata_pages,
+        ensure_label,
+        estimate_message_ids,
+        get_history_id,
+        set_label_registry,
+        set_quota_budget,
+        set_stats,
     )
-    from .util import setup_logger, format_summary, resolve_paths
+    from .cache import CACHE_FILENAME, MetadataCache
+    from .daemon import forward, socket_path
+    from .alfred import normalize, preview_state, record_failure, refresh, script_filter
+    from .accounts import AccountsError, accounts_path, format_results, load_accounts, run_accounts, select_accounts
+    from .labels import LabelRegistry, labels_path
+    from .local_index import LocalIndex, compile_query, index_path
+    from .journal import JobJournal, find_unfinished, jobs_dir, fuse_ops, ops_cost, run_job
+    from .incremental import checkpoint_path, incremental_candidates, load_checkpoint, save_checkpoint
+    from .matcher import KeywordMatcher, load_keywords
+    from .ratelimit import DEFAULT_UNITS_PER_SEC
+    from .stats import NULL_STATS, RunStats
+    from .pipeline import action_intents, plan_actions, pushdown_trash, stream_trash
+    from .rules import RulesError, load_rules, plan_rules
+    from .senders import GROUP_BY, SenderStats
+    from .query import QuerySyntaxError, parse as parse_query
+    from .util import setup_logger, format_summary, http_status, resolve_paths, resolve_config_path
 except Exception:  # pragma: no cover - fallback when run as a file
-    from auth import get_service  # type: ignore
+    from auth import DISCOVERY_FILENAME, get_credentials, build_service  # type: ignore
     from gmail_ops import (  # type: ignore
         search_message_ids,
-        move_to_trash_batch,
-        get_snippets,
-        count_unique_senders,
-        BATCH_SIZE,
+        snippets_from_metas,
+        get_messages_metadata,
+        iter_metadata_pages,
+        ensure_label,
+        estimate_message_ids,
+        get_history_id,
+        set_label_registry,
+        set_quota_budget,
+        set_stats,
     )
-    from util import setup_logger, format_summary, resolve_paths  # type: ignore
+    from cache import CACHE_FILENAME, MetadataCache  # type: ignore
+    from daemon import forward, socket_path  # type: ignore
+    from incremental import (  # type: ignore
+        checkpoint_path,
+        incremental_candidates,
+        load_checkpoint,
+        save_checkpoint,
+    )
+    from alfred import normalize, preview_state, record_failure, refresh, script_filter  # type: ignore
+    from accounts import AccountsError, accounts_path, format_results, load_accounts, run_accounts, select_accounts  # type: ignore
+    from labels import LabelRegistry, labels_path  # type: ignore
+    from local_index import LocalIndex, compile_query, index_path  # type: ignore
+    from journal import JobJournal, find_unfinished, jobs_dir, fuse_ops, ops_cost, run_job  # type: ignore
+    from matcher import KeywordMatcher, load_keywords  # type: ignore
+    from ratelimit import DEFAULT_UNITS_PER_SEC  # type: ignore
+    from stats import NULL_STATS, RunStats  # type: ignore
+    from pipeline import action_intents, plan_actions, pushdown_trash, stream_trash  # type: ignore
+    from rules import RulesError, load_rules, plan_rules  # type: ignore
+    from senders import GROUP_BY, SenderStats  # type: ignore
+    from query import QuerySyntaxError, parse as parse_query  # type: ignore
+    from util import setup_logger, format_summary, http_status, resolve_paths, resolve_config_path  # type: ignore
 
 
 EXIT_INPUT_ERROR = 1
@@ -35,10 +85,36 @@ EXIT_UNKNOWN_ERROR = 4
 
 def parse_args(argv: Optional[list[str]] = None):
     parser = argparse.ArgumentParser(description="Alfred Gmail Trash Mover")
-    parser.add_argument("--query", required=True, help="Gmail 搜尋語法")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--query", help="Gmail 搜尋語法")
+    target.add_argument("--rules", metavar="PATH", help="規則檔（JSON 或 YAML）：一次執行多條查詢，跨規則去重、metadata 只抓一次，最後合併成最少的 batchModify")
+    target.add_argument("--sync-index", action="store_true", help="建立或更新本地索引（CONFIG_DIR 下的 SQLite FTS5）：首次完整抓取 metadata，之後依 history API 增量更新")
     parser.add_argument("--dry-run", action="store_true", help="乾跑，不進行實際搬移")
+    parser.add_argument("--plan", action="store_true", help="只列出合併後的批次修改計畫（每組標籤變更的封數、呼叫次數與配額估計），不實際修改")
+    parser.add_argument("--estimate", "--fast-count", dest="estimate", action="store_true", help="快速乾跑：只取第一頁，以 Gmail 的 resultSizeEstimate 估計命中數並顯示示例（約兩次 API 呼叫）")
     parser.add_argument("--list-from", action="store_true", help="列出命中郵件的唯一發件者與次數")
+    parser.add_argument("--top", type=int, default=None, metavar="N", help="發件者統計只保留前 N 名（固定記憶體的 Space-Saving 計數，過程中於 stderr 回報目前排名；隱含 --list-from）")
+    parser.add_argument("--group-by", choices=GROUP_BY, default=None, help="發件者統計的彙總單位：sender（地址，預設）、domain（網域）、registrable（主網域，如 shop.co.uk）；隱含 --list-from")
     parser.add_argument("--limit", type=int, default=None, help="限制處理筆數")
+    parser.add_argument("--stream", action="store_true", help="串流模式：每頁 500 筆即抓取、過濾並搬移，記憶體不隨命中數成長")
+    parser.add_argument("--local", action="store_true", help="以本地索引（先執行 --sync-index）回答查詢：計數、示例與發件者統計不再搜尋或抓取 metadata，只有實際搬移呼叫 API")
+    parser.add_argument("--alfred-json", action="store_true", help="Alfred Script Filter 模式：以 JSON 回傳命中數、主要發件者與示例主旨。只讀 CONFIG_DIR/alfred 下的短期快取，未命中時於背景查詢並以 rerun 更新；加 --local 則直接查本地索引")
+    parser.add_argument("--alfred-refresh", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--cache", action="store_true", help="使用本地 metadata 快取（CONFIG_DIR 下的 SQLite，透過 history API 失效）")
+    parser.add_argument("--pushdown", action="store_true", help="將加星/重要/敏感字排除條件改寫進查詢，由 Gmail 伺服器端過濾")
+    parser.add_argument("--incremental", action="store_true", help="增量模式：只處理上次執行後新進或新加標籤的郵件（依 history API）")
+    parser.add_argument("--resume", action="store_true", help="續跑同一查詢上次中斷的搬移工作（依 CONFIG_DIR/jobs 下的工作日誌）")
+    parser.add_argument("--quota-units", type=float, default=DEFAULT_UNITS_PER_SEC, help="每秒 Gmail 配額單位上限（預設 250；0 表示不限速）")
+    parser.add_argument("--async-http", action="store_true", help="改用 asyncio + httpx 連線池（HTTP/2，需安裝 httpx[http2]）執行 API 呼叫")
+    parser.add_argument("--workers", type=int, default=1, help="並行執行緒數（預設 1，序列執行）")
+    parser.add_argument("--use-daemon", action="store_true", help="背景服務（python src/daemon.py）執行中時轉交給它處理，否則照常在本行程執行")
+    parser.add_argument("--stats", action="store_true", help="結束時於 stderr 輸出各階段耗時與各 API 方法的呼叫數、重試、延遲與配額單位")
+    parser.add_argument("--stats-json", default=None, metavar="PATH", help="將上述統計以 JSON 寫入檔案")
+    parser.add_argument("--profile", default=None, metavar="PATH", help="以 cProfile 記錄整次執行並寫入檔案（python -m pstats PATH 檢視）")
+    parser.add_argument("--accounts", default=None, metavar="A,B", help="對帳號設定檔中的多個帳號（逗號分隔）各以獨立行程並行執行，最後彙總結果")
+    parser.add_argument("--all-accounts", action="store_true", help="對帳號設定檔中的所有帳號並行執行")
+    parser.add_argument("--accounts-file", default=None, metavar="PATH", help="帳號設定檔（預設 CONFIG_DIR/accounts.json）")
+    parser.add_argument("--account-processes", type=int, default=None, metavar="N", help="同時執行的帳號行程數上限（預設 8）")
     parser.add_argument("--log-level", choices=["INFO", "DEBUG"], default="INFO")
     parser.add_argument("--credentials-path", default=None)
     parser.add_argument("--token-path", default=None)
@@ -46,106 +122,589 @@ def parse_args(argv: Optional[list[str]] = None):
     parser.add_argument("--no-skip-starred", dest="skip_starred", action="store_false", help="包含已加星郵件（預設跳過）")
     parser.add_argument("--no-skip-sensitive", dest="skip_sensitive", action="store_false", help="包含可能含帳密/驗證碼等敏感字樣（預設跳過）")
     parser.add_argument("--no-mark-important-star", dest="mark_important_star", action="store_false", help="不要將重要郵件加星（預設會加星並跳過）")
+    parser.add_argument("--sensitive-keywords-file", default=None, help="敏感關鍵字清單檔（每行一個，# 為註解），取代內建清單")
     parser.add_argument("--important-label", default="AGM-Important", help="將被跳過的（加星/重要/敏感）郵件加上此自訂標籤")
     parser.set_defaults(skip_starred=True, skip_sensitive=True, mark_important_star=True)
     return parser.parse_args(argv)
 
 
-def main(argv: Optional[list[str]] = None) -> int:
+def _print_trash_summary(count: int, moved: int, skipped: dict, limit: Optional[int]) -> None:
+    limited = limit if limit is not None and limit < count else None
+    print(format_summary(count, moved=moved, limited=limited, dry=False))
+    print(f"已跳過：加星 {skipped.get('starred',0)}、重要 {skipped.get('important',0)}、敏感 {skipped.get('sensitive',0)}")
+
+
+_GROUP_TITLES = {"sender": "發件者", "domain": "網域", "registrable": "主網域"}
+
+
+def _format_senders(senders: SenderStats) -> str:
+    title = _GROUP_TITLES[senders.group_by]
+    if senders.limit is None:
+        lines = [f"{title}統計（共 {len(senders.counter)} 個）："]
+    else:
+        lines = [f"{title}前 {senders.limit} 名（統計 {senders.messages} 封）："]
+    for key, n, err in senders.top():
+        # Space-Saving counts are upper bounds once a key has replaced an evicted one
+        lines.append(f"- {key}: ~{n}（最多高估 {err}）" if err else f"- {key}: {n}")
+    return "\n".join(lines)
+
+
+def _format_preview(args, count: int, samples: list[str], senders: Optional[SenderStats]) -> str:
+    out = []
+    if args.dry_run:
+        out.append(format_summary(count, dry=True))
+        for s in samples:
+            out.append(f"- {s}")
+    if senders is not None:
+        out.append(_format_senders(senders))
+    return "\n".join(out)
+
+
+def _stale_label(registry: LabelRegistry, name: str, error: Exception) -> bool:
+    # A 404 on a label ID this process never listed means it was deleted since it was cached
+    if http_status(error) != 404 or not registry.served_from_cache(name):
+        return False
+    registry.forget(name)
+    return True
+
+
+def _refreshing_label(registry: LabelRegistry, name: str, fn, *args, **kwargs):
+    try:
+        return fn(*args, **kwargs)
+    except Exception as e:
+        if not _stale_label(registry, name, e):
+            raise
+        # Both modes search again, so the rerun only sees what the first attempt left behind
+        return fn(*args, **kwargs)
+
+
+def _review_label(args, service, actions: dict, stats) -> Optional[str]:
+    if not actions["to_label"]:
+        return None
+    if args.plan:
+        # Planning must not create the label; its name stands in for the ID
+        return args.important_label
+    with stats.phase("label"):
+        return ensure_label(service, "me", args.important_label)
+
+
+def _run_journal(service, journal: JobJournal, registry: LabelRegistry, args, label_id: Optional[str], pool: dict) -> int:
+    try:
+        return run_job(service, "me", journal, **pool)
+    except Exception as e:
+        if label_id is None or not _stale_label(registry, args.important_label, e):
+            raise
+        # Recreate the label and finish the same job under its new ID
+        journal = journal.relabel(label_id, ensure_label(service, "me", args.important_label))
+        return run_job(service, "me", journal, **pool)
+
+
+def _plan_summary(plan: dict) -> dict:
+    # What --resume needs to print the per-rule report again
+    return {"rules": plan["rules"], "count": plan["count"], "fetched": plan["fetched"]}
+
+
+def _format_rules(plan: dict, *, moved: Optional[int] = None, dry: bool = False) -> str:
+    rules = plan["rules"]
+    if dry:
+        lines = [f"乾跑：{len(rules)} 條規則，命中 {plan['count']} 封（跨規則去重後）"]
+        lines.extend(f"- {r['name']}：命中 {r['matched']} 封" for r in rules)
+        return "\n".join(lines)
+    if moved is None:
+        head = f"{len(rules)} 條規則：命中 {plan['count']} 封（跨規則去重後，metadata 抓取 {plan['fetched']} 封）"
+    else:
+        head = f"{len(rules)} 條規則：命中 {plan['count']} 封（跨規則去重後）；已搬移至垃圾桶 {moved} 封。"
+    lines = [head]
+    for r in rules:
+        sk = r["skipped"]
+        lines.append(
+            f"- {r['name']}：命中 {r['matched']}、跳過 {sum(sk.values())}"
+            f"（加星 {sk.get('starred', 0)}、重要 {sk.get('important', 0)}、敏感 {sk.get('sensitive', 0)}）、搬移 {r['trash']}"
+        )
+    return "\n".join(lines)
+
+
+# Options consumed by the multi-account runner and not passed on to each account
+_ACCOUNT_OPTIONS = {"--accounts": True, "--accounts-file": True, "--account-processes": True, "--all-accounts": False, "--use-daemon": False}
+
+
+def _account_argv(argv: list[str]) -> list[str]:
+    out: list[str] = []
+    skip = False
+    for arg in argv:
+        if skip:
+            skip = False
+            continue
+        name = arg.split("=", 1)[0]
+        if name in _ACCOUNT_OPTIONS:
+            skip = _ACCOUNT_OPTIONS[name] and "=" not in arg
+            continue
+        out.append(arg)
+    return out
+
+
+def _run_accounts(args, argv: list[str]) -> int:
+    if args.token_path or args.credentials_path:
+        sys.stderr.write("參數錯誤：--accounts/--all-accounts 不可與 --token-path 或 --credentials-path 同時使用\n")
+        return EXIT_INPUT_ERROR
+    if args.account_processes is not None and args.account_processes < 1:
+        sys.stderr.write("參數錯誤：--account-processes 必須 >= 1\n")
+        return EXIT_INPUT_ERROR
+    names = None if args.all_accounts else [n.strip() for n in args.accounts.split(",") if n.strip()]
+    try:
+        accounts = select_accounts(load_accounts(accounts_path(args.accounts_file)), names)
+    except AccountsError as e:
+        sys.stderr.write(f"參數錯誤：{e}\n")
+        return EXIT_INPUT_ERROR
+    started = time.perf_counter()
+    # Every account runs the whole pipeline in its own process, with its own quota budget
+    results = run_accounts(accounts, _account_argv(argv), processes=args.account_processes)
+    print(format_results(results, time.perf_counter() - started))
+    return next((r["exit"] for r in results if r["exit"] != 0), 0)
+
+
+def _format_plan(ops: list[dict], intents: list[dict], count: int, skipped: Optional[dict] = None) -> str:
+    calls, units = ops_cost(ops)
+    unfused_calls, unfused_units = ops_cost([op for op in intents if op["ids"]])
+    lines = [f"計畫：命中 {count} 封，batchModify {calls} 次（約 {units} 配額單位；分開執行需 {unfused_calls} 次、{unfused_units} 單位）"]
+    for op in ops:
+        change = " ".join([f"+{lid}" for lid in op["add"]] + [f"-{lid}" for lid in op["remove"]])
+        op_calls, op_units = ops_cost([op])
+        lines.append(f"- {change}：{len(op['ids'])} 封，{op_calls} 次，{op_units} 單位")
+    if skipped is not None:
+        lines.append(f"已跳過：加星 {skipped.get('starred',0)}、重要 {skipped.get('important',0)}、敏感 {skipped.get('sensitive',0)}")
+    return "\n".join(lines)
+
+
+def _async_service(creds, workers: int):
+    # Imported here: asyncio and httpx only load when the async transport is asked for
+    try:
+        from .async_client import DEFAULT_CONCURRENCY, AsyncGmailClient, SyncGmailService
+    except Exception:  # pragma: no cover - fallback when run as a file
+        from async_client import DEFAULT_CONCURRENCY, AsyncGmailClient, SyncGmailService  # type: ignore
+    concurrency = max(DEFAULT_CONCURRENCY, workers)
+    return SyncGmailService(lambda: AsyncGmailClient(creds, concurrency=concurrency))
+
+
+def main(argv: Optional[list[str]] = None, *, service=None, service_factory=None, cache=None) -> int:
+    # service/service_factory/cache are injected by the daemon to reuse warm state
     load_dotenv()
+    argv = sys.argv[1:] if argv is None else list(argv)
     args = parse_args(argv)
-    logger = setup_logger(args.log_level)
+    if args.accounts or args.all_accounts:
+        return _run_accounts(args, argv)
+    if args.alfred_refresh:
+        return _alfred_refresh(args, argv, service=service, service_factory=service_factory, cache=cache)
+    if not (args.stats or args.stats_json or args.profile):
+        return _run(args, argv, NULL_STATS, service=service, service_factory=service_factory, cache=cache)
+
+    stats = RunStats()
+    set_stats(stats)
+    profiler = None
+    if args.profile:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        profiler.enable()
+    try:
+        return _run(args, argv, stats, service=service, service_factory=service_factory, cache=cache)
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            profiler.dump_stats(args.profile)
+        set_stats(None)
+        # A forwarded run reports from the daemon side
+        if not getattr(args, "forwarded", False):
+            if args.stats:
+                sys.stderr.write(stats.format() + "\n")
+            if args.stats_json:
+                stats.write_json(args.stats_json)
+
+
+def _script_filter(args, argv: list[str]) -> int:
+    # Runs on every keystroke, so it never authenticates: files only, slow work goes to a worker
+    _, tok_path = resolve_paths(args.credentials_path, args.token_path)
+    previews, inflight = preview_state(tok_path)
+    local = LocalIndex(index_path(tok_path)) if args.local and os.path.exists(index_path(tok_path)) else None
+    # The worker always asks Gmail: it only runs when the index could not answer
+    worker_argv = [a for a in argv if a != "--local"]
+
+    def spawn() -> int:
+        # Its own session, so Alfred terminating this script leaves the lookup running
+        proc = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), *worker_argv, "--alfred-refresh"],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+        return proc.pid
+
+    try:
+        print(json.dumps(script_filter(args.query or "", previews, inflight, spawn, local=local), ensure_ascii=False))
+    finally:
+        if local is not None:
+            local.close()
+    return 0
+
+
+def _alfred_refresh(args, argv: list[str], **injected) -> int:
+    _, tok_path = resolve_paths(args.credentials_path, args.token_path)
+    previews, inflight = preview_state(tok_path)
+    query = normalize(args.query or "")
+    if not inflight.current(query):
+        # Superseded before it started, e.g. while queued behind other lookups in the daemon
+        return 0
+    # Nobody reads a background worker's stderr; a failure is cached for the Script Filter to show
+    err = io.StringIO()
+    with contextlib.redirect_stderr(err):
+        code = _run(args, argv, NULL_STATS, **injected)
+    if code != 0:
+        record_failure(query, err.getvalue(), previews, inflight)
+    return code
+
 
+def _run(args, argv: list[str], stats, *, service=None, service_factory=None, cache=None) -> int:
+    logger = setup_logger(args.log_level)
     query = (args.query or "").strip()
-    if not query:
+    rules = None
+    if args.alfred_json and not args.alfred_refresh:
+        if args.rules or args.sync_index:
+            sys.stderr.write("參數錯誤：--alfred-json 需搭配 --query\n")
+            return EXIT_INPUT_ERROR
+        return _script_filter(args, argv)
+    if args.top is not None or args.group_by:
+        if args.top is not None and args.top < 1:
+            sys.stderr.write("參數錯誤：--top 必須 >= 1\n")
+            return EXIT_INPUT_ERROR
+        args.list_from = True
+    if args.rules:
+        if args.stream or args.pushdown or args.incremental or args.estimate or args.list_from or args.limit is not None:
+            sys.stderr.write("參數錯誤：--rules 不可與 --stream、--pushdown、--incremental、--estimate、--list-from 或 --limit 同時使用（筆數限制請寫在規則內）\n")
+            return EXIT_INPUT_ERROR
+        try:
+            rules = load_rules(args.rules)
+        except OSError as e:
+            sys.stderr.write(f"參數錯誤：無法讀取規則檔：{e}\n")
+            return EXIT_INPUT_ERROR
+        except RulesError as e:
+            sys.stderr.write(f"參數錯誤：{e}\n")
+            return EXIT_INPUT_ERROR
+        # Journal key for --resume
+        query = f"rules:{os.path.abspath(args.rules)}"
+    elif not query and not args.sync_index:
         sys.stderr.write("參數錯誤：--query 不可為空\n")
         return EXIT_INPUT_ERROR
+    if args.workers < 1:
+        sys.stderr.write("參數錯誤：--workers 必須 >= 1\n")
+        return EXIT_INPUT_ERROR
+    if args.incremental and (args.limit is not None or args.stream):
+        sys.stderr.write("參數錯誤：--incremental 不可與 --limit 或 --stream 同時使用\n")
+        return EXIT_INPUT_ERROR
+    if args.estimate and (args.list_from or args.plan or args.incremental or args.resume):
+        sys.stderr.write("參數錯誤：--estimate 不可與 --list-from、--plan、--incremental 或 --resume 同時使用\n")
+        return EXIT_INPUT_ERROR
+    if args.resume and (args.stream or args.pushdown or args.dry_run or args.plan or args.list_from):
+        # A pending journal is replayed for real, so preview flags must not reach it
+        sys.stderr.write("參數錯誤：--resume 不可與 --stream、--pushdown、--dry-run、--plan 或 --list-from 同時使用\n")
+        return EXIT_INPUT_ERROR
+    if args.local:
+        if args.rules or args.stream or args.pushdown or args.incremental or args.estimate:
+            sys.stderr.write("參數錯誤：--local 不可與 --rules、--stream、--pushdown、--incremental 或 --estimate 同時使用\n")
+            return EXIT_INPUT_ERROR
+        try:
+            # Unsupported operators are rejected before any API call
+            compile_query(query)
+        except QuerySyntaxError as e:
+            sys.stderr.write(f"參數錯誤：{e}（可改用線上查詢，不加 --local）\n")
+            return EXIT_INPUT_ERROR
+    if args.pushdown:
+        # --limit would cut each pushed-down search on its own, not the query once
+        if args.stream or args.incremental or args.limit is not None:
+            sys.stderr.write("參數錯誤：--pushdown 不可與 --stream、--incremental 或 --limit 同時使用\n")
+            return EXIT_INPUT_ERROR
+        try:
+            parse_query(query)
+        except QuerySyntaxError as e:
+            sys.stderr.write(f"參數錯誤：{e}\n")
+            return EXIT_INPUT_ERROR
 
-    try:
-        cred_path, tok_path = resolve_paths(args.credentials_path, args.token_path)
-        service = get_service(cred_path, tok_path, None)
-    except FileNotFoundError as e:
-        sys.stderr.write(f"認證失敗：{e}\n")
-        return EXIT_AUTH_ERROR
-    except Exception as e:  # OAuth errors
-        sys.stderr.write(f"認證失敗：{e}\n")
-        return EXIT_AUTH_ERROR
+    cred_path, tok_path = resolve_paths(args.credentials_path, args.token_path)
+    if args.use_daemon and service is None:
+        try:
+            code = forward([a for a in argv if a != "--use-daemon"], socket_path(tok_path))
+        except ConnectionError as e:
+            sys.stderr.write(f"未預期錯誤：背景服務中斷：{e}\n")
+            return EXIT_UNKNOWN_ERROR
+        if code is not None:
+            args.forwarded = True
+            return code
+        logger.debug("背景服務未執行，改在本行程處理")
+
+    matcher = None
+    if args.sensitive_keywords_file:
+        try:
+            matcher = KeywordMatcher(load_keywords(args.sensitive_keywords_file))
+        except OSError as e:
+            sys.stderr.write(f"參數錯誤：無法讀取關鍵字檔：{e}\n")
+            return EXIT_INPUT_ERROR
+
+    async_service = None
+    if service is None:
+        with stats.phase("auth"):
+            try:
+                creds = get_credentials(cred_path, tok_path, None)
+                discovery_path = resolve_config_path(DISCOVERY_FILENAME, tok_path)
+                if not args.async_http:
+                    service = build_service(creds, discovery_path)
+            except FileNotFoundError as e:
+                sys.stderr.write(f"認證失敗：{e}\n")
+                return EXIT_AUTH_ERROR
+            except Exception as e:  # OAuth errors
+                sys.stderr.write(f"認證失敗：{e}\n")
+                return EXIT_AUTH_ERROR
+
+            if args.async_http:
+                try:
+                    service = async_service = _async_service(creds, args.workers)
+                except ImportError as e:
+                    sys.stderr.write(f"參數錯誤：{e}\n")
+                    return EXIT_INPUT_ERROR
+
+        def service_factory():
+            # The async facade is shared: its one event loop and pool serve every thread
+            return async_service or build_service(creds, discovery_path)
+
+    # One limiter paces every API call, including those made by worker threads
+    set_quota_budget(args.quota_units if args.quota_units > 0 else None)
+    # Label IDs persist across runs, so a warm run resolves labels without a labels.list call
+    registry = set_label_registry(LabelRegistry(labels_path(tok_path)))
+
+    # Worker threads each build their own service from the shared credentials
+    pool = {"workers": args.workers, "service_factory": service_factory if args.workers > 1 else None}
 
+    # An injected cache belongs to the caller and stays open after this run
+    own_cache = cache is None
+    if not args.cache:
+        cache = None
+    journal = None
+    local = None
     try:
-        ids = search_message_ids(service, "me", query, args.limit)
-        count = len(ids)
-        if args.list_from:
-            pairs = count_unique_senders(service, "me", ids)
-            lines = [f"發件者統計（共 {len(pairs)} 個）："]
-            for email, n in pairs:
-                lines.append(f"- {email}: {n}")
-            print("\n".join(lines))
+        if args.resume:
+            journal = find_unfinished(jobs_dir(tok_path), query)
+            if journal is not None:
+                # The journal already holds the planned ids; no search or metadata needed
+                logger.info(f"續跑工作：{journal.path}（剩餘 {len(journal.pending())} 批）")
+                with stats.phase("modify"):
+                    moved = run_job(service, "me", journal, **pool)
+                summary = journal.header["summary"]
+                if "rules" in summary:
+                    print(_format_rules(summary, moved=moved))
+                else:
+                    _print_trash_summary(summary["count"], moved, summary["skipped"], summary.get("limit"))
+                return 0
+            logger.info("找不到可續跑的工作，改為完整執行")
+        if args.cache:
+            if cache is None:
+                cache = MetadataCache(resolve_config_path(CACHE_FILENAME, tok_path))
+            with stats.phase("cache_sync"):
+                invalidated = cache.sync(service, "me")
+            logger.debug(f"快取失效筆數: {invalidated}")
+        if args.alfred_refresh:
+            previews, inflight = preview_state(tok_path)
+            with stats.phase("preview"):
+                refresh(service, "me", normalize(query), previews, inflight, cache=cache, **pool)
+            return 0
+        if args.sync_index or args.local:
+            local = LocalIndex(index_path(tok_path))
+            if args.local and local.history_id is None:
+                sys.stderr.write("參數錯誤：本地索引尚未建立，請先執行 --sync-index\n")
+                return EXIT_INPUT_ERROR
+            # A query against the index first catches up through the history API
+            with stats.phase("index_sync"):
+                synced = local.sync(service, "me", **pool)
+            if args.sync_index:
+                if synced["full"]:
+                    print(f"本地索引已重建：共 {synced['total']} 封")
+                else:
+                    print(f"本地索引已更新：異動 {synced['changed']} 封，共 {synced['total']} 封")
+                return 0
+        if args.local and (args.dry_run or args.list_from):
+            with stats.phase("search"):
+                count = local.count(query)
+                if args.limit is not None:
+                    count = min(count, args.limit)
+                samples = snippets_from_metas(local.search(query, 3), sample=3)
+                senders = None
+                if args.list_from:
+                    senders = SenderStats(args.group_by or "sender", args.top)
+                    for raw, n in local.sender_counts(query, args.limit):
+                        senders.add(raw, n)
+            print(_format_preview(args, count, samples, senders))
+            return 0
+        if rules is not None:
+            # A plain dry run only reports matches; skips need the metadata pass
+            with stats.phase("rules"):
+                plan = plan_rules(service, "me", rules, fetch=not args.dry_run, cache=cache, matcher=matcher, **pool)
+            if args.dry_run:
+                print(_format_rules(plan, dry=True))
+                return 0
+            actions = plan["actions"]
+            label_id = _review_label(args, service, actions, stats)
+            intents = action_intents(actions, label_id)
+            ops = fuse_ops(intents)
+            if args.plan:
+                print(_format_rules(plan))
+                print(_format_plan(ops, intents, plan["count"]))
+                return 0
+            journal = JobJournal.create(jobs_dir(tok_path), query, ops, **_plan_summary(plan))
+            with stats.phase("modify"):
+                moved = _run_journal(service, journal, registry, args, label_id, pool)
+            print(_format_rules(plan, moved=moved))
             return 0
-        if args.dry_run:
-            samples = get_snippets(service, "me", ids, sample=3)
-            summary = format_summary(count, dry=True)
-            out = [summary]
-            for s in samples:
+        if args.estimate:
+            # A dry run in two calls: one short list page and one metadata batch for the samples
+            with stats.phase("search"):
+                count, sample_ids = estimate_message_ids(service, "me", query)
+            with stats.phase("metadata"):
+                metas = get_messages_metadata(service, "me", sample_ids, cache=cache, compact=True, **pool)
+            out = [format_summary(count, dry=True, estimated=True)]
+            for s in snippets_from_metas(metas, sample=3):
                 out.append(f"- {s}")
             print("\n".join(out))
             return 0
+        if args.stream and not (args.dry_run or args.list_from or args.plan):
+            with stats.phase("stream"):
+                result = _refreshing_label(
+                    registry,
+                    args.important_label,
+                    stream_trash,
+                    service,
+                    "me",
+                    query,
+                    limit=args.limit,
+                    skip_starred=args.skip_starred,
+                    skip_sensitive=args.skip_sensitive,
+                    mark_important_star=args.mark_important_star,
+                    important_label=args.important_label,
+                    cache=cache,
+                    matcher=matcher,
+                    **pool,
+                )
+            _print_trash_summary(result["count"], result["moved"], result["skipped"], args.limit)
+            return 0
 
-        # Fetch metadata and apply filters
-        try:
-            from .gmail_ops import (
-                get_messages_metadata,
-                filter_ids_for_trash,
-                add_star_label_batch,
-                classify_ids,
-                ensure_label,
-                add_label_batch,
-            )
-        except Exception:  # pragma: no cover
-            from gmail_ops import (  # type: ignore
-                get_messages_metadata,
-                filter_ids_for_trash,
-                add_star_label_batch,
-                classify_ids,
-                ensure_label,
-                add_label_batch,
-            )
-
-        metas = get_messages_metadata(service, "me", ids, headers=["Subject", "From"])
+        if args.pushdown and not (args.dry_run or args.list_from or args.plan):
+            with stats.phase("pushdown"):
+                result = _refreshing_label(
+                    registry,
+                    args.important_label,
+                    pushdown_trash,
+                    service,
+                    "me",
+                    query,
+                    skip_starred=args.skip_starred,
+                    skip_sensitive=args.skip_sensitive,
+                    mark_important_star=args.mark_important_star,
+                    important_label=args.important_label,
+                    cache=cache,
+                    matcher=matcher,
+                    **pool,
+                )
+            print(format_summary(result["count"], moved=result["moved"], dry=False))
+            print(f"已跳過：{result['skipped']} 封（伺服器端過濾；本地檢查 {result['fetched']} 封）")
+            return 0
 
-        # Star important ones, skip them from trash
-        if args.mark_important_star:
-            to_star = [m["id"] for m in metas if "IMPORTANT" in set(m.get("labelIds", [])) and "STARRED" not in set(m.get("labelIds", []))]
-            if to_star:
-                add_star_label_batch(service, "me", to_star)
+        checkpoint = None
+        local_metas = None
+        with stats.phase("search"):
+            if args.local:
+                # The local translation can match more than Gmail (from: is a substring,
+                # keywords skip bodies), so only what Gmail's own search confirms is touched
+                live = set(search_message_ids(service, "me", query))
+                local_metas = local.search(query)
+                local_metas = local_metas.subset([rec.id for rec in local_metas if rec.id in live][: args.limit])
+                ids = [rec.id for rec in local_metas]
+            elif args.incremental:
+                ckpt_path = checkpoint_path(query, tok_path)
+                checkpoint = load_checkpoint(ckpt_path)
+                found = incremental_candidates(service, "me", query, checkpoint, cache=cache) if checkpoint else None
+                if found is None:
+                    # First run or expired history: full search from a fresh baseline
+                    checkpoint = {"history_id": get_history_id(service, "me"), "processed": set()}
+                    ids = search_message_ids(service, "me", query)
+                else:
+                    ids, checkpoint["history_id"] = found
+            else:
+                ids = search_message_ids(service, "me", query, args.limit)
+        count = len(ids)
+        if args.list_from or args.dry_run:
+            # One metadata pass serves both reports; a plain dry run only needs the samples
+            senders = SenderStats(args.group_by or "sender", args.top) if args.list_from else None
+            samples = None
+            with stats.phase("metadata"):
+                # Pages are aggregated as they arrive and dropped, so memory stays flat with --top
+                for metas in iter_metadata_pages(service, "me", ids if senders else ids[:3], cache=cache, **pool):
+                    if samples is None:
+                        samples = snippets_from_metas(metas, sample=3)
+                    if senders is None:
+                        continue
+                    senders.consume(metas)
+                    if args.top is not None and senders.messages < count:
+                        ranking = "、".join(f"{key} ({n})" for key, n, _ in senders.top())
+                        sys.stderr.write(f"進度：已統計 {senders.messages}/{count} 封；目前前 {args.top} 名：{ranking}\n")
+            print(_format_preview(args, count, samples or [], senders))
+            return 0
 
-        trash_ids, skipped = filter_ids_for_trash(
-            metas,
-            skip_starred=args.skip_starred,
-            skip_important=True,
-            skip_sensitive=args.skip_sensitive,
-        )
+        # Fetch metadata and apply filters
+        with stats.phase("metadata"):
+            # The local index already holds everything the filters read
+            metas = local_metas if local_metas is not None else get_messages_metadata(service, "me", ids, cache=cache, compact=True, **pool)
+        with stats.phase("plan"):
+            actions = plan_actions(
+                metas,
+                skip_starred=args.skip_starred,
+                skip_sensitive=args.skip_sensitive,
+                mark_important_star=args.mark_important_star,
+                matcher=matcher,
+            )
+        skipped = actions["skipped"]
 
-        # Label the skipped ones for later review
-        classified = classify_ids(metas)
-        to_label = set(classified.get("starred", [])) | set(classified.get("important", [])) | set(classified.get("sensitive", []))
-        if to_label:
-            label_id = ensure_label(service, "me", args.important_label)
-            add_label_batch(service, "me", list(to_label), label_id)
-
-        moved = move_to_trash_batch(service, "me", trash_ids)
-        limited = args.limit if args.limit is not None and args.limit < count else None
-        print(format_summary(count, moved=moved, limited=limited, dry=False))
-        print(f"已跳過：加星 {skipped.get('starred',0)}、重要 {skipped.get('important',0)}、敏感 {skipped.get('sensitive',0)}")
-        logger.debug(f"批次大小: {BATCH_SIZE}")
+        # Star important ones and label the skipped ones before trashing the rest
+        label_id = _review_label(args, service, actions, stats)
+        intents = action_intents(actions, label_id)
+        # Messages that are both starred and labelled get one call, not two
+        ops = fuse_ops(intents)
+        if args.plan:
+            print(_format_plan(ops, intents, count, skipped))
+            return 0
+        # Journal every chunk so an interrupted run can pick up with --resume
+        journal = JobJournal.create(jobs_dir(tok_path), query, ops, count=count, skipped=skipped, limit=args.limit)
+        with stats.phase("modify"):
+            moved = _run_journal(service, journal, registry, args, label_id, pool)
+        if checkpoint is not None:
+            save_checkpoint(ckpt_path, query, checkpoint["history_id"], checkpoint["processed"] | set(ids))
+        _print_trash_summary(count, moved, skipped, args.limit)
         return 0
     except Exception as e:
         # Distinguish API vs unknown only loosely here
         msg = str(e)
         if "HttpError" in e.__class__.__name__:
             sys.stderr.write(f"API 錯誤：{msg}\n")
+            if journal is not None and os.path.exists(journal.path):
+                sys.stderr.write("可使用 --resume 續跑未完成的批次\n")
             return EXIT_API_ERROR
         sys.stderr.write(f"未預期錯誤：{msg}\n")
         return EXIT_UNKNOWN_ERROR
+    finally:
+        set_quota_budget(None)
+        set_label_registry(None)
+        if cache is not None and own_cache:
+            cache.close()
+        if local is not None:
+            local.close()
+        if async_service is not None:
+            async_service.close()
 
 
 if __name__ == "__main__":
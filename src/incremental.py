@@ -0,0 +1,67 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import List, Optional, Sequence
+
+try:
+    from .gmail_ops import batch_get_messages, list_history_message_ids, search_message_ids
+    from .util import http_status, resolve_config_path
+except Exception:  # pragma: no cover - fallback when run as script
+    from gmail_ops import batch_get_messages, list_history_message_ids, search_message_ids  # type: ignore
+    from util import http_status, resolve_config_path  # type: ignore
+
+
+CHECKPOINT_DIRNAME = "checkpoints"
+
+
+def checkpoint_path(query: str, token_path: Optional[str] = None) -> str:
+    digest = hashlib.sha1(query.encode("utf-8")).hexdigest()[:16]
+    return resolve_config_path(os.path.join(CHECKPOINT_DIRNAME, f"{digest}.json"), token_path)
+
+
+def load_checkpoint(path: str) -> Optional[dict]:
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    data["processed"] = set(data.get("processed", []))
+    return data
+
+
+def save_checkpoint(path: str, query: str, history_id: str, processed: set) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"query": query, "history_id": str(history_id), "processed": sorted(processed)}, f)
+    # Atomic swap so an interrupted run never leaves a torn checkpoint
+    os.replace(tmp, path)
+
+
+def _reevaluate(service, user_id: str, query: str, candidates: Sequence[str], cache=None) -> List[str]:
+    # Gmail cannot search within an ID set, so the query is re-run over the
+    # candidates' internalDate window and intersected with them
+    metas = batch_get_messages(service, user_id, candidates, cache=cache, skip_missing=True)
+    dates = [int(m["internalDate"]) // 1000 for m in metas if m.get("internalDate")]
+    if not dates:
+        return []
+    window = f"({query}) after:{min(dates) - 1} before:{max(dates) + 1}"
+    wanted = set(candidates)
+    return [mid for mid in search_message_ids(service, user_id, window) if mid in wanted]
+
+
+def incremental_candidates(service, user_id: str, query: str, checkpoint: dict, cache=None) -> Optional[tuple[List[str], str]]:
+    try:
+        changed, latest = list_history_message_ids(
+            service, user_id, checkpoint["history_id"], history_types=["messageAdded", "labelAdded"]
+        )
+    except Exception as e:
+        # History expired: caller falls back to a full search
+        if http_status(e) == 404:
+            return None
+        raise
+    candidates = sorted(changed - checkpoint["processed"])
+    if not candidates:
+        return [], latest
+    return _reevaluate(service, user_id, query, candidates, cache=cache), latest
@@ -0,0 +1,169 @@
+from __future__ import annotations
+
+import glob
+import json
+import os
+import threading
+import time
+from typing import Callable, Iterator, List, Optional, Sequence
+
+try:
+    from .gmail_ops import BATCH_SIZE, run_chunks, batch_modify
+    from .ratelimit import method_cost
+    from .util import resolve_config_path
+except Exception:  # pragma: no cover - fallback when run as script
+    from gmail_ops import BATCH_SIZE, run_chunks, batch_modify  # type: ignore
+    from ratelimit import method_cost  # type: ignore
+    from util import resolve_config_path  # type: ignore
+
+
+JOBS_DIRNAME = "jobs"
+
+
+def jobs_dir(token_path: Optional[str] = None) -> str:
+    return resolve_config_path(JOBS_DIRNAME, token_path)
+
+
+def make_op(ids: Sequence[str], add_label_ids: Sequence[str] = (), remove_label_ids: Sequence[str] = ()) -> dict:
+    return {"add": list(add_label_ids), "remove": list(remove_label_ids), "ids": list(ids)}
+
+
+def fuse_ops(ops: Sequence[dict]) -> List[dict]:
+    # Merge every change per message, then regroup by the exact final label delta so
+    # each distinct (add, remove) pair costs one batchModify per BATCH_SIZE IDs
+    deltas: dict = {}
+    for op in ops:
+        for mid in op["ids"]:
+            add, remove = deltas.setdefault(mid, ({}, {}))
+            # Later ops win when the same label is both added and removed
+            for lid in op["add"]:
+                remove.pop(lid, None)
+                add[lid] = None
+            for lid in op["remove"]:
+                add.pop(lid, None)
+                remove[lid] = None
+    groups: dict = {}
+    for mid, (add, remove) in deltas.items():
+        if add or remove:
+            groups.setdefault((tuple(add), tuple(remove)), []).append(mid)
+    # Groups come out in first-seen order, so trash (planned last) still runs last
+    return [make_op(ids, add, remove) for (add, remove), ids in groups.items()]
+
+
+def ops_cost(ops: Sequence[dict], chunk_size: int = BATCH_SIZE) -> tuple[int, int]:
+    calls = sum(-(-len(op["ids"]) // chunk_size) for op in ops)
+    return calls, calls * method_cost("messages.batchModify")
+
+
+class JobJournal:
+    # Append-only JSON lines: one "job" header, then one "done" line per committed chunk
+    def __init__(self, path: str, header: dict, completed: Optional[set] = None):
+        self.path = path
+        self.header = header
+        self.completed: set = completed or set()
+        self._lock = threading.Lock()
+
+    @property
+    def query(self) -> str:
+        return self.header["query"]
+
+    @property
+    def ops(self) -> List[dict]:
+        return self.header["ops"]
+
+    @classmethod
+    def create(cls, directory: str, query: str, ops: Sequence[dict], **summary) -> "JobJournal":
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"job-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl")
+        header = {"type": "job", "query": query, "chunk_size": BATCH_SIZE, "ops": list(ops), "summary": summary}
+        journal = cls(path, header)
+        journal._append(header)
+        return journal
+
+    @classmethod
+    def load(cls, path: str) -> Optional["JobJournal"]:
+        header = None
+        completed: set = set()
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn last line from a crash mid-write; everything before it is intact
+                    break
+                if record.get("type") == "job":
+                    header = record
+                elif record.get("type") == "done":
+                    completed.add((record["op"], record["chunk"]))
+        if header is None:
+            return None
+        return cls(path, header, completed)
+
+    def relabel(self, old_id: str, new_id: str) -> "JobJournal":
+        # Same job with one label ID swapped (it was deleted and recreated); progress carries over
+        ops = [{**op, "add": [new_id if lid == old_id else lid for lid in op["add"]]} for op in self.ops]
+        header = {**self.header, "ops": ops}
+        journal = type(self)(self.path, header, set(self.completed))
+        tmp = f"{self.path}.tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write(json.dumps(header, ensure_ascii=False) + "\n")
+            for op_index, chunk_index in sorted(self.completed):
+                f.write(json.dumps({"type": "done", "op": op_index, "chunk": chunk_index}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        return journal
+
+    def _append(self, record: dict) -> None:
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+
+    def chunks(self) -> Iterator[tuple[int, int, dict, List[str]]]:
+        # Chunk boundaries must match the run that wrote the "done" lines
+        size = self.header.get("chunk_size", BATCH_SIZE)
+        for op_index, op in enumerate(self.ops):
+            ids = op["ids"]
+            for chunk_index, start in enumerate(range(0, len(ids), size)):
+                yield op_index, chunk_index, op, ids[start : start + size]
+
+    def pending(self) -> List[tuple[int, int, dict, List[str]]]:
+        return [c for c in self.chunks() if (c[0], c[1]) not in self.completed]
+
+    def mark_done(self, op_index: int, chunk_index: int) -> None:
+        self._append({"type": "done", "op": op_index, "chunk": chunk_index})
+        self.completed.add((op_index, chunk_index))
+
+    def finish(self) -> None:
+        os.remove(self.path)
+
+
+def find_unfinished(directory: str, query: str) -> Optional[JobJournal]:
+    # Newest first; file names sort by creation time
+    for path in sorted(glob.glob(os.path.join(directory, "job-*.jsonl")), reverse=True):
+        journal = JobJournal.load(path)
+        if journal is not None and journal.query == query:
+            return journal
+    return None
+
+
+def run_job(
+    service,
+    user_id: str,
+    journal: JobJournal,
+    *,
+    workers: int = 1,
+    service_factory: Callable[[], object] | None = None,
+) -> int:
+    def _apply(svc, chunk):
+        op_index, chunk_index, op, ids = chunk
+        # A crash between the call and the journal write only repeats an idempotent label change
+        batch_modify(svc, user_id, ids, op["add"], op["remove"])
+        journal.mark_done(op_index, chunk_index)
+        return len(ids)
+
+    run_chunks(service, _apply, journal.pending(), workers=workers, service_factory=service_factory)
+    journal.finish()
+    # Trashed total over the whole job, including chunks committed by earlier runs
+    return sum(len(op["ids"]) for op in journal.ops if "TRASH" in op["add"])
@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from typing import Iterable, Optional
+
+try:
+    from .util import resolve_config_path
+except Exception:  # pragma: no cover - fallback when run as script
+    from util import resolve_config_path  # type: ignore
+
+
+LABELS_FILENAME = "labels.json"
+# Labels are rarely renamed or deleted; a stale ID is caught by the 404 refresh anyway
+DEFAULT_LABEL_TTL = 24 * 3600
+
+
+def labels_path(token_path: Optional[str] = None) -> str:
+    return resolve_config_path(LABELS_FILENAME, token_path)
+
+
+class LabelRegistry:
+    # name -> ID for user labels, persisted so a warm run needs no labels.list call
+    def __init__(self, path: Optional[str], ttl: float = DEFAULT_LABEL_TTL, clock=time.time):
+        self.path = path
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._ids: dict = {}
+        self._loaded_at = 0.0
+        # Set once this process has seen the full list; later misses are new labels, not stale cache
+        self.listed = False
+        # Names answered from the file rather than from a list this process made
+        self._served: set = set()
+        if path is not None:
+            self._read()
+
+    def _read(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            self._ids = dict(data["labels"])
+            self._loaded_at = float(data["loaded_at"])
+        except (OSError, ValueError, KeyError, TypeError):
+            self._ids, self._loaded_at = {}, 0.0
+
+    def _save(self) -> None:
+        if self.path is None:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            tmp = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp, "w", encoding="utf-8") as f:
+                json.dump({"loaded_at": self._loaded_at, "labels": self._ids}, f, ensure_ascii=False)
+            os.replace(tmp, self.path)
+        except OSError:
+            pass
+
+    @property
+    def fresh(self) -> bool:
+        return self._clock() - self._loaded_at < self.ttl
+
+    def get(self, name: str) -> Optional[str]:
+        with self._lock:
+            label_id = self._ids.get(name) if self.fresh else None
+            if label_id is not None and not self.listed:
+                self._served.add(name)
+            return label_id
+
+    def served_from_cache(self, name: str) -> bool:
+        return name in self._served
+
+    def replace(self, labels: Iterable[dict]) -> None:
+        # A full labels.list result; restarts the TTL
+        with self._lock:
+            self._ids = {lb["name"]: lb["id"] for lb in labels if lb.get("name") and lb.get("id")}
+            self._loaded_at = self._clock()
+            self.listed = True
+            self._served.clear()
+            self._save()
+
+    def add(self, name: str, label_id: str) -> None:
+        with self._lock:
+            self._ids[name] = label_id
+            self._save()
+
+    def forget(self, name: str) -> None:
+        # Deleted remotely: the next lookup lists again instead of trusting the rest of the cache
+        with self._lock:
+            self._ids.pop(name, None)
+            self._served.discard(name)
+            self._loaded_at = 0.0
+            self.listed = False
+            self._save()
@@ -0,0 +1,353 @@
+from __future__ import annotations
+
+import datetime
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Callable, Iterable, List, Optional
+
+try:
+    from .gmail_ops import (
+        METADATA_HEADERS,
+        batch_get_messages,
+        get_history_id,
+        iter_message_id_pages,
+        list_history_message_ids,
+        list_labels,
+    )
+    from .meta_store import MetaStore
+    from .query import And, Node, Not, Or, QuerySyntaxError, Term, parse
+    from .util import http_status, resolve_config_path
+except Exception:  # pragma: no cover - fallback when run as script
+    from gmail_ops import (  # type: ignore
+        METADATA_HEADERS,
+        batch_get_messages,
+        get_history_id,
+        iter_message_id_pages,
+        list_history_message_ids,
+        list_labels,
+    )
+    from meta_store import MetaStore  # type: ignore
+    from query import And, Node, Not, Or, QuerySyntaxError, Term, parse  # type: ignore
+    from util import http_status, resolve_config_path  # type: ignore
+
+
+INDEX_FILENAME = "local_index.sqlite3"
+# Label names are re-listed at most this often on a history sync
+LABELS_TTL = 24 * 3600
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    rowid INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    sender TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    snippet TEXT NOT NULL,
+    -- ' INBOX STARRED ', so a label test is one LIKE
+    labels TEXT NOT NULL,
+    -- milliseconds, as Gmail reports internalDate
+    internal_date INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS messages_date ON messages (internal_date);
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(
+    sender, subject, snippet, content='messages', content_rowid='rowid'
+);
+CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, sender, subject, snippet) VALUES (new.rowid, new.sender, new.subject, new.snippet);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_ad AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, sender, subject, snippet) VALUES ('delete', old.rowid, old.sender, old.subject, old.snippet);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_au AFTER UPDATE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, sender, subject, snippet) VALUES ('delete', old.rowid, old.sender, old.subject, old.snippet);
+    INSERT INTO messages_fts (rowid, sender, subject, snippet) VALUES (new.rowid, new.sender, new.subject, new.snippet);
+END;
+CREATE TABLE IF NOT EXISTS state (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+_COLUMNS = "id, sender, subject, snippet, labels, internal_date"
+_UNITS = {"d": 86400, "m": 30 * 86400, "y": 365 * 86400}
+_IS = {"starred": "STARRED", "important": "IMPORTANT", "unread": "UNREAD", "snoozed": "SNOOZED"}
+_IN = {"inbox": "INBOX", "sent": "SENT", "draft": "DRAFT", "drafts": "DRAFT", "trash": "TRASH", "spam": "SPAM", "chats": "CHAT"}
+_CATEGORIES = {"primary": "CATEGORY_PERSONAL", "social": "CATEGORY_SOCIAL", "promotions": "CATEGORY_PROMOTIONS", "updates": "CATEGORY_UPDATES", "forums": "CATEGORY_FORUMS"}
+
+
+class LocalIndexError(RuntimeError):
+    pass
+
+
+class LocalQueryError(QuerySyntaxError):
+    pass
+
+
+def index_path(token_path: Optional[str] = None) -> str:
+    return resolve_config_path(INDEX_FILENAME, token_path)
+
+
+def label_key(name: str) -> str:
+    # Gmail's label: matches names case-insensitively with spaces and slashes written as dashes
+    return re.sub(r"[\s/]+", "-", name.strip().lower())
+
+
+def _like(value: str) -> str:
+    return "%" + re.sub(r"([\\%_])", r"\\\1", value) + "%"
+
+
+def _phrase(value: str) -> str:
+    return '"' + value.replace('"', '""') + '"'
+
+
+def _parse_date(value: str) -> int:
+    # after:/before: take epoch seconds or a date, which Gmail reads as local midnight
+    if value.isdigit():
+        return int(value)
+    try:
+        day = datetime.datetime.strptime(value.replace("-", "/"), "%Y/%m/%d")
+    except ValueError:
+        raise LocalQueryError(f"無法解析日期：{value}") from None
+    return int(day.timestamp())
+
+
+class _Compiler:
+    def __init__(self, labels: dict, now: float):
+        self.labels = labels
+        self.now = int(now)
+        self.params: list = []
+        # Gmail leaves trash and spam out unless the query asks for them
+        self.hidden = True
+
+    def node(self, node: Node) -> str:
+        if isinstance(node, And):
+            return "(" + " AND ".join(self.node(c) for c in node.children) + ")" if node.children else "1"
+        if isinstance(node, Or):
+            return "(" + " OR ".join(self.node(c) for c in node.children) + ")"
+        if isinstance(node, Not):
+            return f"NOT ({self.node(node.child)})"
+        return self.term(node)
+
+    def label(self, label_id: Optional[str]) -> str:
+        if label_id is None:
+            # Gmail answers an unknown label with no results
+            return "0"
+        if label_id in ("TRASH", "SPAM"):
+            self.hidden = False
+        self.params.append(f"% {label_id} %")
+        return "labels LIKE ?"
+
+    def text(self, value: str, column: Optional[str], words: bool) -> str:
+        columns = [column] if column else ["sender", "subject", "snippet"]
+        if not value.isascii():
+            # unicode61 keeps a CJK run as one token, so substrings are matched by LIKE instead
+            self.params.extend(_like(value) for _ in columns)
+            return "(" + " OR ".join(f"{c} LIKE ? ESCAPE '\\'" for c in columns) + ")"
+        expr = " AND ".join(_phrase(w) for w in value.split()) if words else _phrase(value)
+        self.params.append(f"{column} : ({expr})" if column else expr)
+        return "rowid IN (SELECT rowid FROM messages_fts WHERE messages_fts MATCH ?)"
+
+    def term(self, term: Term) -> str:
+        field, value = term.field, term.value
+        lowered = value.lower()
+        if field is None:
+            return self.text(value, None, words=not term.raw.startswith('"'))
+        # subject:(a b) wants every word; subject:"a b" and subject:word a phrase
+        words = term.raw[len(field) + 1 :].startswith("(")
+        if field == "subject":
+            return self.text(value, "subject", words)
+        if field == "from":
+            self.params.append(_like(lowered))
+            return "sender LIKE ? ESCAPE '\\'"
+        if field == "is" and lowered == "read":
+            return f"NOT ({self.label('UNREAD')})"
+        if field == "is" and lowered in _IS:
+            return self.label(_IS[lowered])
+        if field == "in" and lowered == "anywhere":
+            self.hidden = False
+            return "1"
+        if field == "in" and lowered in _IN:
+            return self.label(_IN[lowered])
+        if field == "category" and lowered in _CATEGORIES:
+            return self.label(_CATEGORIES[lowered])
+        if field == "label":
+            key = label_key(value)
+            return self.label(self.labels.get(key) or _IN.get(key) or _IS.get(key))
+        if field in ("after", "before"):
+            seconds = _parse_date(value)
+            # Same whole-second comparison as Gmail
+            self.params.append((seconds + 1) * 1000 if field == "after" else seconds * 1000)
+            return "internal_date >= ?" if field == "after" else "internal_date < ?"
+        if field in ("older_than", "newer_than"):
+            m = re.fullmatch(r"(\d+)([dmy])", lowered)
+            if not m:
+                raise LocalQueryError(f"無法解析時間長度：{term.raw}")
+            cutoff = self.now - int(m.group(1)) * _UNITS[m.group(2)]
+            self.params.append(cutoff * 1000 if field == "older_than" else (cutoff + 1) * 1000)
+            return "internal_date < ?" if field == "older_than" else "internal_date >= ?"
+        raise LocalQueryError(f"本地索引不支援此條件：{term.raw}")
+
+
+def compile_query(query: str, labels: Optional[dict] = None, now: Optional[float] = None) -> tuple[str, list]:
+    compiler = _Compiler(labels or {}, time.time() if now is None else now)
+    where = compiler.node(parse(query)) if query.strip() else "1"
+    if compiler.hidden:
+        where += " AND labels NOT LIKE '% TRASH %' AND labels NOT LIKE '% SPAM %'"
+    return where, compiler.params
+
+
+def _header(meta: dict, name: str) -> Optional[str]:
+    for h in meta.get("payload", {}).get("headers", []):
+        if h.get("name", "").lower() == name.lower():
+            return h.get("value")
+    return None
+
+
+class LocalIndex:
+    # Offline copy of every message's metadata, searchable with the common Gmail operators
+    def __init__(self, path: str, clock: Callable[[], float] = time.time):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        try:
+            self._conn.executescript(_SCHEMA)
+        except sqlite3.OperationalError as e:
+            self._conn.close()
+            raise LocalIndexError(f"無法建立本地索引（需要支援 FTS5 的 SQLite）：{e}") from None
+
+    def close(self) -> None:
+        self._conn.close()
+
+    def __len__(self) -> int:
+        return self._conn.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+
+    def _state(self, key: str) -> Optional[str]:
+        row = self._conn.execute("SELECT value FROM state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value: str) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO state (key, value) VALUES (?, ?)", (key, value))
+
+    @property
+    def history_id(self) -> Optional[str]:
+        return self._state("history_id")
+
+    @property
+    def labels(self) -> dict:
+        # label_key(name) -> label ID
+        return json.loads(self._state("labels") or "{}")
+
+    def put_many(self, metas: Iterable[dict]) -> int:
+        rows = [
+            (
+                m["id"],
+                _header(m, "From") or "",
+                _header(m, "Subject") or "",
+                m.get("snippet", ""),
+                " " + " ".join(m.get("labelIds", [])) + " ",
+                int(m.get("internalDate") or 0),
+            )
+            for m in metas
+            if m.get("id")
+        ]
+        # An upsert, not INSERT OR REPLACE: a replace deletes without firing the FTS trigger
+        with self._lock, self._conn:
+            self._conn.executemany(
+                f"INSERT INTO messages ({_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?) ON CONFLICT (id) DO UPDATE SET "
+                "sender = excluded.sender, subject = excluded.subject, snippet = excluded.snippet, "
+                "labels = excluded.labels, internal_date = excluded.internal_date",
+                rows,
+            )
+        return len(rows)
+
+    def delete_many(self, ids: Iterable[str]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany("DELETE FROM messages WHERE id = ?", [(mid,) for mid in ids])
+
+    def clear(self) -> None:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM messages")
+            self._conn.execute("DELETE FROM state WHERE key = 'history_id'")
+
+    def _refresh_labels(self, service, user_id: str) -> None:
+        labels = {label_key(lb["name"]): lb["id"] for lb in list_labels(service, user_id) if lb.get("name") and lb.get("id")}
+        self._set_state("labels", json.dumps(labels, ensure_ascii=False))
+        self._set_state("labels_at", str(self._clock()))
+
+    def sync(
+        self,
+        service,
+        user_id: str,
+        *,
+        full: bool = False,
+        workers: int = 1,
+        service_factory: Callable[[], object] | None = None,
+    ) -> dict:
+        pool = {"workers": workers, "service_factory": service_factory}
+        start = None if full else self.history_id
+        if start is not None:
+            try:
+                changed, latest = list_history_message_ids(service, user_id, start)
+            except Exception as e:
+                # History expired (about a week): rebuild from scratch
+                if http_status(e) != 404:
+                    raise
+            else:
+                if self._clock() - float(self._state("labels_at") or 0) >= LABELS_TTL:
+                    self._refresh_labels(service, user_id)
+                if changed:
+                    metas = batch_get_messages(service, user_id, sorted(changed), headers=METADATA_HEADERS, skip_missing=True, **pool)
+                    self.put_many(metas)
+                    # Whatever 404'd has been deleted for good
+                    self.delete_many(changed - {m["id"] for m in metas})
+                self._set_state("history_id", latest)
+                return {"full": False, "changed": len(changed), "total": len(self)}
+
+        # Baseline first, so mail that changes during the rebuild is picked up by the next sync
+        history_id = get_history_id(service, user_id)
+        self._refresh_labels(service, user_id)
+        self.clear()
+        for page in iter_message_id_pages(service, user_id, ""):
+            self.put_many(batch_get_messages(service, user_id, page, headers=METADATA_HEADERS, skip_missing=True, **pool))
+        self._set_state("history_id", history_id)
+        return {"full": True, "changed": 0, "total": len(self)}
+
+    def _where(self, query: str) -> tuple[str, list]:
+        return compile_query(query, self.labels, self._clock())
+
+    def count(self, query: str) -> int:
+        where, params = self._where(query)
+        return self._conn.execute(f"SELECT COUNT(*) FROM messages WHERE {where}", params).fetchone()[0]
+
+    def search(self, query: str, limit: Optional[int] = None) -> MetaStore:
+        # Newest first, like messages.list
+        where, params = self._where(query)
+        sql = f"SELECT {_COLUMNS} FROM messages WHERE {where} ORDER BY internal_date DESC, id DESC"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        rows = self._conn.execute(sql, params)
+        return MetaStore(
+            {
+                "id": mid,
+                "labelIds": labels.split(),
+                "snippet": snippet,
+                "internalDate": str(internal_date),
+                "payload": {"headers": [{"name": "From", "value": sender}, {"name": "Subject", "value": subject}]},
+            }
+            for mid, sender, subject, snippet, labels, internal_date in rows
+        )
+
+    def sender_counts(self, query: str, limit: Optional[int] = None) -> List[tuple[str, int]]:
+        # Raw From headers with their counts; the caller groups them
+        where, params = self._where(query)
+        rows = f"SELECT sender FROM messages WHERE {where}"
+        if limit is not None:
+            rows += f" ORDER BY internal_date DESC, id DESC LIMIT {int(limit)}"
+        return self._conn.execute(f"SELECT sender, COUNT(*) FROM ({rows}) GROUP BY sender", params).fetchall()
+
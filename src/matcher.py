@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import re
+from typing import Iterable, List
+
+
+DEFAULT_SENSITIVE_KEYWORDS = (
+    "password",
+    "密碼",
+    "驗證碼",
+    "verification code",
+    "security code",
+    "otp",
+    "2fa",
+    "帳號",
+    "reset password",
+    "token",
+)
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    # Shared prefixes collapse into nested groups, so the regex engine walks a
+    # trie instead of retrying every keyword at each position
+    trie: dict = {}
+    for word in words:
+        node = trie
+        for ch in word:
+            node = node.setdefault(ch, {})
+        node[""] = {}
+
+    def _build(node: dict) -> str:
+        end = "" in node
+        branches = [re.escape(ch) + _build(child) for ch, child in sorted(node.items()) if ch]
+        if not branches:
+            return ""
+        body = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+        if end:
+            return "(?:" + body + ")?"
+        return body
+
+    return _build(trie)
+
+
+class KeywordMatcher:
+    def __init__(self, keywords: Iterable[str] = DEFAULT_SENSITIVE_KEYWORDS):
+        self.keywords = tuple(sorted({k.strip().lower() for k in keywords if k and k.strip()}))
+        self._regex = re.compile(_trie_pattern(self.keywords)) if self.keywords else None
+
+    def search(self, text: str) -> bool:
+        # Caller passes lower-cased text; matching is case-insensitive like the old `kw in text` check
+        return self._regex is not None and self._regex.search(text) is not None
+
+
+def load_keywords(path: str) -> List[str]:
+    # One keyword per line; blank lines and `#` comments are ignored
+    keywords: List[str] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith("#"):
+                keywords.append(line)
+    return keywords
+
+
+DEFAULT_MATCHER = KeywordMatcher()
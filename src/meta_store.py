@@ -0,0 +1,96 @@
+from __future__ import annotations
+
+from collections import Counter
+from typing import Iterable, Iterator, List, Optional, Sequence
+
+
+class MessageMeta:
+    # Only the fields the filters and reports read; labels are a bitmask over MetaStore's label table
+    __slots__ = ("id", "labels", "sender", "subject", "snippet")
+
+    def __init__(self, id: str, labels: int, sender: Optional[str], subject: str, snippet: str):  # noqa: A002
+        self.id = id
+        self.labels = labels
+        self.sender = sender
+        self.subject = subject
+        self.snippet = snippet
+
+    def __repr__(self) -> str:
+        return f"MessageMeta({self.id!r}, labels={self.labels:#x}, sender={self.sender!r})"
+
+
+class MetaStore:
+    # Ordered, compact stand-in for the list of messages.get(format=metadata) dicts
+    def __init__(self, metas: Iterable[dict] = ()):
+        self._bits: dict = {}
+        self._label_ids: List[str] = []
+        # Senders repeat heavily in bulk mail; one string object per distinct From header
+        self._senders: dict = {}
+        self.records: List[MessageMeta] = []
+        self._index: Optional[dict] = None
+        self.extend(self.pack(m) for m in metas)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[MessageMeta]:
+        return iter(self.records)
+
+    def __getitem__(self, index):
+        return self.records[index]
+
+    def append(self, rec: MessageMeta) -> None:
+        self.records.append(rec)
+
+    def extend(self, recs: Iterable[MessageMeta]) -> None:
+        self.records.extend(recs)
+
+    def subset(self, ids: Sequence[str]) -> "MetaStore":
+        # A view over some of the records, sharing the label table and sender strings
+        view = MetaStore()
+        view._bits, view._label_ids, view._senders = self._bits, self._label_ids, self._senders
+        if self._index is None or len(self._index) != len(self.records):
+            self._index = {rec.id: rec for rec in self.records}
+        view.records = [self._index[mid] for mid in ids if mid in self._index]
+        return view
+
+    def bit(self, label_id: str) -> int:
+        # 0 for a label no record carries, so tests against it are simply false
+        return self._bits.get(label_id, 0)
+
+    def _bit_for(self, label_id: str) -> int:
+        bit = self._bits.get(label_id)
+        if bit is None:
+            bit = self._bits[label_id] = 1 << len(self._label_ids)
+            self._label_ids.append(label_id)
+        return bit
+
+    def pack(self, meta: dict) -> MessageMeta:
+        labels = 0
+        for lid in meta.get("labelIds") or ():
+            labels |= self._bit_for(lid)
+        sender = subject = None
+        for h in meta.get("payload", {}).get("headers", []):
+            name = h.get("name", "").lower()
+            if name == "from" and sender is None:
+                sender = h.get("value")
+            elif name == "subject" and subject is None:
+                subject = h.get("value", "")
+        if sender is not None:
+            sender = self._senders.setdefault(sender, sender)
+        return MessageMeta(meta.get("id"), labels, sender, subject or "", meta.get("snippet") or "")
+
+    def label_ids(self, rec: MessageMeta) -> List[str]:
+        return [lid for i, lid in enumerate(self._label_ids) if rec.labels >> i & 1]
+
+    def to_dict(self, rec: MessageMeta) -> dict:
+        # Back to the API shape, for callers that still want dicts
+        headers = []
+        if rec.sender is not None:
+            headers.append({"name": "From", "value": rec.sender})
+        if rec.subject:
+            headers.append({"name": "Subject", "value": rec.subject})
+        return {"id": rec.id, "labelIds": self.label_ids(rec), "snippet": rec.snippet, "payload": {"headers": headers}}
+
+    def sender_counts(self) -> Counter:
+        return Counter(rec.sender for rec in self.records if rec.sender)
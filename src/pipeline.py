@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+from typing import Callable, List, Sequence
+
+try:
+    from .gmail_ops import (
+        BATCH_SIZE,
+        classify_for_trash,
+        ensure_label,
+        get_messages_metadata,
+        iter_message_id_pages,
+        modify_labels_batch,
+        search_message_ids,
+    )
+    from .journal import fuse_ops, make_op
+    from .matcher import DEFAULT_MATCHER, KeywordMatcher
+    from .meta_store import MetaStore
+    from .query import build_pushdown
+except Exception:  # pragma: no cover - fallback when run as script
+    from gmail_ops import (  # type: ignore
+        BATCH_SIZE,
+        classify_for_trash,
+        ensure_label,
+        get_messages_metadata,
+        iter_message_id_pages,
+        modify_labels_batch,
+        search_message_ids,
+    )
+    from journal import fuse_ops, make_op  # type: ignore
+    from matcher import DEFAULT_MATCHER, KeywordMatcher  # type: ignore
+    from meta_store import MetaStore  # type: ignore
+    from query import build_pushdown  # type: ignore
+
+
+def plan_actions(
+    metas: Sequence[dict] | MetaStore,
+    *,
+    skip_starred: bool = True,
+    skip_sensitive: bool = True,
+    mark_important_star: bool = True,
+    matcher: KeywordMatcher | None = None,
+) -> dict:
+    res = classify_for_trash(
+        metas,
+        skip_starred=skip_starred,
+        skip_important=True,
+        skip_sensitive=skip_sensitive,
+        matcher=matcher,
+    )
+    # The "important" bucket already excludes starred messages
+    to_star = list(res["important"]) if mark_important_star else []
+    # Skipped ones get the review label, in metadata order
+    return {"to_star": to_star, "to_label": res["flagged"], "trash_ids": res["trash_ids"], "skipped": res["skipped"]}
+
+
+def action_intents(actions: dict, label_id: str | None) -> List[dict]:
+    # One op per intent, in the order they used to run; fuse_ops merges them per message
+    intents = []
+    if actions["to_star"]:
+        intents.append(make_op(actions["to_star"], ["STARRED"]))
+    if actions["to_label"]:
+        intents.append(make_op(actions["to_label"], [label_id]))
+    intents.append(make_op(actions["trash_ids"], ["TRASH"]))
+    return intents
+
+
+class ModifyBuffer:
+    def __init__(self, apply: Callable[[List[str]], int], size: int = BATCH_SIZE):
+        self._apply = apply
+        self._size = size
+        self._pending: List[str] = []
+        self.total = 0
+
+    def add(self, ids: Sequence[str]) -> None:
+        self._pending.extend(ids)
+        while len(self._pending) >= self._size:
+            chunk, self._pending = self._pending[: self._size], self._pending[self._size :]
+            self.total += self._apply(chunk)
+
+    def flush(self) -> None:
+        if self._pending:
+            chunk, self._pending = self._pending, []
+            self.total += self._apply(chunk)
+
+
+def stream_trash(
+    service,
+    user_id: str,
+    query: str,
+    *,
+    limit: int | None = None,
+    skip_starred: bool = True,
+    skip_sensitive: bool = True,
+    mark_important_star: bool = True,
+    important_label: str = "AGM-Important",
+    workers: int = 1,
+    service_factory: Callable[[], object] | None = None,
+    cache=None,
+    matcher: KeywordMatcher | None = None,
+) -> dict:
+    pool = {"workers": workers, "service_factory": service_factory}
+    label_id: str | None = None
+    # One buffer per distinct label delta, so fused groups still go out in full batches
+    buffers: dict = {}
+
+    def _buffer(op: dict) -> ModifyBuffer:
+        key = (tuple(op["add"]), tuple(op["remove"]))
+        if key not in buffers:
+            buffers[key] = ModifyBuffer(lambda chunk: modify_labels_batch(service, user_id, chunk, key[0], key[1], **pool))
+        return buffers[key]
+
+    count = 0
+    skipped = {"starred": 0, "important": 0, "sensitive": 0}
+    # Each list page is fetched, classified and buffered before the next page is requested
+    for page in iter_message_id_pages(service, user_id, query, limit):
+        count += len(page)
+        metas = get_messages_metadata(service, user_id, page, cache=cache, compact=True, **pool)
+        actions = plan_actions(
+            metas,
+            skip_starred=skip_starred,
+            skip_sensitive=skip_sensitive,
+            mark_important_star=mark_important_star,
+            matcher=matcher,
+        )
+        if actions["to_label"] and label_id is None:
+            label_id = ensure_label(service, user_id, important_label)
+        for op in fuse_ops(action_intents(actions, label_id)):
+            _buffer(op).add(op["ids"])
+        for key, n in actions["skipped"].items():
+            skipped[key] += n
+
+    # Leftover label changes go out before the final trash chunk
+    for (add, _), buf in sorted(buffers.items(), key=lambda kv: "TRASH" in kv[0][0]):
+        buf.flush()
+    moved = sum(buf.total for (add, _), buf in buffers.items() if "TRASH" in add)
+    return {"count": count, "moved": moved, "skipped": skipped}
+
+
+def pushdown_trash(
+    service,
+    user_id: str,
+    query: str,
+    *,
+    skip_starred: bool = True,
+    skip_sensitive: bool = True,
+    mark_important_star: bool = True,
+    important_label: str = "AGM-Important",
+    workers: int = 1,
+    service_factory: Callable[[], object] | None = None,
+    cache=None,
+    matcher: KeywordMatcher | None = None,
+) -> dict:
+    pool = {"workers": workers, "service_factory": service_factory}
+    plan = build_pushdown(
+        query,
+        skip_starred=skip_starred,
+        skip_important=True,
+        skip_sensitive=skip_sensitive,
+        sensitive_keywords=(matcher or DEFAULT_MATCHER).keywords,
+        mark_important_star=mark_important_star,
+    )
+    # Gmail applies the exclusions; only ID lists come back
+    candidates = search_message_ids(service, user_id, plan.trash_query)
+    flagged = search_message_ids(service, user_id, plan.flagged_query)
+    to_star = search_message_ids(service, user_id, plan.star_query) if plan.star_query else []
+
+    trash_ids = candidates
+    fetched = 0
+    if plan.residual_keywords and candidates:
+        # Keywords Gmail cannot match (e.g. CJK) still need the local check
+        metas = get_messages_metadata(service, user_id, candidates, cache=cache, compact=True, **pool)
+        fetched = len(metas)
+        res = classify_for_trash(
+            metas,
+            skip_starred=False,
+            skip_important=False,
+            skip_sensitive=skip_sensitive,
+            matcher=KeywordMatcher(plan.residual_keywords),
+        )
+        trash_ids = res["trash_ids"]
+        seen = set(flagged)
+        flagged = flagged + [mid for mid in res["sensitive"] if mid not in seen]
+
+    label_id = ensure_label(service, user_id, important_label) if flagged else None
+    moved = 0
+    for op in fuse_ops(action_intents({"to_star": to_star, "to_label": flagged, "trash_ids": trash_ids}, label_id)):
+        n = modify_labels_batch(service, user_id, op["ids"], op["add"], op["remove"], **pool)
+        if "TRASH" in op["add"]:
+            moved += n
+    count = len(set(candidates) | set(flagged))
+    return {"count": count, "moved": moved, "skipped": count - moved, "fetched": fetched}
@@ -0,0 +1,239 @@
+from __future__ import annotations
+
+import re
+from dataclasses import dataclass, field
+from typing import Iterable, List, Optional, Sequence, Union
+
+
+class QuerySyntaxError(ValueError):
+    pass
+
+
+@dataclass
+class Term:
+    raw: str
+
+    @property
+    def field(self) -> Optional[str]:
+        m = re.match(r"^([A-Za-z_]+):", self.raw)
+        return m.group(1).lower() if m else None
+
+    @property
+    def value(self) -> str:
+        text = self.raw[len(self.field) + 1 :] if self.field else self.raw
+        if len(text) >= 2 and text[0] == text[-1] == '"':
+            return text[1:-1]
+        if len(text) >= 2 and text[0] == "(" and text[-1] == ")":
+            return text[1:-1]
+        return text
+
+
+@dataclass
+class Not:
+    child: "Node"
+
+
+@dataclass
+class And:
+    children: List["Node"] = field(default_factory=list)
+
+
+@dataclass
+class Or:
+    children: List["Node"] = field(default_factory=list)
+    # Written as {a b} rather than a OR b; kept so rewrites read like the input
+    braces: bool = False
+
+
+Node = Union[Term, Not, And, Or]
+
+_TOKEN = re.compile(
+    r"""
+    \s*(
+        [(){}]
+      | -(?=[^\s])
+      | [A-Za-z_]+:"[^"]*"
+      | [A-Za-z_]+:\([^()]*\)
+      | "[^"]*"
+      | [^\s(){}"]+
+    )
+    """,
+    re.VERBOSE,
+)
+
+
+def tokenize(query: str) -> List[str]:
+    tokens: List[str] = []
+    pos = 0
+    query = query.strip()
+    while pos < len(query):
+        m = _TOKEN.match(query, pos)
+        if not m:
+            raise QuerySyntaxError(f"無法解析查詢：{query[pos:]!r}")
+        tokens.append(m.group(1))
+        pos = m.end()
+        while pos < len(query) and query[pos].isspace():
+            pos += 1
+    return tokens
+
+
+class _Parser:
+    def __init__(self, tokens: Sequence[str]):
+        self.tokens = list(tokens)
+        self.pos = 0
+
+    def peek(self) -> Optional[str]:
+        return self.tokens[self.pos] if self.pos < len(self.tokens) else None
+
+    def take(self) -> str:
+        tok = self.tokens[self.pos]
+        self.pos += 1
+        return tok
+
+    def parse(self) -> Node:
+        node = self.and_expr(stop=None)
+        if self.peek() is not None:
+            raise QuerySyntaxError(f"多餘的符號：{self.peek()}")
+        return node
+
+    def and_expr(self, stop: Optional[str]) -> Node:
+        children: List[Node] = []
+        while self.peek() is not None and self.peek() != stop:
+            if self.peek() == "AND":
+                self.take()
+                continue
+            if self.peek() in (")", "}"):
+                raise QuerySyntaxError(f"未配對的 {self.peek()}")
+            children.append(self.or_expr(stop))
+        return _simplify(And(children))
+
+    def or_expr(self, stop: Optional[str]) -> Node:
+        # OR binds tighter than the implicit AND in Gmail search
+        children = [self.unary(stop)]
+        while self.peek() == "OR":
+            self.take()
+            children.append(self.unary(stop))
+        return children[0] if len(children) == 1 else Or(children)
+
+    def unary(self, stop: Optional[str]) -> Node:
+        tok = self.peek()
+        if tok is None or tok == stop:
+            raise QuerySyntaxError("查詢結尾不完整")
+        if tok == "-":
+            self.take()
+            return Not(self.unary(stop))
+        if tok == "(":
+            self.take()
+            node = self.and_expr(stop=")")
+            self._expect(")")
+            return node
+        if tok == "{":
+            self.take()
+            children: List[Node] = []
+            while self.peek() not in ("}", None):
+                children.append(self.unary(stop="}"))
+            self._expect("}")
+            return children[0] if len(children) == 1 else Or(children, braces=True)
+        if tok in (")", "}", "OR"):
+            raise QuerySyntaxError(f"非預期的 {tok}")
+        return Term(self.take())
+
+    def _expect(self, tok: str) -> None:
+        if self.peek() != tok:
+            raise QuerySyntaxError(f"缺少 {tok}")
+        self.take()
+
+
+def _simplify(node: And) -> Node:
+    flat: List[Node] = []
+    for child in node.children:
+        flat.extend(child.children if isinstance(child, And) else [child])
+    return flat[0] if len(flat) == 1 else And(flat)
+
+
+def parse(query: str) -> Node:
+    return _Parser(tokenize(query)).parse()
+
+
+def to_string(node: Node) -> str:
+    if isinstance(node, Term):
+        return node.raw
+    if isinstance(node, Not):
+        return "-" + _wrapped(node.child)
+    if isinstance(node, Or):
+        if node.braces and all(not isinstance(c, And) for c in node.children):
+            return "{" + " ".join(to_string(c) for c in node.children) + "}"
+        return " OR ".join(_wrapped(c) for c in node.children)
+    return " ".join(_wrapped(c) if isinstance(c, Or) else to_string(c) for c in node.children)
+
+
+def _wrapped(node: Node) -> str:
+    if isinstance(node, Term):
+        return node.raw
+    if isinstance(node, Or) and node.braces:
+        text = to_string(node)
+        # A brace group with an AND member is written as OR and needs parentheses like one
+        if text.startswith("{"):
+            return text
+        return "(" + text + ")"
+    if isinstance(node, And) and not node.children:
+        return "()"
+    return "(" + to_string(node) + ")"
+
+
+def and_all(nodes: Iterable[Node]) -> Node:
+    return _simplify(And(list(nodes)))
+
+
+_PUSHABLE_KEYWORD = re.compile(r"^[a-z0-9][a-z0-9 ]*$")
+
+
+def quote(value: str) -> Term:
+    return Term(f'"{value}"')
+
+
+@dataclass
+class Pushdown:
+    trash_query: str
+    # Messages the local filter would skip, for labelling and counting
+    flagged_query: Optional[str]
+    star_query: Optional[str]
+    # Keywords Gmail search cannot express faithfully; still matched locally
+    residual_keywords: List[str]
+
+
+def build_pushdown(
+    query: str,
+    *,
+    skip_starred: bool = True,
+    skip_important: bool = True,
+    skip_sensitive: bool = True,
+    sensitive_keywords: Sequence[str] = (),
+    mark_important_star: bool = True,
+) -> Pushdown:
+    root = parse(query)
+    exclusions: List[Node] = []
+    flags: List[Node] = [Term("is:starred"), Term("is:important")]
+    residual: List[str] = []
+    if skip_starred:
+        exclusions.append(Not(Term("is:starred")))
+    if skip_important:
+        exclusions.append(Not(Term("is:important")))
+    for kw in sensitive_keywords:
+        kw = kw.strip().lower()
+        # Gmail matches whole words and tokenises CJK unreliably, so only plain
+        # ASCII words and phrases are pushed down
+        if _PUSHABLE_KEYWORD.match(kw):
+            flags.append(quote(kw))
+            if skip_sensitive:
+                exclusions.append(Not(quote(kw)))
+        else:
+            residual.append(kw)
+    flagged = and_all([root, Or(flags, braces=True)])
+    star = and_all([root, Term("is:important"), Not(Term("is:starred"))]) if mark_important_star else None
+    return Pushdown(
+        trash_query=to_string(and_all([root, *exclusions])),
+        flagged_query=to_string(flagged),
+        star_query=to_string(star) if star is not None else None,
+        residual_keywords=residual,
+    )
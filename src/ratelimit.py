@@ -0,0 +1,75 @@
+from __future__ import annotations
+
+import threading
+import time
+from typing import Callable, Optional
+
+
+# Gmail per-user quota units per method
+METHOD_COSTS = {
+    "messages.list": 5,
+    "messages.get": 5,
+    "messages.batchModify": 50,
+    "labels.list": 1,
+    "labels.get": 1,
+    "labels.create": 5,
+    "history.list": 2,
+    "getProfile": 1,
+}
+DEFAULT_UNITS_PER_SEC = 250
+
+
+def method_cost(method: str) -> int:
+    return METHOD_COSTS.get(method, 1)
+
+
+class QuotaLimiter:
+    def __init__(
+        self,
+        units_per_sec: float = DEFAULT_UNITS_PER_SEC,
+        burst: Optional[float] = None,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], None] = time.sleep,
+    ):
+        self.max_rate = float(units_per_sec)
+        self.rate = self.max_rate
+        self.capacity = float(burst if burst is not None else units_per_sec)
+        self._tokens = self.capacity
+        self._clock = clock
+        self._sleep = sleep
+        self._updated = clock()
+        self._blocked_until = 0.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, units: float) -> float:
+        # Reserve under the lock, sleep outside it so other threads can queue behind
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self._tokens -= units
+            wait = max(0.0, self._blocked_until - now)
+            if self._tokens < 0:
+                wait = max(wait, -self._tokens / self.rate)
+        if wait > 0:
+            self._sleep(wait)
+        return wait
+
+    def on_throttle(self, retry_after: Optional[float] = None) -> None:
+        # Multiplicative decrease on 429, and hold all callers until Retry-After passes
+        with self._lock:
+            now = self._clock()
+            self._refill(now)
+            self.rate = max(self.rate / 2, self.max_rate / 20)
+            self._tokens = min(self._tokens, 0.0)
+            if retry_after:
+                self._blocked_until = max(self._blocked_until, now + retry_after)
+
+    def on_success(self) -> None:
+        # Additive increase back toward the configured budget
+        with self._lock:
+            if self.rate < self.max_rate:
+                self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
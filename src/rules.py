@@ -0,0 +1,136 @@
+from __future__ import annotations
+
+import json
+import os
+from dataclasses import dataclass
+from typing import Callable, List, Optional, Sequence
+
+try:
+    from .gmail_ops import get_messages_metadata, search_message_ids
+    from .matcher import KeywordMatcher
+    from .pipeline import plan_actions
+except Exception:  # pragma: no cover - fallback when run as script
+    from gmail_ops import get_messages_metadata, search_message_ids  # type: ignore
+    from matcher import KeywordMatcher  # type: ignore
+    from pipeline import plan_actions  # type: ignore
+
+
+class RulesError(ValueError):
+    pass
+
+
+@dataclass
+class Rule:
+    name: str
+    query: str
+    skip_starred: bool = True
+    skip_sensitive: bool = True
+    mark_important_star: bool = True
+    limit: Optional[int] = None
+
+
+_OPTIONS = {"skip_starred": bool, "skip_sensitive": bool, "mark_important_star": bool, "limit": int}
+
+
+def _valid(kind: type, value) -> bool:
+    if kind is int:
+        # limit may be left unset; bool is an int subclass but never a limit
+        return value is None or isinstance(value, int) and not isinstance(value, bool) and value > 0
+    return isinstance(value, kind)
+
+
+def parse_rules(data) -> List[Rule]:
+    # Either a bare list of rules or {"defaults": {...}, "rules": [...]}
+    defaults: dict = {}
+    if isinstance(data, dict):
+        defaults = data.get("defaults") or {}
+        data = data.get("rules")
+    if not isinstance(data, list) or not data:
+        raise RulesError("規則檔需包含非空的 rules 清單")
+    rules: List[Rule] = []
+    names: set = set()
+    for i, raw in enumerate(data, 1):
+        if not isinstance(raw, dict):
+            raise RulesError(f"第 {i} 條規則格式錯誤")
+        merged = {**defaults, **raw}
+        query = str(merged.pop("query", "") or "").strip()
+        if not query:
+            raise RulesError(f"第 {i} 條規則缺少 query")
+        name = str(merged.pop("name", "") or f"rule{i}")
+        if name in names:
+            raise RulesError(f"規則名稱重複：{name}")
+        names.add(name)
+        options = {}
+        for key, value in merged.items():
+            kind = _OPTIONS.get(key)
+            if kind is None:
+                raise RulesError(f"規則 {name} 含未知選項：{key}")
+            if not _valid(kind, value):
+                raise RulesError(f"規則 {name} 的 {key} 型別錯誤")
+            options[key] = value
+        rules.append(Rule(name=name, query=query, **options))
+    return rules
+
+
+def load_rules(path: str) -> List[Rule]:
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if os.path.splitext(path)[1].lower() in (".yaml", ".yml"):
+        # Optional dependency, only for YAML rule files
+        try:
+            import yaml
+        except ImportError:
+            raise RulesError("讀取 YAML 規則檔需安裝 PyYAML（pip install pyyaml），或改用 JSON") from None
+        try:
+            data = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            raise RulesError(f"YAML 解析失敗：{e}") from None
+    else:
+        try:
+            data = json.loads(text)
+        except ValueError as e:
+            raise RulesError(f"JSON 解析失敗：{e}") from None
+    return parse_rules(data)
+
+
+def _union(lists: Sequence[Sequence[str]]) -> List[str]:
+    return list(dict.fromkeys(mid for ids in lists for mid in ids))
+
+
+def plan_rules(
+    service,
+    user_id: str,
+    rules: Sequence[Rule],
+    *,
+    fetch: bool = True,
+    workers: int = 1,
+    service_factory: Callable[[], object] | None = None,
+    cache=None,
+    matcher: KeywordMatcher | None = None,
+) -> dict:
+    pool = {"workers": workers, "service_factory": service_factory}
+    matched = {rule.name: search_message_ids(service, user_id, rule.query, rule.limit) for rule in rules}
+    unique = _union(list(matched.values()))
+    reports = [{"name": rule.name, "query": rule.query, "matched": len(matched[rule.name])} for rule in rules]
+    plan = {"rules": reports, "count": len(unique), "fetched": 0}
+    if not fetch:
+        return plan
+
+    # Messages matched by several rules are fetched once
+    store = get_messages_metadata(service, user_id, unique, cache=cache, compact=True, **pool)
+    plan["fetched"] = len(store)
+    per_rule = []
+    for rule, report in zip(rules, reports):
+        actions = plan_actions(
+            store.subset(matched[rule.name]),
+            skip_starred=rule.skip_starred,
+            skip_sensitive=rule.skip_sensitive,
+            mark_important_star=rule.mark_important_star,
+            matcher=matcher,
+        )
+        report["skipped"] = actions["skipped"]
+        report["trash"] = len(actions["trash_ids"])
+        per_rule.append(actions)
+    # Any rule may trash a message, star it or flag it; fuse_ops later merges the overlaps
+    plan["actions"] = {key: _union([a[key] for a in per_rule]) for key in ("to_star", "to_label", "trash_ids")}
+    return plan
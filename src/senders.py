@@ -0,0 +1,199 @@
+from __future__ import annotations
+
+import heapq
+from collections import Counter
+from email.utils import getaddresses
+from typing import Iterable, List, Optional
+
+try:
+    from .meta_store import MetaStore
+except Exception:  # pragma: no cover - fallback when run as script
+    from meta_store import MetaStore  # type: ignore
+
+
+GROUP_BY = ("sender", "domain", "registrable")
+# Top-K mode tracks this many candidates per requested row; distinct senders beyond that are evicted
+CAPACITY_PER_ROW = 20
+MIN_CAPACITY = 200
+# Parsed From headers kept for reuse in top-K mode; exact mode keeps all of them
+_MEMO_LIMIT = 10_000
+_MISSING = object()
+
+# Second-level public suffixes common in bulk mail. Not the full Public Suffix List,
+# just enough that shop.co.uk and news.com.tw roll up to their owner
+MULTI_LABEL_SUFFIXES = frozenset(
+    f"{sld}.{tld}"
+    for tld, slds in {
+        "uk": ("co", "org", "ac", "gov", "me", "ltd", "plc", "net", "sch"),
+        "tw": ("com", "org", "net", "edu", "gov", "idv", "mil"),
+        "hk": ("com", "org", "net", "edu", "gov", "idv"),
+        "cn": ("com", "org", "net", "edu", "gov", "ac"),
+        "jp": ("co", "ne", "or", "ac", "go", "ad", "ed", "gr", "lg"),
+        "kr": ("co", "or", "ne", "ac", "go", "re"),
+        "au": ("com", "net", "org", "edu", "gov", "asn", "id"),
+        "nz": ("co", "org", "net", "ac", "govt", "school"),
+        "sg": ("com", "org", "net", "edu", "gov"),
+        "my": ("com", "org", "net", "edu", "gov"),
+        "in": ("co", "org", "net", "ac", "gov", "firm", "gen", "ind"),
+        "br": ("com", "org", "net", "gov", "edu"),
+        "mx": ("com", "org", "net", "gob", "edu"),
+        "za": ("co", "org", "net", "gov", "ac"),
+        "th": ("co", "or", "in", "ac", "go"),
+        "id": ("co", "or", "web", "ac", "go"),
+        "ph": ("com", "org", "net", "edu", "gov"),
+        "vn": ("com", "org", "net", "edu", "gov"),
+        "tr": ("com", "org", "net", "edu", "gov"),
+        "ar": ("com", "org", "net", "gob", "edu"),
+    }.items()
+    for sld in slds
+)
+
+
+def sender_address(raw: str) -> Optional[str]:
+    addrs = getaddresses([raw])
+    if not addrs:
+        return None
+    email_addr = addrs[0][1]
+    return email_addr.lower() if email_addr else None
+
+
+def sender_domain(address: str) -> Optional[str]:
+    _, at, domain = address.rpartition("@")
+    domain = domain.strip(".")
+    return domain if at and domain else None
+
+
+def registrable_domain(domain: str) -> str:
+    labels = domain.split(".")
+    if len(labels) > 2 and ".".join(labels[-2:]) in MULTI_LABEL_SUFFIXES:
+        return ".".join(labels[-3:])
+    return ".".join(labels[-2:])
+
+
+def group_key(raw: str, group_by: str = "sender") -> Optional[str]:
+    address = sender_address(raw)
+    if address is None or group_by == "sender":
+        return address
+    domain = sender_domain(address)
+    if domain is None or group_by == "domain":
+        return domain
+    return registrable_domain(domain)
+
+
+class ExactCounter:
+    exact = True
+
+    def __init__(self):
+        self.counts: Counter = Counter()
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    def add(self, key: str, n: int = 1) -> None:
+        self.counts[key] += n
+
+    def top(self, n: Optional[int] = None) -> List[tuple[str, int, int]]:
+        # (key, count, possible overcount); never any overcount here
+        rows = sorted(self.counts.items(), key=lambda x: (-x[1], x[0]))
+        return [(key, count, 0) for key, count in rows[:n]]
+
+
+class SpaceSaving:
+    # Metwally et al.'s Space-Saving: at most `capacity` counters, and every key with more
+    # than total/capacity occurrences is guaranteed to hold one
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.counts: dict = {}
+        self.errors: dict = {}
+        # (count, key) entries; stale ones are skipped on pop and the heap rebuilt when it bloats
+        self._heap: list = []
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self.counts)
+
+    @property
+    def exact(self) -> bool:
+        return self.evicted == 0
+
+    def add(self, key: str, n: int = 1) -> None:
+        counts = self.counts
+        if key in counts:
+            counts[key] += n
+        elif len(counts) < self.capacity:
+            counts[key] = n
+            self.errors[key] = 0
+        else:
+            floor, victim = self._pop_min()
+            del counts[victim], self.errors[victim]
+            self.evicted += 1
+            # The newcomer inherits the evicted count as its possible overcount
+            counts[key] = floor + n
+            self.errors[key] = floor
+        heapq.heappush(self._heap, (counts[key], key))
+        if len(self._heap) > 4 * self.capacity:
+            self._heap = [(c, k) for k, c in counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self) -> tuple[int, str]:
+        while True:
+            count, key = heapq.heappop(self._heap)
+            if self.counts.get(key) == count:
+                return count, key
+
+    def top(self, n: Optional[int] = None) -> List[tuple[str, int, int]]:
+        rows = sorted(self.counts.items(), key=lambda x: (-x[1], x[0]))
+        return [(key, count, self.errors[key]) for key, count in rows[:n]]
+
+
+class SenderStats:
+    # Streaming sender counts: feed metadata page by page, read the current top rows at any time
+    def __init__(self, group_by: str = "sender", top: Optional[int] = None, capacity: Optional[int] = None):
+        if group_by not in GROUP_BY:
+            raise ValueError(f"unknown group_by: {group_by}")
+        self.group_by = group_by
+        self.limit = top
+        if top is None:
+            self.counter = ExactCounter()
+        else:
+            self.counter = SpaceSaving(capacity or max(MIN_CAPACITY, CAPACITY_PER_ROW * top))
+        self.messages = 0
+        # Senders repeat heavily, so each distinct From header is parsed once
+        self._keys: dict = {}
+
+    def add(self, raw: Optional[str], n: int = 1) -> None:
+        self.messages += n
+        if not raw:
+            return
+        key = self._keys.get(raw, _MISSING)
+        if key is _MISSING:
+            key = group_key(raw, self.group_by)
+            if self.limit is not None and len(self._keys) >= _MEMO_LIMIT:
+                self._keys.clear()
+            self._keys[raw] = key
+        if key:
+            self.counter.add(key, n)
+
+    def consume(self, metas: Iterable[dict] | MetaStore) -> "SenderStats":
+        if isinstance(metas, MetaStore):
+            for rec in metas:
+                self.add(rec.sender)
+            return self
+        for meta in metas:
+            raw = None
+            for h in meta.get("payload", {}).get("headers", []):
+                if h.get("name", "").lower() == "from":
+                    raw = h.get("value")
+                    break
+            self.add(raw)
+        return self
+
+    @property
+    def exact(self) -> bool:
+        return self.counter.exact
+
+    def top(self, n: Optional[int] = None) -> List[tuple[str, int, int]]:
+        return self.counter.top(n if n is not None else self.limit)
+
+    def pairs(self) -> List[tuple[str, int]]:
+        return [(key, count) for key, count, _ in self.top()]
@@ -0,0 +1,138 @@
+from __future__ import annotations
+
+import contextlib
+import json
+import threading
+import time
+from collections import Counter, defaultdict
+from typing import Iterator, Optional
+
+try:
+    from .ratelimit import method_cost
+except Exception:  # pragma: no cover - fallback when run as script
+    from ratelimit import method_cost  # type: ignore
+
+
+# Upper bounds in milliseconds; the last bucket catches everything slower
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+
+
+class MethodStats:
+    def __init__(self):
+        self.calls = 0
+        self.items = 0
+        self.units = 0
+        self.errors: Counter = Counter()
+        self.total_s = 0.0
+        self.max_s = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS_MS)
+
+    def percentile_ms(self, q: float) -> float:
+        # Upper bound of the bucket holding the q-th call; coarse but allocation-free
+        if not self.calls:
+            return 0.0
+        rank = q * self.calls
+        seen = 0
+        for bound, n in zip(LATENCY_BUCKETS_MS, self.buckets):
+            seen += n
+            if seen >= rank:
+                return min(bound, self.max_s * 1000)
+        return self.max_s * 1000
+
+    def as_dict(self) -> dict:
+        return {
+            "calls": self.calls,
+            "items": self.items,
+            "units": self.units,
+            "errors": {str(k): v for k, v in sorted(self.errors.items(), key=lambda kv: str(kv[0]))},
+            "latency_ms": {
+                "mean": round(self.total_s * 1000 / self.calls, 1) if self.calls else 0.0,
+                "p50": round(self.percentile_ms(0.5), 1),
+                "p95": round(self.percentile_ms(0.95), 1),
+                "max": round(self.max_s * 1000, 1),
+                "buckets": {("inf" if b == float("inf") else str(b)): n for b, n in zip(LATENCY_BUCKETS_MS, self.buckets)},
+            },
+        }
+
+
+class RunStats:
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.started = clock()
+        self.phases: dict = {}
+        self.methods: dict = defaultdict(MethodStats)
+        self.retries: Counter = Counter()
+        self.backoff_s = 0.0
+
+    @contextlib.contextmanager
+    def phase(self, name: str) -> Iterator[None]:
+        started = self._clock()
+        try:
+            yield
+        finally:
+            self.phases[name] = self.phases.get(name, 0.0) + self._clock() - started
+
+    def record_call(self, method: str, count: int, elapsed: float, status: Optional[int] = None) -> None:
+        with self._lock:
+            m = self.methods[method]
+            m.calls += 1
+            m.items += count
+            m.units += method_cost(method) * count
+            m.total_s += elapsed
+            m.max_s = max(m.max_s, elapsed)
+            ms = elapsed * 1000
+            for i, bound in enumerate(LATENCY_BUCKETS_MS):
+                if ms <= bound:
+                    m.buckets[i] += 1
+                    break
+            if status is not None:
+                m.errors[status] += 1
+
+    def record_error(self, method: str, status: Optional[int]) -> None:
+        # A failed part inside a batch that itself succeeded
+        with self._lock:
+            self.methods[method].errors[status] += 1
+
+    def record_retry(self, name: str, sleep_s: float) -> None:
+        with self._lock:
+            self.retries[name] += 1
+            self.backoff_s += sleep_s
+
+    def as_dict(self) -> dict:
+        return {
+            "total_s": round(self._clock() - self.started, 4),
+            "phases_s": {k: round(v, 4) for k, v in self.phases.items()},
+            "methods": {k: v.as_dict() for k, v in sorted(self.methods.items())},
+            "units": sum(m.units for m in self.methods.values()),
+            "retries": dict(self.retries),
+            "backoff_s": round(self.backoff_s, 3),
+        }
+
+    def write_json(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.as_dict(), f, ensure_ascii=False, indent=2)
+            f.write("\n")
+
+    def format(self) -> str:
+        d = self.as_dict()
+        lines = [f"統計：總耗時 {d['total_s']:.2f}s，配額單位 {d['units']}"]
+        if d["phases_s"]:
+            lines.append("  階段：" + "，".join(f"{k} {v:.2f}s" for k, v in d["phases_s"].items()))
+        for name, m in d["methods"].items():
+            line = f"  {name}：呼叫 {m['calls']}（項目 {m['items']}），單位 {m['units']}，延遲 p50 {m['latency_ms']['p50']:.0f}ms / p95 {m['latency_ms']['p95']:.0f}ms"
+            if m["errors"]:
+                line += "，錯誤 " + "、".join(f"{k}×{v}" for k, v in m["errors"].items())
+            lines.append(line)
+        if d["retries"]:
+            lines.append(f"  重試 {sum(d['retries'].values())} 次，退避 {d['backoff_s']:.1f}s")
+        return "\n".join(lines)
+
+
+class _NullStats:
+    # Stand-in when --stats is off: phases cost one no-op context manager each
+    def phase(self, name: str):
+        return contextlib.nullcontext()
+
+
+NULL_STATS = _NullStats()
@@ -1,18 +1,25 @@
 import logging
 import os
+import sys
 from typing import Optional
 
-try:
-    # Imported only for typing/error detection; module may not be installed during tests.
-    from googleapiclient.errors import HttpError  # type: ignore
-except Exception:  # pragma: no cover - optional at runtime
-    HttpError = None  # type: ignore
+
+class _StderrHandler(logging.StreamHandler):
+    # Resolves sys.stderr per record: the daemon and the account workers redirect it per
+    # request, and a handler holding the first request's stream would write to a closed one
+    @property
+    def stream(self):
+        return sys.stderr
+
+    @stream.setter
+    def stream(self, value):
+        pass
 
 
 def setup_logger(level: str = "INFO") -> logging.Logger:
     logger = logging.getLogger("gmail_trash_mover")
     if not logger.handlers:
-        handler = logging.StreamHandler()
+        handler = _StderrHandler()
         fmt = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
         handler.setFormatter(fmt)
         logger.addHandler(handler)
@@ -20,18 +27,35 @@ def setup_logger(level: str = "INFO") -> logging.Logger:
     return logger
 
 
-def is_retryable(error: Exception) -> bool:
-    # Retry Google API HttpError with 429/500/503
-    if HttpError is not None and isinstance(error, HttpError):  # type: ignore
+def http_status(error: Exception) -> Optional[int]:
+    # An HttpError can only exist once googleapiclient is loaded, so don't import it just to check
+    errors = sys.modules.get("googleapiclient.errors")
+    if errors is not None and isinstance(error, errors.HttpError):
         try:
-            status = int(getattr(error, "status_code", None) or error.resp.status)  # type: ignore
+            return int(getattr(error, "status_code", None) or error.resp.status)  # type: ignore
         except Exception:
-            return False
-        return status in (429, 500, 503)
-    return False
+            return None
+    return None
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    resp = getattr(error, "resp", None)
+    if resp is None:
+        return None
+    try:
+        return float(resp.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
 
 
-def format_summary(count: int, moved: Optional[int] = None, limited: Optional[int] = None, dry: bool = False) -> str:
+def is_retryable(error: Exception) -> bool:
+    # Retry Google API HttpError with 429/500/503
+    return http_status(error) in (429, 500, 503)
+
+
+def format_summary(count: int, moved: Optional[int] = None, limited: Optional[int] = None, dry: bool = False, estimated: bool = False) -> str:
+    if dry and estimated:
+        return f"乾跑：命中約 {count} 封（估計），示例："
     if dry:
         return f"乾跑：命中 {count} 封，示例："
     moved_display = moved if moved is not None else 0
@@ -52,3 +76,9 @@ def resolve_paths(credentials_path: Optional[str], token_path: Optional[str]) ->
     if not tok:
         tok = os.path.join(cfg_dir or "data", "token.json")
     return cred, tok
+
+
+def resolve_config_path(name: str, token_path: Optional[str] = None) -> str:
+    # Local state lives next to token.json (CONFIG_DIR by default)
+    _, tok = resolve_paths(None, token_path)
+    return os.path.join(os.path.dirname(tok) or ".", name)
@@ -0,0 +1,103 @@
+import contextlib
+import functools
+import io
+import json
+import multiprocessing
+import os
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from benchmarks.fake_gmail import FakeGmail
+from src import accounts, gmail_trash
+from src.accounts import AccountsError, load_accounts, select_accounts
+
+from test_stats import run_main
+
+
+class AccountsConfigTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.path = os.path.join(self.dir, "accounts.json")
+
+    def write(self, data):
+        with open(self.path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+
+    def test_paths_resolve_against_config_file(self):
+        self.write({"accounts": {"work": "work/token.json", "home": {"token_path": "/abs/token.json", "credentials_path": "home/cred.json"}}})
+        loaded = load_accounts(self.path)
+        self.assertEqual(loaded["work"], {"token_path": os.path.join(self.dir, "work/token.json")})
+        self.assertEqual(loaded["home"], {"token_path": "/abs/token.json", "credentials_path": os.path.join(self.dir, "home/cred.json")})
+        self.assertEqual(list(select_accounts(loaded, ["home", "home"])), ["home"])
+        with self.assertRaises(AccountsError):
+            select_accounts(loaded, ["nope"])
+
+    def test_invalid_config(self):
+        for data in (
+            {},
+            {"accounts": {}},
+            {"accounts": {"a": {"credentials_path": "c"}}},
+            # Two tokens in one directory would share its label cache and journals
+            {"accounts": {"a": "tokens/a.json", "b": {"token_path": "tokens/../tokens/b.json"}}},
+        ):
+            self.write(data)
+            with self.assertRaises(AccountsError):
+                load_accounts(self.path)
+
+    def test_account_argv_drops_runner_options(self):
+        argv = ["--query", "q", "--accounts", "a,b", "--accounts-file=x.json", "--account-processes", "2", "--use-daemon", "--all-accounts", "--dry-run"]
+        self.assertEqual(gmail_trash._account_argv(argv), ["--query", "q", "--dry-run"])
+
+
+class RunAccountsTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.dir = tmp.name
+        self.config = os.path.join(self.dir, "accounts.json")
+        with open(self.config, "w", encoding="utf-8") as f:
+            json.dump({"accounts": {name: f"{name}/token.json" for name in ("a", "b", "broken")}}, f)
+
+    def build_service(self, creds, discovery_path):
+        # Each account's discovery cache sits next to its token, which tells the accounts apart
+        account = os.path.basename(os.path.dirname(discovery_path))
+        if account == "broken":
+            raise RuntimeError("token revoked")
+        return FakeGmail(2000, seed=ord(account), latency=0.1)
+
+    def test_accounts_run_in_parallel_and_fail_independently(self):
+        # Forked workers inherit the patched auth functions
+        fork = functools.partial(accounts.run_accounts, mp_context=multiprocessing.get_context("fork"))
+        argv = ["--query", "category:promotions", "--quota-units", "0", "--all-accounts", "--accounts-file", self.config]
+        out = io.StringIO()
+        started = time.perf_counter()
+        with mock.patch.object(gmail_trash, "run_accounts", fork), mock.patch.object(
+            gmail_trash, "get_credentials", return_value=object()
+        ), mock.patch.object(gmail_trash, "build_service", side_effect=self.build_service), mock.patch.object(
+            gmail_trash, "load_dotenv"
+        ), contextlib.redirect_stdout(out):
+            code = gmail_trash.main(argv)
+        wall = time.perf_counter() - started
+        out = out.getvalue()
+        self.assertEqual(code, gmail_trash.EXIT_AUTH_ERROR)
+        self.assertIn("帳號 a：成功", out)
+        self.assertIn("帳號 b：成功", out)
+        self.assertIn("帳號 broken：失敗（結束碼 2）", out)
+        self.assertIn("認證失敗：token revoked", out)
+        self.assertIn("合計：3 個帳號，成功 2、失敗 1", out)
+        self.assertEqual(out.count("已搬移至垃圾桶"), 2)
+        elapsed = [float(line.rsplit("，", 1)[1].rstrip("s")) for line in out.splitlines() if line.startswith("帳號 ")]
+        self.assertLess(wall, sum(elapsed))
+
+    def test_rejects_token_path(self):
+        code, _, err = run_main(None, ["--query", "q", "--accounts", "a", "--token-path", "t.json"])
+        self.assertEqual(code, gmail_trash.EXIT_INPUT_ERROR)
+        self.assertIn("--token-path", err)
+
+
+if __name__ == "__main__":
+    unittest.main()
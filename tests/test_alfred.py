@@ -0,0 +1,203 @@
+import contextlib
+import io
+import json
+import os
+import subprocess
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks.fake_gmail import FakeGmail
+from src import gmail_trash
+from src.alfred import PREVIEW_PAGE, RERUN_SECONDS, Inflight, PreviewCache, refresh, script_filter
+from src.local_index import LocalIndex
+
+from test_stats import run_main
+
+
+class PreviewCacheTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.now = 1000.0
+        self.cache = PreviewCache(os.path.join(tmp.name, "previews.json"), ttl=60, clock=lambda: self.now)
+
+    def test_ttl(self):
+        self.cache.put("from:shop", {"count": 1})
+        self.now += 59
+        self.assertEqual(self.cache.get("from:shop"), {"count": 1})
+        self.now += 1
+        self.assertIsNone(self.cache.get("from:shop"))
+
+    def test_nearest_prefers_longest_prefix(self):
+        for query in ("from:s", "from:sho", "from:shop older_than:1y", "from:shop older_than:1y is:unread"):
+            self.cache.put(query, {"count": len(query)})
+        self.cache.put("from:shop o", {"error": "boom"})
+        self.assertEqual(self.cache.nearest("from:shop o")[0], "from:sho")
+        # After a backspace, the closest longer query stands in
+        self.assertEqual(self.cache.nearest("from:shop ")[0], "from:sho")
+        self.assertEqual(self.cache.nearest("from:shop older")[0], "from:sho")
+        self.assertEqual(self.cache.nearest("fr")[0], "from:s")
+        self.assertIsNone(self.cache.nearest("subject:x"))
+
+
+class ScriptFilterTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache = PreviewCache(os.path.join(tmp.name, "previews.json"))
+        self.inflight = Inflight(os.path.join(tmp.name, "inflight.json"))
+        self.spawned = []
+
+    def worker(self):
+        # Stands in for the background lookup: alive until the test or a newer keystroke ends it
+        proc = subprocess.Popen(["sleep", "30"])
+        self.addCleanup(proc.wait)
+        self.addCleanup(proc.kill)
+        self.spawned.append(proc)
+        return proc.pid
+
+    def run_filter(self, query, **kwargs):
+        return script_filter(query, self.cache, self.inflight, self.worker, **kwargs)
+
+    def test_miss_spawns_once_and_reruns(self):
+        out = self.run_filter("category:promotions")
+        self.assertEqual(out["rerun"], RERUN_SECONDS)
+        self.assertEqual(out["items"][0]["title"], "查詢中…")
+        self.assertEqual(len(self.spawned), 1)
+        # Alfred's rerun while the worker is still busy
+        self.run_filter("category:promotions ")
+        self.assertEqual(len(self.spawned), 1)
+        self.assertEqual(self.inflight.read(), {"query": "category:promotions", "pid": self.spawned[0].pid})
+
+    def test_newer_query_cancels_stale_worker(self):
+        self.run_filter("from:sh")
+        self.run_filter("from:shop")
+        self.assertEqual(self.spawned[0].wait(5), -15)
+        self.assertIsNone(self.spawned[1].poll())
+        self.assertEqual(self.inflight.read()["query"], "from:shop")
+
+    def test_worker_result_replaces_placeholder(self):
+        backend = FakeGmail(1500, seed=2)
+        query = "category:promotions"
+        self.run_filter(query)
+        result = refresh(backend, "me", query, self.cache, self.inflight)
+        self.assertIsNone(self.inflight.read())
+        self.assertEqual(backend.calls["messages.list"], 1)
+
+        out = self.run_filter(query)
+        self.assertNotIn("rerun", out)
+        self.assertEqual(len(self.spawned), 1)
+        header, *rest = out["items"]
+        self.assertEqual(header["title"], f"命中約 {result['count']} 封")
+        self.assertEqual((header["arg"], header["valid"]), (query, True))
+        sender_items = [item for item in rest if "autocomplete" in item]
+        self.assertTrue(sender_items)
+        self.assertTrue(all(item["autocomplete"].startswith(f"{query} from:") for item in sender_items))
+        self.assertLessEqual(sum(n for _, n in result["senders"]), PREVIEW_PAGE)
+        self.assertEqual(len(rest) - len(sender_items), 3)
+
+        # The next keystroke shows this result while its own lookup runs
+        out = self.run_filter(f"{query} older_than:1y")
+        self.assertEqual(out["items"][0]["title"], header["title"])
+        self.assertIn(f"暫列「{query}」", out["items"][0]["subtitle"])
+        self.assertFalse(out["items"][0]["valid"])
+
+    def test_superseded_worker_skips_metadata(self):
+        backend = FakeGmail(500, seed=2)
+        self.inflight.start("from:shop", os.getpid())
+        self.assertIsNone(refresh(backend, "me", "from:sh", self.cache, self.inflight))
+        self.assertNotIn("messages.get", backend.calls)
+        self.assertIsNone(self.cache.get("from:sh"))
+        self.assertEqual(self.inflight.read()["query"], "from:shop")
+
+    def test_local_index_answers_in_place(self):
+        backend = FakeGmail(800, seed=6)
+        # Off the hour, so the older_than: cutoff never lands on a message while the clock ticks
+        for m in backend.messages.values():
+            m["internalDate"] = str(int(m["internalDate"]) - 1_800_000)
+        index = LocalIndex(os.path.join(os.path.dirname(self.cache.path), "index.sqlite3"))
+        self.addCleanup(index.close)
+        index.sync(backend, "me")
+        query = "from:news older_than:30d"
+        ids = [m["id"] for m in backend.list_page(query, None, 10**6)["messages"]]
+        out = self.run_filter(query, local=index)
+        self.assertEqual(out["items"][0]["title"], f"命中 {len(ids)} 封")
+        self.assertNotIn("rerun", out)
+        # Beyond the index, Gmail answers instead
+        out = self.run_filter("has:attachment", local=index)
+        self.assertIn("rerun", out)
+        self.assertEqual(len(self.spawned), 1)
+
+
+class AlfredModeTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.backend = FakeGmail(600, seed=8)
+        self.argv = ["--alfred-json", "--query", "from:bank", "--quota-units", "0", "--token-path", os.path.join(tmp.name, "token.json")]
+
+    def foreground(self, pid=None):
+        out = io.StringIO()
+        popen = mock.Mock(return_value=mock.Mock(pid=pid or os.getpid()))
+        with mock.patch.object(gmail_trash, "get_credentials", side_effect=AssertionError("no auth on keystrokes")), mock.patch.object(
+            gmail_trash.subprocess, "Popen", popen
+        ), contextlib.redirect_stdout(out):
+            code = gmail_trash.main(self.argv)
+        self.assertEqual(code, 0)
+        return json.loads(out.getvalue()), popen
+
+    def test_foreground_then_worker(self):
+        out, popen = self.foreground()
+        self.assertIn("rerun", out)
+        worker_argv = popen.call_args.args[0]
+        self.assertEqual(worker_argv[-1], "--alfred-refresh")
+        self.assertTrue(worker_argv[1].endswith("gmail_trash.py"))
+
+        code, stdout, _ = run_main(self.backend, worker_argv[2:])
+        self.assertEqual((code, stdout), (0, ""))
+        self.assertNotIn("TRASH", {lid for m in self.backend.messages.values() for lid in m["labelIds"]})
+
+        out, popen = self.foreground()
+        popen.assert_not_called()
+        self.assertNotIn("rerun", out)
+        expected = len(self.backend.list_page("from:bank", None, 10**6)["messages"])
+        # More than one page matched, so the count is Gmail's estimate
+        self.assertGreater(expected, PREVIEW_PAGE)
+        self.assertEqual(out["items"][0]["title"], f"命中約 {expected} 封")
+
+    def test_superseded_worker_does_nothing(self):
+        stale = subprocess.Popen(["sleep", "30"])
+        self.addCleanup(stale.wait)
+        self.addCleanup(stale.kill)
+        _, popen = self.foreground(stale.pid)
+        self.argv[self.argv.index("from:bank")] = "from:bank older_than:1y"
+        self.foreground()
+        # The first lookup only gets its turn now, as it would queued in the daemon
+        self.backend.reset_counters()
+        code, _, _ = run_main(self.backend, popen.call_args.args[0][2:])
+        self.assertEqual(code, 0)
+        self.assertEqual(sum(self.backend.calls.values()), 0)
+
+    def test_worker_failure_is_shown_not_retried(self):
+        _, popen = self.foreground()
+        with mock.patch.object(gmail_trash, "get_credentials", side_effect=FileNotFoundError("token.json")), contextlib.redirect_stderr(
+            io.StringIO()
+        ):
+            code = gmail_trash.main(popen.call_args.args[0][2:])
+        self.assertEqual(code, 2)
+        out, popen = self.foreground()
+        popen.assert_not_called()
+        self.assertEqual(out["items"][0]["title"], "查詢失敗")
+        self.assertIn("token.json", out["items"][0]["subtitle"])
+
+    def test_empty_query_prompts(self):
+        self.argv[self.argv.index("from:bank")] = " "
+        out, popen = self.foreground()
+        popen.assert_not_called()
+        self.assertEqual(len(out["items"]), 1)
+        self.assertFalse(out["items"][0]["valid"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,87 @@
+import asyncio
+import unittest
+
+import httplib2
+from googleapiclient.discovery import build_from_document
+
+from benchmarks.fake_gmail import FakeGmail
+from benchmarks.stub_server import StubGmailServer, discovery_for
+from src import gmail_ops
+from src.util import http_status
+
+try:
+    import httpx
+except ImportError:  # pragma: no cover - optional dependency
+    httpx = None
+
+if httpx is not None:
+    from src.async_client import AsyncGmailClient, SyncGmailService
+
+
+@unittest.skipIf(httpx is None, "httpx not installed")
+class AsyncClientTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = FakeGmail(1200, seed=1)
+        self.stub = StubGmailServer(self.backend).__enter__()
+        self.addCleanup(self.stub.__exit__, None, None, None)
+
+    def test_coroutines_against_stub(self):
+        expected = [m["id"] for m in self.backend.list_page("category:promotions", None, 10**6)["messages"]]
+
+        async def scenario():
+            async with AsyncGmailClient(root_url=self.stub.root_url, concurrency=4) as client:
+                ids = await client.search_message_ids("me", "category:promotions", page_size=100)
+                metas = await client.get_messages("me", ids[:20])
+                moved = await client.batch_modify("me", ids[:5])
+                return ids, metas, moved
+
+        ids, metas, moved = asyncio.run(scenario())
+        self.assertEqual(ids, expected)
+        self.assertEqual([m["id"] for m in metas], ids[:20])
+        self.assertEqual(moved, 5)
+        self.assertIn("TRASH", self.backend.messages[ids[0]]["labelIds"])
+        self.assertGreater(self.backend.calls["messages.list"], 1)
+
+    def test_facade_matches_googleapiclient(self):
+        sync = build_from_document(discovery_for(self.stub.root_url), http=httplib2.Http())
+        facade = SyncGmailService(lambda: AsyncGmailClient(root_url=self.stub.root_url))
+        self.addCleanup(facade.close)
+        expected_ids = gmail_ops.search_message_ids(sync, "me", "category:promotions")
+        expected = gmail_ops.get_messages_metadata(sync, "me", expected_ids[:150])
+
+        ids = gmail_ops.search_message_ids(facade, "me", "category:promotions")
+        self.assertEqual(ids, expected_ids)
+        self.assertEqual(gmail_ops.get_messages_metadata(facade, "me", ids[:150], workers=3, service_factory=lambda: facade), expected)
+        self.assertEqual(gmail_ops.batch_get_messages(facade, "me", ["missing", ids[0]], skip_missing=True), expected[:1])
+        self.assertEqual(gmail_ops.move_to_trash_batch(facade, "me", ids[:3]), 3)
+        self.assertEqual(gmail_ops.ensure_label(facade, "me", "AGM-Important"), gmail_ops.ensure_label(sync, "me", "AGM-Important"))
+
+
+@unittest.skipIf(httpx is None, "httpx not installed")
+class RetryTest(unittest.TestCase):
+    def client(self, statuses):
+        seen = []
+
+        def handler(request):
+            seen.append(request.url.path)
+            status = statuses.pop(0) if statuses else 200
+            headers = {"retry-after": "0"} if status == 429 else {}
+            return httpx.Response(status, json={} if status == 200 else {"error": {}}, headers=headers)
+
+        return AsyncGmailClient(transport=httpx.MockTransport(handler)), seen
+
+    def test_retries_throttled_then_succeeds(self):
+        client, seen = self.client([429, 429])
+        asyncio.run(client.request("GET", "gmail/v1/users/me/profile"))
+        self.assertEqual(len(seen), 3)
+
+    def test_non_retryable_error_is_an_http_error(self):
+        client, seen = self.client([404])
+        with self.assertRaises(Exception) as ctx:
+            asyncio.run(client.get_message("me", "gone"))
+        self.assertEqual(http_status(ctx.exception), 404)
+        self.assertEqual(len(seen), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+from src import auth
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+class StartupTest(unittest.TestCase):
+    def test_import_does_not_load_google_clients(self):
+        code = (
+            "import sys, src.gmail_trash\n"
+            "heavy = ('googleapiclient', 'google_auth_oauthlib', 'google.oauth2', 'httplib2', 'tenacity')\n"
+            "print(sorted(m for m in sys.modules if m.startswith(heavy)))\n"
+        )
+        out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True)
+        self.assertEqual(out.stdout.strip(), "[]")
+
+
+class DiscoveryTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, auth.DISCOVERY_FILENAME)
+        auth._discovery_docs.clear()
+        self.addCleanup(auth._discovery_docs.clear)
+
+    def test_trimmed_document_is_cached_on_disk(self):
+        doc = auth.load_discovery(self.path)
+        users = doc["resources"]["users"]
+        self.assertEqual(set(users["resources"]), set(auth.DISCOVERY_RESOURCES))
+        self.assertEqual(set(users["methods"]), set(auth.DISCOVERY_METHODS))
+        with open(self.path, "r", encoding="utf-8") as f:
+            self.assertEqual(json.load(f), doc)
+
+        auth._discovery_docs.clear()
+        with mock.patch("googleapiclient.discovery_cache.get_static_doc") as static:
+            self.assertEqual(auth.load_discovery(self.path), doc)
+        static.assert_not_called()
+
+    def test_service_exposes_used_methods(self):
+        from google.oauth2.credentials import Credentials
+
+        svc = auth.build_service(Credentials(token="t"), self.path)
+        req = svc.users().messages().list(userId="me", q="in:inbox")
+        self.assertIn("/users/me/messages", req.uri)
+        self.assertIn("/users/me/profile", svc.users().getProfile(userId="me").uri)
+
+
+class CredentialsTest(unittest.TestCase):
+    def test_valid_token_is_reused_without_refresh_or_rewrite(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            tok = os.path.join(tmp, "token.json")
+            with open(tok, "w", encoding="utf-8") as f:
+                f.write("{}")
+            creds = mock.Mock(valid=True)
+            with mock.patch("google.oauth2.credentials.Credentials.from_authorized_user_file", return_value=creds):
+                self.assertIs(auth.get_credentials(os.path.join(tmp, "missing.json"), tok), creds)
+            creds.refresh.assert_not_called()
+            with open(tok, "r", encoding="utf-8") as f:
+                self.assertEqual(f.read(), "{}")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+
+from src import gmail_ops
+from src.cache import MetadataCache
+
+from test_gmail_ops import FakeHistory, FakeMessages, FakeService
+
+
+class MetadataCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.cache = MetadataCache(os.path.join(self.tmp.name, "cache.sqlite3"))
+        headers = {mid: [{"name": "From", "value": f"{mid}@example.com"}, {"name": "Subject", "value": mid}] for mid in ("m1", "m2", "m3")}
+        self.fm = FakeMessages(pages={}, snippets={"m1": "a", "m2": "b", "m3": "c"}, headers=headers)
+        self.history = FakeHistory()
+        self.svc = FakeService(self.fm, history=self.history)
+
+    def tearDown(self):
+        self.cache.close()
+        self.tmp.cleanup()
+
+    def test_only_misses_hit_network(self):
+        self.cache.sync(self.svc, "me")
+        first = gmail_ops.get_messages_metadata(self.svc, "me", ["m1", "m2"], cache=self.cache)
+        self.assertEqual(self.fm.get_calls, 2)
+        second = gmail_ops.get_messages_metadata(self.svc, "me", ["m2", "m1", "m3"], cache=self.cache)
+        self.assertEqual(self.fm.get_calls, 3)
+        self.assertEqual([m["id"] for m in second], ["m2", "m1", "m3"])
+        self.assertEqual(second[1]["payload"]["headers"], first[0]["payload"]["headers"])
+        # Sender lookups reuse the same cached rows
+        pairs = gmail_ops.count_unique_senders(self.svc, "me", ["m1", "m3"], cache=self.cache)
+        self.assertEqual(self.fm.get_calls, 3)
+        self.assertEqual(pairs, [("m1@example.com", 1), ("m3@example.com", 1)])
+
+    def test_history_changes_invalidate_entries(self):
+        self.cache.sync(self.svc, "me")
+        gmail_ops.get_messages_metadata(self.svc, "me", ["m1", "m2"], cache=self.cache)
+        self.history.records = [{"labelsAdded": [{"message": {"id": "m1"}, "labelIds": ["TRASH"]}]}]
+        self.history.history_id = "120"
+        self.assertEqual(self.cache.sync(self.svc, "me"), 1)
+        self.assertEqual(self.cache.history_id, "120")
+        self.assertEqual(set(self.cache.get_many(["m1", "m2"])), {"m2"})
+
+    def test_expired_history_clears_cache(self):
+        self.cache.sync(self.svc, "me")
+        gmail_ops.get_messages_metadata(self.svc, "me", ["m1"], cache=self.cache)
+        self.history.expired = True
+        self.history.history_id = "500"
+        self.cache.sync(self.svc, "me")
+        self.assertEqual(self.cache.get_many(["m1"]), {})
+        self.assertEqual(self.cache.history_id, "500")
+
+
+if __name__ == "__main__":
+    unittest.main()
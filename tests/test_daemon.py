@@ -0,0 +1,105 @@
+import contextlib
+import io
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+
+from src import daemon, gmail_trash
+
+from test_gmail_ops import FakeMessages, FakeService
+
+
+class DaemonTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.token = os.path.join(self.tmp.name, "token.json")
+        self.path = daemon.socket_path(self.token)
+        pages = {"page1": {"messages": [{"id": "a1"}, {"id": "a2"}]}}
+        self.fm = FakeMessages(pages, snippets={"a1": "hello", "a2": "world"})
+        self.svc = FakeService(self.fm)
+
+    def start(self):
+        session = daemon.WarmSession(token_path=self.token, service=self.svc)
+        ready = threading.Event()
+        thread = threading.Thread(target=daemon.serve, args=(self.path, session), kwargs={"idle_timeout": 10, "ready": ready})
+        thread.start()
+        ready.wait(5)
+        self.addCleanup(thread.join, 5)
+        self.addCleanup(daemon.stop, self.path)
+        return thread
+
+    def run_client(self, *extra, mode="--dry-run"):
+        out, err = io.StringIO(), io.StringIO()
+        argv = ["--query", "q", mode, "--use-daemon", "--quota-units", "0", "--token-path", self.token, *extra]
+        with mock.patch.object(gmail_trash, "get_credentials", side_effect=AssertionError("client must not authenticate")), mock.patch.object(
+            gmail_trash, "load_dotenv"
+        ), contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            code = gmail_trash.main(argv)
+        return code, out.getvalue(), err.getvalue()
+
+    def test_client_forwards_to_warm_service(self):
+        self.start()
+        for _ in range(2):
+            code, out, _ = self.run_client()
+            self.assertEqual(code, 0)
+            self.assertIn("乾跑：命中 2 封", out)
+            self.assertIn("- [a1] hello", out)
+        # Both runs went through the one service the daemon holds
+        self.assertEqual(self.fm.get_calls, 4)
+
+    def test_errors_come_back_with_exit_code(self):
+        self.start()
+        self.fm.pages = {}
+        code, _, err = self.run_client()
+        self.assertEqual(code, gmail_trash.EXIT_UNKNOWN_ERROR)
+        self.assertIn("未預期錯誤", err)
+
+    def test_rejects_other_account_or_transport(self):
+        self.start()
+        other = os.path.join(self.tmp.name, "other.json")
+        for extra, flag in (
+            (["--token-path", other], "--token-path"),
+            (["--credentials-path", os.path.join(self.tmp.name, "other-credentials.json")], "--credentials-path"),
+            (["--async-http"], "--async-http"),
+        ):
+            with self.subTest(flag=flag):
+                code, _, err = self.run_client(*extra)
+                self.assertEqual(code, gmail_trash.EXIT_INPUT_ERROR)
+                self.assertIn(flag, err)
+        self.assertEqual(self.fm.get_calls, 0)
+        self.assertEqual(self.fm.batch_calls, [])
+
+    def test_logs_reach_each_client(self):
+        self.start()
+        self.assertEqual(self.run_client()[0], 0)
+        # The second request logs; its lines must go to this client, not the first one's closed stream
+        code, out, err = self.run_client(mode="--resume")
+        self.assertEqual(code, 0)
+        self.assertIn("找不到可續跑的工作", err)
+        self.assertNotIn("Logging error", err)
+        self.assertEqual([c["body"]["ids"] for c in self.fm.batch_calls], [["a1", "a2"]])
+
+    def test_stop_removes_socket(self):
+        thread = self.start()
+        self.assertTrue(daemon.is_running(self.path))
+        self.assertTrue(daemon.stop(self.path))
+        thread.join(5)
+        self.assertFalse(thread.is_alive())
+        self.assertFalse(os.path.exists(self.path))
+
+    def test_without_daemon_runs_locally(self):
+        self.assertIsNone(daemon.forward(["--query", "q"], self.path))
+        out = io.StringIO()
+        argv = ["--query", "q", "--dry-run", "--use-daemon", "--token-path", self.token]
+        with mock.patch.object(gmail_trash, "get_credentials", return_value=object()), mock.patch.object(
+            gmail_trash, "build_service", return_value=self.svc
+        ), mock.patch.object(gmail_trash, "load_dotenv"), contextlib.redirect_stdout(out):
+            self.assertEqual(gmail_trash.main(argv), 0)
+        self.assertIn("乾跑：命中 2 封", out.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+from unittest import mock
+
+from benchmarks.fake_gmail import FakeGmail
+from src import gmail_ops
+from src.util import http_status
+
+
+class FakeGmailTest(unittest.TestCase):
+    def test_quota_units_follow_method_costs(self):
+        backend = FakeGmail(1200)
+        ids = gmail_ops.search_message_ids(backend, "me", "in:inbox")
+        gmail_ops.get_messages_metadata(backend, "me", ids[:150])
+        gmail_ops.move_to_trash_batch(backend, "me", ids[:10])
+        self.assertEqual(backend.calls["messages.list"], 3)
+        self.assertEqual(backend.calls["batch"], 2)
+        self.assertEqual(backend.total_units, 3 * 5 + 150 * 5 + 50)
+
+    @mock.patch("time.sleep")
+    def test_throttled_parts_are_retried(self, _sleep):
+        backend = FakeGmail(500, throttle_rate=0.1)
+        ids = backend.order[:200]
+        metas = gmail_ops.get_messages_metadata(backend, "me", ids)
+        self.assertEqual([m["id"] for m in metas], ids)
+        self.assertGreater(sum(backend.throttled.values()), 0)
+        self.assertEqual(backend.calls["messages.get"], 200 + backend.throttled["messages.get"])
+
+    def test_history_reports_changes_and_expires(self):
+        backend = FakeGmail(100)
+        start = gmail_ops.get_history_id(backend, "me")
+        fresh = backend.deliver(3)
+        gmail_ops.move_to_trash_batch(backend, "me", backend.order[10:12])
+        changed, latest = gmail_ops.list_history_message_ids(backend, "me", start)
+        self.assertEqual(changed, set(fresh) | set(backend.order[10:12]))
+        self.assertEqual(latest, str(backend.history_id))
+        self.assertEqual(gmail_ops.search_message_ids(backend, "me", "in:inbox")[:3], fresh)
+
+        backend.history_floor = backend.history_id
+        with self.assertRaises(Exception) as ctx:
+            gmail_ops.list_history_message_ids(backend, "me", start)
+        self.assertEqual(http_status(ctx.exception), 404)
+
+
+if __name__ == "__main__":
+    unittest.main()
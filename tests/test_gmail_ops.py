@@ -1,4 +1,8 @@
 import unittest
+from unittest import mock
+
+import httplib2
+from googleapiclient.errors import HttpError
 
 from src import gmail_ops
 
@@ -11,21 +15,61 @@ class FakeRequest:
         return self._result
 
 
+class FakeErrorRequest:
+    def __init__(self, status):
+        self._status = status
+
+    def execute(self):
+        headers = {"status": self._status}
+        if self._status == 429:
+            headers["retry-after"] = "0"
+        raise HttpError(httplib2.Response(headers), b"error")
+
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self._service = service
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, callback=None, request_id=None):
+        self._requests.append((request_id, request))
+
+    def execute(self):
+        self._service.batch_executes += 1
+        self._service.batch_sizes.append(len(self._requests))
+        for request_id, request in self._requests:
+            try:
+                self._callback(request_id, request.execute(), None)
+            except HttpError as e:
+                self._callback(request_id, None, e)
+
+
 class FakeMessages:
-    def __init__(self, pages, snippets=None, batch_calls=None, headers=None, label_ids=None):
+    def __init__(self, pages, snippets=None, batch_calls=None, headers=None, label_ids=None, failures=None, internal_dates=None):
         self.pages = pages
         self.snippets = snippets or {}
         self.batch_calls = batch_calls if batch_calls is not None else []
         self.headers = headers or {}
         self.label_ids = label_ids or {}
+        # id -> list of HTTP statuses to fail with before succeeding
+        self.failures = failures or {}
+        self.internal_dates = internal_dates or {}
+        self.get_calls = 0
 
-    def list(self, userId=None, q=None, pageToken=None, maxResults=None):  # noqa: N802
+    def list(self, userId=None, q=None, pageToken=None, maxResults=None, fields=None):  # noqa: N802
         # Return page by token
         page = self.pages.get(pageToken or "page1")
         return FakeRequest(page)
 
     def get(self, userId=None, id=None, format=None, metadataHeaders=None):  # noqa: N802, A002
+        self.get_calls += 1
+        pending = self.failures.get(id)
+        if pending:
+            return FakeErrorRequest(pending.pop(0))
         res = {"id": id, "snippet": self.snippets.get(id, ""), "labelIds": self.label_ids.get(id, [])}
+        if id in self.internal_dates:
+            res["internalDate"] = self.internal_dates[id]
         # If metadata requested, return payload headers if available
         if format == "metadata" and id in self.headers:
             res["payload"] = {"headers": self.headers[id]}
@@ -36,21 +80,66 @@ class FakeMessages:
         return FakeRequest({})
 
 
+class FakeLabels:
+    def __init__(self, labels=None):
+        self.labels = labels if labels is not None else []
+        self.list_calls = 0
+
+    def list(self, userId=None):  # noqa: N802
+        self.list_calls += 1
+        return FakeRequest({"labels": list(self.labels)})
+
+    def create(self, userId=None, body=None):  # noqa: N802
+        created = {"id": f"Label_{len(self.labels) + 1}", "name": body["name"]}
+        self.labels.append(created)
+        return FakeRequest(created)
+
+
+class FakeHistory:
+    def __init__(self, history_id="100"):
+        self.records = []
+        self.history_id = history_id
+        self.expired = False
+        self.list_calls = 0
+
+    def list(self, userId=None, startHistoryId=None, pageToken=None, historyTypes=None):  # noqa: N802
+        self.list_calls += 1
+        if self.expired:
+            return FakeErrorRequest(404)
+        return FakeRequest({"history": self.records, "historyId": self.history_id})
+
+
 class FakeUsers:
-    def __init__(self, messages):
+    def __init__(self, messages, labels=None, history=None):
         self._messages = messages
+        self._labels = labels or FakeLabels()
+        self._history = history or FakeHistory()
 
     def messages(self):  # noqa: D401
         return self._messages
 
+    def labels(self):
+        return self._labels
+
+    def history(self):
+        return self._history
+
+    def getProfile(self, userId=None):  # noqa: N802
+        return FakeRequest({"historyId": self._history.history_id})
+
 
 class FakeService:
-    def __init__(self, messages):
-        self._users = FakeUsers(messages)
+    def __init__(self, messages, labels=None, history=None):
+        self._users = FakeUsers(messages, labels, history)
+        self.batch_executes = 0
+        self.batch_sizes = []
 
     def users(self):
         return self._users
 
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
 
 class GmailOpsTest(unittest.TestCase):
     def test_search_message_ids_pagination_and_limit(self):
@@ -116,6 +205,55 @@ class GmailOpsTest(unittest.TestCase):
         self.assertEqual(skipped["important"], 1)
         self.assertEqual(skipped["sensitive"], 1)
 
+    def test_get_messages_metadata_batches_round_trips(self):
+        ids = [f"m{i}" for i in range(250)]
+        fm = FakeMessages(pages={}, snippets={mid: mid.upper() for mid in ids})
+        svc = FakeService(fm)
+        metas = gmail_ops.get_messages_metadata(svc, "me", ids)
+        # 250 IDs -> 3 batch HTTP calls instead of 250 round trips
+        self.assertEqual(svc.batch_executes, 3)
+        self.assertEqual(svc.batch_sizes, [100, 100, 50])
+        self.assertEqual([m["id"] for m in metas], ids)
+        self.assertEqual(metas[42]["snippet"], "M42")
+
+    def test_batch_get_retries_only_failed_sub_requests(self):
+        ids = ["m1", "m2", "m3"]
+        fm = FakeMessages(pages={}, snippets={"m1": "a", "m2": "b", "m3": "c"}, failures={"m2": [429, 503]})
+        svc = FakeService(fm)
+        with mock.patch("time.sleep"):
+            metas = gmail_ops.batch_get_messages(svc, "me", ids)
+        self.assertEqual([m["snippet"] for m in metas], ["a", "b", "c"])
+        self.assertEqual(svc.batch_sizes, [3, 1, 1])
+
+    def test_batch_get_raises_non_retryable(self):
+        fm = FakeMessages(pages={}, failures={"m1": [404]})
+        svc = FakeService(fm)
+        with self.assertRaises(HttpError):
+            gmail_ops.batch_get_messages(svc, "me", ["m1", "m2"])
+        self.assertEqual(svc.batch_executes, 1)
+
+    def test_workers_use_own_service_and_keep_order(self):
+        ids = [f"m{i}" for i in range(2500)]
+        fm = FakeMessages(pages={}, snippets={mid: mid for mid in ids})
+        created = []
+
+        def factory():
+            svc = FakeService(fm)
+            created.append(svc)
+            return svc
+
+        main_svc = FakeService(fm)
+        moved = gmail_ops.move_to_trash_batch(main_svc, "me", ids, workers=3, service_factory=factory)
+        self.assertEqual(moved, 2500)
+        self.assertEqual(sorted(len(c["body"]["ids"]) for c in fm.batch_calls), [500, 1000, 1000])
+        self.assertTrue(created)
+
+        metas = gmail_ops.get_messages_metadata(main_svc, "me", ids[:450], workers=4, service_factory=factory)
+        self.assertEqual([m["id"] for m in metas], ids[:450])
+        # All fetching happened on worker services, never on the shared one
+        self.assertEqual(main_svc.batch_executes, 0)
+        self.assertEqual(sum(s.batch_executes for s in created), 5)
+
 
 if __name__ == "__main__":
     unittest.main()
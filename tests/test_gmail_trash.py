@@ -0,0 +1,75 @@
+import contextlib
+import io
+import unittest
+from unittest import mock
+
+from benchmarks.fake_gmail import FakeGmail
+from src import gmail_trash
+
+from test_gmail_ops import FakeMessages, FakeService
+
+
+def run_main(svc, argv):
+    out = io.StringIO()
+    with mock.patch.object(gmail_trash, "get_credentials", return_value=object()), mock.patch.object(
+        gmail_trash, "build_service", return_value=svc
+    ), mock.patch.object(gmail_trash, "load_dotenv"), contextlib.redirect_stdout(out):
+        code = gmail_trash.main(argv)
+    return code, out.getvalue()
+
+
+class MainTest(unittest.TestCase):
+    def setUp(self):
+        pages = {"page1": {"messages": [{"id": "a1"}, {"id": "a2"}, {"id": "a3"}, {"id": "a4"}]}}
+        headers = {
+            "a1": [{"name": "From", "value": "Foo <foo@example.com>"}],
+            "a2": [{"name": "From", "value": "foo@example.com"}],
+            "a3": [{"name": "From", "value": "bar@example.com"}],
+            "a4": [{"name": "From", "value": "baz@example.com"}],
+        }
+        self.fm = FakeMessages(pages, snippets={"a1": "hello"}, headers=headers)
+        self.svc = FakeService(self.fm)
+
+    def test_dry_run_with_list_from_is_one_pass(self):
+        code, out = run_main(self.svc, ["--query", "q", "--dry-run", "--list-from"])
+        self.assertEqual(code, 0)
+        self.assertEqual(self.fm.get_calls, 4)
+        self.assertEqual(self.svc.batch_executes, 1)
+        self.assertIn("乾跑：命中 4 封", out)
+        self.assertIn("- [a1] hello", out)
+        self.assertIn("- foo@example.com: 2", out)
+
+    def test_dry_run_fetches_only_samples(self):
+        code, out = run_main(self.svc, ["--query", "q", "--dry-run"])
+        self.assertEqual(code, 0)
+        self.assertEqual(self.fm.get_calls, 3)
+        self.assertNotIn("發件者統計", out)
+
+    def test_plan_prints_fused_ops_without_modifying(self):
+        self.fm.label_ids = {"a1": ["IMPORTANT"], "a2": ["STARRED"]}
+        code, out = run_main(self.svc, ["--query", "q", "--plan"])
+        self.assertEqual(code, 0)
+        self.assertEqual(self.fm.batch_calls, [])
+        self.assertIn("batchModify 3 次（約 150 配額單位；分開執行需 3 次、150 單位）", out)
+        self.assertIn("- +STARRED +AGM-Important：1 封，1 次，50 單位", out)
+        self.assertIn("- +TRASH：2 封", out)
+
+
+class EstimateTest(unittest.TestCase):
+    def test_estimate_answers_in_two_calls(self):
+        backend = FakeGmail(5000, seed=1)
+        expected = backend.list_page("category:promotions", None, 10)["resultSizeEstimate"]
+        code, out = run_main(backend, ["--query", "category:promotions", "--estimate", "--quota-units", "0"])
+        self.assertEqual(code, 0)
+        self.assertEqual(backend.calls["messages.list"], 1)
+        self.assertEqual(backend.calls["batch"], 1)
+        self.assertIn(f"乾跑：命中約 {expected} 封（估計）", out)
+        self.assertEqual(out.count("\n- ["), 3)
+
+    def test_estimate_rejects_list_from(self):
+        code, _ = run_main(FakeGmail(10), ["--query", "q", "--fast-count", "--list-from"])
+        self.assertEqual(code, gmail_trash.EXIT_INPUT_ERROR)
+
+
+if __name__ == "__main__":
+    unittest.main()
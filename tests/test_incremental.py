@@ -0,0 +1,65 @@
+import os
+import tempfile
+import unittest
+
+from src import incremental
+
+from test_gmail_ops import FakeHistory, FakeMessages, FakeRequest, FakeService
+
+
+class QueryMessages(FakeMessages):
+    def __init__(self, matches, **kwargs):
+        super().__init__(pages={}, **kwargs)
+        self.matches = matches
+        self.queries = []
+
+    def list(self, userId=None, q=None, pageToken=None, maxResults=None, fields=None):  # noqa: N802
+        self.queries.append(q)
+        return FakeRequest({"messages": [{"id": mid} for mid in self.matches]})
+
+
+class IncrementalTest(unittest.TestCase):
+    def test_candidates_come_from_history_and_are_reevaluated(self):
+        history = FakeHistory("200")
+        history.records = [
+            {"messagesAdded": [{"message": {"id": "m1"}}, {"message": {"id": "m2"}}]},
+            {"labelsAdded": [{"message": {"id": "m3"}, "labelIds": ["CATEGORY_PROMOTIONS"]}]},
+        ]
+        dates = {"m2": "1700000000000", "m3": "1600000000000"}
+        fm = QueryMessages(["m2", "other"], internal_dates=dates)
+        svc = FakeService(fm, history=history)
+
+        checkpoint = {"history_id": "100", "processed": {"m1"}}
+        ids, latest = incremental.incremental_candidates(svc, "me", "label:promotions", checkpoint)
+
+        self.assertEqual(ids, ["m2"])
+        self.assertEqual(latest, "200")
+        # Only the two unprocessed candidates were fetched, and one windowed search ran
+        self.assertEqual(fm.get_calls, 2)
+        self.assertEqual(fm.queries, ["(label:promotions) after:1599999999 before:1700000001"])
+
+    def test_no_new_history_costs_one_call(self):
+        history = FakeHistory("150")
+        fm = QueryMessages([])
+        svc = FakeService(fm, history=history)
+        ids, latest = incremental.incremental_candidates(svc, "me", "q", {"history_id": "150", "processed": set()})
+        self.assertEqual((ids, latest), ([], "150"))
+        self.assertEqual((history.list_calls, fm.get_calls, fm.queries), (1, 0, []))
+
+    def test_expired_history_requests_full_search(self):
+        history = FakeHistory()
+        history.expired = True
+        svc = FakeService(QueryMessages([]), history=history)
+        self.assertIsNone(incremental.incremental_candidates(svc, "me", "q", {"history_id": "1", "processed": set()}))
+
+    def test_checkpoint_round_trip(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "checkpoints", "q.json")
+            incremental.save_checkpoint(path, "q", "300", {"b", "a"})
+            data = incremental.load_checkpoint(path)
+        self.assertEqual(data["history_id"], "300")
+        self.assertEqual(data["processed"], {"a", "b"})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from src import journal
+from src.journal import JobJournal, find_unfinished, fuse_ops, make_op, ops_cost
+
+from test_gmail_ops import FakeErrorRequest, FakeMessages, FakeService
+from test_gmail_trash import run_main
+
+
+class FailingMessages(FakeMessages):
+    def __init__(self, *args, fail_on_call=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fail_on_call = fail_on_call
+
+    def batchModify(self, userId=None, body=None):  # noqa: N802
+        if len(self.batch_calls) + 1 == self.fail_on_call:
+            self.fail_on_call = None
+            return FakeErrorRequest(400)
+        return super().batchModify(userId=userId, body=body)
+
+
+class JournalTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.dir = os.path.join(self.tmp.name, "jobs")
+
+    def test_torn_last_line_is_ignored(self):
+        with mock.patch.object(journal, "BATCH_SIZE", 2):
+            job = JobJournal.create(self.dir, "q", [make_op(["a", "b", "c"], ["TRASH"])], count=3)
+        job.mark_done(0, 0)
+        with open(job.path, "a", encoding="utf-8") as f:
+            f.write('{"type": "done", "op": 0, "ch')
+        loaded = find_unfinished(self.dir, "q")
+        self.assertEqual(loaded.completed, {(0, 0)})
+        self.assertEqual([c[3] for c in loaded.pending()], [["c"]])
+        self.assertIsNone(find_unfinished(self.dir, "other"))
+
+    def test_fuse_groups_by_final_label_delta(self):
+        intents = [
+            make_op(["a", "b"], ["STARRED"]),
+            make_op(["a", "b", "c"], ["Label_1"]),
+            make_op(["b"], [], ["STARRED"]),
+            make_op(["d", "e"], ["TRASH"]),
+        ]
+        self.assertEqual(
+            fuse_ops(intents),
+            [
+                make_op(["a"], ["STARRED", "Label_1"]),
+                make_op(["b"], ["Label_1"], ["STARRED"]),
+                make_op(["c"], ["Label_1"]),
+                make_op(["d", "e"], ["TRASH"]),
+            ],
+        )
+        self.assertEqual(ops_cost([make_op(["a", "b", "c"], ["TRASH"])], chunk_size=2), (2, 100))
+
+
+class ResumeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.token = os.path.join(self.tmp.name, "token.json")
+        self.pages = {"page1": {"messages": [{"id": f"m{i}"} for i in range(5)]}}
+
+    def argv(self, *extra):
+        return ["--query", "q", "--quota-units", "0", "--token-path", self.token, *extra]
+
+    @mock.patch("time.sleep")
+    def test_resume_runs_only_remaining_chunks(self, _sleep):
+        failing = FailingMessages(self.pages, fail_on_call=2)
+        with mock.patch.object(journal, "BATCH_SIZE", 2):
+            code, _ = run_main(FakeService(failing), self.argv())
+        self.assertEqual(code, 3)
+        self.assertEqual([c["body"]["ids"] for c in failing.batch_calls], [["m0", "m1"]])
+
+        fm = FakeMessages(self.pages)
+        code, out = run_main(FakeService(fm), self.argv("--resume"))
+        self.assertEqual(code, 0)
+        self.assertEqual(fm.get_calls, 0)
+        self.assertEqual([c["body"]["ids"] for c in fm.batch_calls], [["m2", "m3"], ["m4"]])
+        self.assertIn("5", out)
+        self.assertIsNone(find_unfinished(os.path.join(self.tmp.name, "jobs"), "q"))
+
+    @mock.patch("time.sleep")
+    def test_resume_rejects_previews(self, _sleep):
+        with mock.patch.object(journal, "BATCH_SIZE", 2):
+            run_main(FakeService(FailingMessages(self.pages, fail_on_call=2)), self.argv())
+        for flag in ("--dry-run", "--plan", "--list-from"):
+            fm = FakeMessages(self.pages)
+            code, _ = run_main(FakeService(fm), self.argv("--resume", flag))
+            self.assertEqual(code, 1)
+            self.assertEqual(fm.batch_calls, [])
+        self.assertIsNotNone(find_unfinished(os.path.join(self.tmp.name, "jobs"), "q"))
+
+    def test_resume_without_journal_runs_normally(self):
+        fm = FakeMessages(self.pages)
+        code, _ = run_main(FakeService(fm), self.argv("--resume"))
+        self.assertEqual(code, 0)
+        self.assertEqual(fm.get_calls, 5)
+        self.assertEqual(len(fm.batch_calls), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
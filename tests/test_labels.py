@@ -0,0 +1,83 @@
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks.fake_gmail import FakeGmail
+from src import gmail_ops
+from src.labels import LabelRegistry
+
+from test_stats import run_main
+
+
+class LabelRegistryTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.path = os.path.join(self.tmp, "labels.json")
+        self.backend = FakeGmail(10)
+        self.addCleanup(gmail_ops.set_label_registry, None)
+
+    def resolve(self, registry, names):
+        gmail_ops.set_label_registry(registry)
+        return gmail_ops.ensure_labels(self.backend, "me", names)
+
+    def test_bulk_resolve_then_warm_from_disk(self):
+        self.backend.labels.append({"id": "Label_9", "name": "Existing"})
+        ids = self.resolve(LabelRegistry(self.path), ["Existing", "Review/A", "Review/B"])
+        self.assertEqual(ids["Existing"], "Label_9")
+        self.assertEqual((self.backend.calls["labels.list"], self.backend.calls["labels.create"]), (1, 2))
+
+        self.backend.reset_counters()
+        self.assertEqual(self.resolve(LabelRegistry(self.path), ["Review/B", "Existing"]), {"Review/B": ids["Review/B"], "Existing": "Label_9"})
+        self.assertEqual(sum(self.backend.calls.values()), 0)
+
+    def test_ttl_expiry_lists_again(self):
+        now = [1000.0]
+        self.resolve(LabelRegistry(self.path, ttl=60, clock=lambda: now[0]), ["A"])
+        now[0] += 61
+        self.backend.reset_counters()
+        self.resolve(LabelRegistry(self.path, ttl=60, clock=lambda: now[0]), ["A"])
+        self.assertEqual((self.backend.calls["labels.list"], self.backend.calls["labels.create"]), (1, 0))
+
+    def test_one_list_per_process(self):
+        registry = LabelRegistry(None)
+        self.resolve(registry, ["A"])
+        self.resolve(registry, ["B"])
+        self.assertEqual((self.backend.calls["labels.list"], self.backend.calls["labels.create"]), (1, 2))
+
+
+class MainLabelTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.argv = ["--query", "category:promotions", "--quota-units", "0", "--token-path", os.path.join(tmp.name, "token.json")]
+
+    def test_warm_run_skips_label_list(self):
+        self.assertEqual(run_main(FakeGmail(300, seed=2), self.argv)[0], 0)
+        backend = FakeGmail(300, seed=4)
+        # Same account: the label created by the first run is still there
+        backend.labels.append({"id": "Label_3", "name": "AGM-Important"})
+        self.assertEqual(run_main(backend, self.argv)[0], 0)
+        self.assertEqual(backend.calls["labels.list"], 0)
+        self.assertGreater(backend.calls["messages.batchModify"], 0)
+
+    @mock.patch("time.sleep")
+    def test_deleted_label_is_recreated(self, _sleep):
+        self.assertEqual(run_main(FakeGmail(300, seed=2), self.argv)[0], 0)
+        # The label was deleted in Gmail since it was cached
+        backend = FakeGmail(300, seed=4)
+        for argv in (self.argv, [*self.argv, "--stream"]):
+            code, out, err = run_main(backend, argv)
+            self.assertEqual(code, 0, err)
+            self.assertEqual(backend.calls["labels.create"], 1)
+            label_id = backend.labels[-1]["id"]
+            flagged = [m for m in backend.messages.values() if label_id in m["labelIds"]]
+            self.assertTrue(flagged)
+            backend.labels.pop()
+            backend.reset_counters()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.fake_gmail import FakeGmail
+from src import gmail_ops
+from src.local_index import LocalIndex, LocalQueryError, compile_query, index_path, label_key
+
+from test_stats import run_main
+
+
+QUERIES = [
+    "category:promotions",
+    "from:shop.example.com",
+    "subject:sale",
+    'subject:"monthly statement"',
+    "deals",
+    "category:updates -is:starred",
+    "is:important OR is:starred",
+    "{from:bank from:travel} older_than:30d",
+    "newer_than:10d category:social",
+    "label:important -(subject:order OR from:news)",
+]
+
+
+class LocalIndexTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.backend = FakeGmail(1500, seed=11)
+        self.index = LocalIndex(os.path.join(tmp.name, "index.sqlite3"), clock=lambda: self.backend.now)
+        self.addCleanup(self.index.close)
+        self.index.sync(self.backend, "me")
+
+    def listed(self, query):
+        return [m["id"] for m in self.backend.list_page(query, None, 10**6)["messages"]]
+
+    def test_matches_gmail_search(self):
+        for query in QUERIES:
+            with self.subTest(query=query):
+                expected = self.listed(query)
+                self.assertTrue(expected)
+                self.assertEqual([rec.id for rec in self.index.search(query)], expected)
+                self.assertEqual(self.index.count(query), len(expected))
+
+    def test_cjk_and_unsupported_operators(self):
+        self.assertEqual(self.index.count("驗證碼"), sum("驗證碼" in m["subject"] for m in self.backend.messages.values()))
+        with self.assertRaises(LocalQueryError):
+            compile_query("has:attachment")
+        # Unknown user labels match nothing, as in Gmail
+        self.assertEqual(self.index.count("label:no-such-label"), 0)
+
+    def test_history_sync_keeps_index_fresh(self):
+        self.backend.reset_counters()
+        self.assertEqual(self.index.sync(self.backend, "me"), {"full": False, "changed": 0, "total": 1500})
+        self.assertEqual(set(self.backend.calls), {"history.list"})
+
+        fresh = self.backend.deliver(3)
+        target = self.listed("category:promotions -is:starred")[:5]
+        gmail_ops.modify_labels_batch(self.backend, "me", target, ["STARRED"])
+        trashed = self.listed("from:news")[:4]
+        gmail_ops.modify_labels_batch(self.backend, "me", trashed, ["TRASH"])
+        self.backend.reset_counters()
+        synced = self.index.sync(self.backend, "me")
+        changed = len({*fresh, *target, *trashed})
+        self.assertEqual(synced, {"full": False, "changed": changed, "total": 1503})
+        self.assertEqual(self.backend.calls["messages.get"], changed)
+        # Delivered together, so only the set is compared: ties in internalDate have no defined order
+        for query in ("category:promotions is:starred", "from:news", "newer_than:1d"):
+            self.assertEqual(sorted(rec.id for rec in self.index.search(query)), sorted(self.listed(query)))
+        # Trashed mail stays indexed but is hidden, as in Gmail search
+        self.assertEqual(self.index.count(""), len(self.listed("")))
+
+    def test_expired_history_rebuilds(self):
+        self.backend.deliver(2)
+        self.backend.history_floor = self.backend.history_id + 1
+        synced = self.index.sync(self.backend, "me")
+        self.assertEqual(synced, {"full": True, "changed": 0, "total": 1502})
+
+    def test_user_label_names(self):
+        label_id = gmail_ops.ensure_label(self.backend, "me", "Receipts/2024 Shop")
+        ids = self.listed("from:shop")[:7]
+        gmail_ops.modify_labels_batch(self.backend, "me", ids, [label_id])
+        self.index.sync(self.backend, "me", full=True)
+        self.assertEqual(self.index.labels[label_key("Receipts/2024 Shop")], label_id)
+        self.assertEqual(sorted(rec.id for rec in self.index.search("label:receipts-2024-shop")), sorted(ids))
+
+
+class LocalModeTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.backend = FakeGmail(2000, seed=4)
+        # Off the hour, so older_than: cutoffs never land on a message while the clock ticks
+        for m in self.backend.messages.values():
+            m["internalDate"] = str(int(m["internalDate"]) - 1_800_000)
+        self.token = os.path.join(tmp.name, "token.json")
+        self.argv = ["--quota-units", "0", "--token-path", self.token]
+
+    def run_local(self, *argv):
+        return run_main(self.backend, ["--local", *argv, *self.argv])
+
+    def test_requires_index(self):
+        code, _, err = self.run_local("--query", "category:promotions", "--dry-run")
+        self.assertEqual(code, 1)
+        self.assertIn("--sync-index", err)
+
+    def test_previews_offline_and_trashes_online(self):
+        code, out, _ = run_main(self.backend, ["--sync-index", *self.argv])
+        self.assertEqual((code, out.strip()), (0, "本地索引已重建：共 2000 封"))
+        query = "category:promotions older_than:20d"
+        ids = [m["id"] for m in self.backend.list_page(query, None, 10**6)["messages"]]
+
+        self.backend.reset_counters()
+        code, out, _ = self.run_local("--query", query, "--dry-run", "--top", "2", "--group-by", "registrable")
+        self.assertEqual(code, 0)
+        # Only the freshness check reaches the API
+        self.assertEqual(set(self.backend.calls), {"history.list"})
+        self.assertIn(f"乾跑：命中 {len(ids)} 封", out)
+        self.assertIn(f"- [{ids[0]}] ", out)
+        self.assertIn(f"主網域前 2 名（統計 {len(ids)} 封）：", out)
+
+        # The index matches one message Gmail does not
+        stale = next(mid for mid in self.backend.order if mid not in ids and "TRASH" not in self.backend.messages[mid]["labelIds"])
+        meta = self.backend.get(stale)
+        meta["labelIds"].append("CATEGORY_PROMOTIONS")
+        meta["internalDate"] = self.backend.get(ids[-1])["internalDate"]
+        index = LocalIndex(index_path(self.token))
+        index.put_many([meta])
+        index.close()
+        expected = set(gmail_ops.filter_ids_for_trash([self.backend.get(mid) for mid in ids])[0])
+        self.backend.reset_counters()
+        code, out, _ = self.run_local("--query", query)
+        self.assertEqual(code, 0)
+        # One search confirms the matches; metadata still comes from the index
+        self.assertIn("messages.list", self.backend.calls)
+        self.assertNotIn("messages.get", self.backend.calls)
+        self.assertEqual({mid for mid, m in self.backend.messages.items() if "TRASH" in m["labelIds"]}, expected)
+        self.assertNotIn("TRASH", self.backend.messages[stale]["labelIds"])
+        self.assertIn(f"命中 {len(ids)} 封；已搬移至垃圾桶 {len(expected)} 封。", out)
+
+        # The next run sees its own changes through history
+        code, out, _ = self.run_local("--query", query, "--dry-run")
+        self.assertIn(f"乾跑：命中 {len(ids) - len(expected) + 1} 封", out)
+
+    def test_rejects_unsupported_query_before_api(self):
+        code, _, err = self.run_local("--query", "has:attachment", "--dry-run")
+        self.assertEqual(code, 1)
+        self.assertIn("has:attachment", err)
+        self.assertEqual(sum(self.backend.calls.values()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+import os
+import random
+import tempfile
+import unittest
+
+from src.gmail_ops import classify_for_trash, classify_ids, filter_ids_for_trash
+from src.matcher import DEFAULT_SENSITIVE_KEYWORDS, KeywordMatcher, load_keywords
+
+
+class KeywordMatcherTest(unittest.TestCase):
+    def test_cjk_and_prefix_keywords(self):
+        matcher = KeywordMatcher(["pass", "password", "密碼", "驗證碼", "otp"])
+        self.assertTrue(matcher.search("您的驗證碼為 123456"))
+        self.assertTrue(matcher.search("重設密碼"))
+        self.assertTrue(matcher.search("forgot pass"))
+        self.assertFalse(matcher.search("weekly newsletter"))
+        self.assertFalse(KeywordMatcher([]).search("password"))
+
+    def test_agrees_with_substring_scan(self):
+        rng = random.Random(7)
+        alphabet = "abcdeo密碼驗證 "
+        keywords = ["".join(rng.choice(alphabet) for _ in range(rng.randint(1, 4))).strip() or "a" for _ in range(300)]
+        matcher = KeywordMatcher(keywords)
+        lowered = [k.lower() for k in keywords]
+        for _ in range(500):
+            text = "".join(rng.choice(alphabet) for _ in range(rng.randint(0, 12)))
+            self.assertEqual(matcher.search(text), any(k in text for k in lowered), text)
+
+    def test_load_keywords_skips_comments(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "kw.txt")
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("# sensitive\nInvoice\n\n 驗證碼 \n")
+            self.assertEqual(load_keywords(path), ["Invoice", "驗證碼"])
+        self.assertTrue(KeywordMatcher(["Invoice"]).search("your invoice is ready"))
+
+
+class ClassifyForTrashTest(unittest.TestCase):
+    metas = [
+        {"id": "a", "labelIds": ["STARRED", "IMPORTANT"], "snippet": "ok"},
+        {"id": "b", "labelIds": ["IMPORTANT"], "snippet": "otp inside"},
+        {"id": "c", "labelIds": [], "snippet": "promo", "payload": {"headers": [{"name": "Subject", "value": "您的密碼"}]}},
+        {"id": "d", "labelIds": [], "snippet": "promo"},
+        {"labelIds": []},
+    ]
+
+    def test_single_pass_matches_separate_helpers(self):
+        res = classify_for_trash(self.metas)
+        self.assertEqual(res["trash_ids"], ["d"])
+        self.assertEqual(res["skipped"], {"starred": 1, "important": 1, "sensitive": 1})
+        self.assertEqual(res["flagged"], ["a", "b", "c"])
+        self.assertEqual(classify_ids(self.metas), {"starred": ["a"], "important": ["b"], "sensitive": ["c"], "other": ["d"]})
+
+    def test_unskipped_categories_fall_through(self):
+        trash, skipped = filter_ids_for_trash(self.metas, skip_starred=False, skip_important=False)
+        # b is no longer protected by IMPORTANT, but its snippet is sensitive
+        self.assertEqual(trash, ["a", "d"])
+        self.assertEqual(skipped, {"starred": 0, "important": 0, "sensitive": 2})
+
+    def test_custom_keywords(self):
+        trash, _ = filter_ids_for_trash(self.metas[2:4], sensitive_keywords=["promo"])
+        self.assertEqual(trash, [])
+        self.assertIn("驗證碼", DEFAULT_SENSITIVE_KEYWORDS)
+        # No keywords falls back to the built-in list rather than matching nothing
+        trash, _ = filter_ids_for_trash(self.metas[2:4], sensitive_keywords=[])
+        self.assertEqual(trash, ["d"])
+
+
+if __name__ == "__main__":
+    unittest.main()
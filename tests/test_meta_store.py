@@ -0,0 +1,49 @@
+import os
+import tempfile
+import unittest
+
+from benchmarks.fake_gmail import FakeGmail
+from src import gmail_ops
+from src.cache import MetadataCache
+from src.meta_store import MetaStore
+
+
+class MetaStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.backend = FakeGmail(400, seed=5, starred=0.1, important=0.2)
+        self.metas = [self.backend.get(mid) for mid in self.backend.order]
+
+    def test_pack_keeps_used_fields(self):
+        store = MetaStore(self.metas)
+        self.assertEqual(len(store), len(self.metas))
+        for meta, rec in zip(self.metas, store):
+            self.assertEqual(store.to_dict(rec), {k: v for k, v in meta.items() if k != "internalDate"})
+        senders = {id(rec.sender) for rec in store}
+        self.assertEqual(len(senders), len({rec.sender for rec in store}))
+        self.assertEqual(store.bit("NO_SUCH_LABEL"), 0)
+
+    def test_filters_match_dict_path(self):
+        store = MetaStore(self.metas)
+        self.assertEqual(gmail_ops.classify_ids(store), gmail_ops.classify_ids(self.metas))
+        for flags in ({}, {"skip_starred": False}, {"skip_important": False, "skip_sensitive": False}):
+            self.assertEqual(gmail_ops.filter_ids_for_trash(store, **flags), gmail_ops.filter_ids_for_trash(self.metas, **flags))
+        self.assertEqual(gmail_ops.senders_from_metas(store), gmail_ops.senders_from_metas(self.metas))
+        self.assertEqual(gmail_ops.snippets_from_metas(store), gmail_ops.snippets_from_metas(self.metas))
+
+    def test_compact_fetch_with_cache(self):
+        ids = self.backend.order[:150]
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = MetadataCache(os.path.join(tmp, "cache.sqlite3"))
+            try:
+                gmail_ops.get_messages_metadata(self.backend, "me", ids[:60], cache=cache)
+                store = gmail_ops.get_messages_metadata(self.backend, "me", ids, cache=cache, compact=True, workers=2, service_factory=lambda: self.backend)
+            finally:
+                cache.close()
+        self.assertIsInstance(store, MetaStore)
+        self.assertEqual([rec.id for rec in store], ids)
+        self.assertEqual(gmail_ops.classify_ids(store), gmail_ops.classify_ids(self.metas[:150]))
+        self.assertEqual(self.backend.calls["messages.get"], 150)
+
+
+if __name__ == "__main__":
+    unittest.main()
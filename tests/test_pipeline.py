@@ -0,0 +1,68 @@
+import unittest
+
+from src import pipeline
+
+from test_gmail_ops import FakeLabels, FakeMessages, FakeService
+
+
+class RecordingMessages(FakeMessages):
+    def __init__(self, pages, events, **kwargs):
+        super().__init__(pages, **kwargs)
+        self.events = events
+
+    def list(self, userId=None, q=None, pageToken=None, maxResults=None, fields=None):  # noqa: N802
+        self.events.append(("list", pageToken))
+        return super().list(userId=userId, q=q, pageToken=pageToken, maxResults=maxResults)
+
+    def batchModify(self, userId=None, body=None):  # noqa: N802
+        self.events.append(("modify", tuple(body["addLabelIds"]), len(body["ids"])))
+        return super().batchModify(userId=userId, body=body)
+
+
+def _pages(total, page_size=500):
+    ids = [f"m{i}" for i in range(total)]
+    pages = {}
+    for n, start in enumerate(range(0, total, page_size)):
+        token = "page1" if n == 0 else f"page{n + 1}"
+        page = {"messages": [{"id": mid} for mid in ids[start : start + page_size]]}
+        if start + page_size < total:
+            page["nextPageToken"] = f"page{n + 2}"
+        pages[token] = page
+    return ids, pages
+
+
+class StreamTrashTest(unittest.TestCase):
+    def test_trash_starts_before_search_finishes(self):
+        ids, pages = _pages(1200)
+        events = []
+        fm = RecordingMessages(pages, events, label_ids={"m1003": ["IMPORTANT"], "m1100": ["STARRED"]})
+        svc = FakeService(fm, FakeLabels([{"id": "Label_1", "name": "AGM-Important"}]))
+
+        result = pipeline.stream_trash(svc, "me", "q")
+
+        self.assertEqual(result["count"], 1200)
+        self.assertEqual(result["moved"], 1198)
+        self.assertEqual(result["skipped"], {"starred": 1, "important": 1, "sensitive": 0})
+        # First 1000-ID trash chunk goes out before the third page is listed
+        first_trash = events.index(("modify", ("TRASH",), 1000))
+        self.assertLess(first_trash, events.index(("list", "page3")))
+        self.assertEqual(events[-1], ("modify", ("TRASH",), 198))
+        # The important message is starred and labelled in one call
+        self.assertIn(("modify", ("STARRED", "Label_1"), 1), events)
+        self.assertIn(("modify", ("Label_1",), 1), events)
+        self.assertEqual(sum(1 for e in events if e[0] == "modify"), 4)
+
+    def test_modify_buffer_flushes_full_chunks(self):
+        calls = []
+        buf = pipeline.ModifyBuffer(lambda chunk: calls.append(list(chunk)) or len(chunk), size=3)
+        buf.add(["a", "b"])
+        self.assertEqual(calls, [])
+        buf.add(["c", "d", "e", "f", "g"])
+        self.assertEqual(calls, [["a", "b", "c"], ["d", "e", "f"]])
+        buf.flush()
+        self.assertEqual(calls[-1], ["g"])
+        self.assertEqual(buf.total, 7)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import unittest
+
+from benchmarks.fake_gmail import FakeGmail
+from src import pipeline
+from src.matcher import KeywordMatcher
+from src.query import And, Not, Or, QuerySyntaxError, Term, build_pushdown, parse, to_string
+
+from test_stats import run_main
+
+
+class QueryParserTest(unittest.TestCase):
+    def test_or_binds_tighter_than_and(self):
+        node = parse("a OR b c")
+        self.assertEqual(node, And([Or([Term("a"), Term("b")]), Term("c")]))
+        self.assertEqual(to_string(node), "(a OR b) c")
+
+    def test_round_trip_keeps_groups(self):
+        for q in (
+            "label:promotions older_than:6m",
+            "{from:a@x.com from:b@y.com} -subject:(hello world)",
+            'x (a OR (b c)) -{d e} subject:"two words"',
+            "(a b) OR c",
+        ):
+            self.assertEqual(to_string(parse(to_string(parse(q)))), to_string(parse(q)))
+        self.assertEqual(to_string(parse("-{d e}")), "-{d e}")
+        # Braces cannot hold an AND, so the group falls back to a parenthesized OR
+        self.assertEqual(to_string(parse("-{a (b c)}")), "-(a OR (b c))")
+        self.assertEqual(to_string(parse("x -{a (b c)}")), "x -(a OR (b c))")
+
+    def test_negation_and_fields(self):
+        node = parse('-from:"Foo Bar"')
+        self.assertIsInstance(node, Not)
+        self.assertEqual((node.child.field, node.child.value), ("from", "Foo Bar"))
+
+    def test_syntax_errors(self):
+        for q in ("(a b", "a OR", "a )", "{a"):
+            with self.assertRaises(QuerySyntaxError):
+                parse(q)
+
+
+class PushdownTest(unittest.TestCase):
+    def test_exclusions_wrap_nested_or(self):
+        plan = build_pushdown("a OR b {c d}", sensitive_keywords=["password", "密碼"])
+        self.assertEqual(plan.trash_query, '(a OR b) {c d} -is:starred -is:important -"password"')
+        self.assertEqual(plan.flagged_query, '(a OR b) {c d} {is:starred is:important "password"}')
+        self.assertEqual(plan.star_query, "(a OR b) {c d} is:important -is:starred")
+        self.assertEqual(plan.residual_keywords, ["密碼"])
+
+    def test_negated_group_with_and_member_stays_negated(self):
+        plan = build_pushdown("x -{a (b c)}", skip_sensitive=False)
+        self.assertEqual(plan.trash_query, "x -(a OR (b c)) -is:starred -is:important")
+        backend = FakeGmail(600, seed=1)
+        query = "category:promotions -{from:shop (subject:sale from:news)}"
+        expected = {m["id"] for m in backend.list_page(query, None, 10**6)["messages"]}
+        pushed = build_pushdown(query, skip_starred=False, skip_important=False, skip_sensitive=False).trash_query
+        self.assertEqual({m["id"] for m in backend.list_page(pushed, None, 10**6)["messages"]}, expected)
+
+    def test_disabled_skips_are_not_pushed(self):
+        plan = build_pushdown("q", skip_starred=False, skip_sensitive=False, sensitive_keywords=["otp"], mark_important_star=False)
+        self.assertEqual(plan.trash_query, "q -is:important")
+        self.assertIsNone(plan.star_query)
+
+    def test_pushdown_trash_skips_metadata_without_residue(self):
+        backend = FakeGmail(600)
+        result = pipeline.pushdown_trash(backend, "me", "category:promotions", matcher=KeywordMatcher(["password"]))
+        self.assertEqual(backend.calls["messages.get"], 0)
+
+        reference = FakeGmail(600)
+        ids = [mid for mid, m in reference.messages.items() if "CATEGORY_PROMOTIONS" in m["labelIds"]]
+        metas = [reference.get(mid) for mid in ids]
+        actions = pipeline.plan_actions(metas, matcher=KeywordMatcher(["password"]))
+        self.assertEqual(result["moved"], len(actions["trash_ids"]))
+        self.assertEqual(result["count"], len(ids))
+
+    def test_pushdown_rejects_limit(self):
+        # Each pushed-down search would take its own first N, touching more than N messages
+        backend = FakeGmail(2000)
+        code, _, err = run_main(backend, ["--query", "category:promotions", "--pushdown", "--limit", "10", "--quota-units", "0"])
+        self.assertEqual(code, 1)
+        self.assertIn("--limit", err)
+        self.assertEqual(sum(backend.calls.values()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import unittest
+from unittest import mock
+
+import httplib2
+from googleapiclient.errors import HttpError
+
+from src import gmail_ops
+from src.ratelimit import QuotaLimiter, method_cost
+
+from test_gmail_ops import FakeMessages, FakeService
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+class QuotaLimiterTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.limiter = QuotaLimiter(250, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_paces_to_budget(self):
+        # 20 batchModify calls = 1000 units; the first 250 are burst, the rest paced at 250/s
+        for _ in range(20):
+            self.limiter.acquire(method_cost("messages.batchModify"))
+        self.assertAlmostEqual(self.clock.now, 3.0)
+
+    def test_throttle_halves_rate_and_honours_retry_after(self):
+        self.limiter.on_throttle(retry_after=2)
+        self.assertEqual(self.limiter.rate, 125)
+        self.assertAlmostEqual(self.limiter.acquire(5), 2.0)
+        for _ in range(40):
+            self.limiter.on_success()
+        self.assertEqual(self.limiter.rate, 250)
+
+
+class QuotaIntegrationTest(unittest.TestCase):
+    def tearDown(self):
+        gmail_ops.set_quota_budget(None)
+
+    def test_batch_sub_request_429_feeds_limiter(self):
+        limiter = gmail_ops.set_quota_budget(1000)
+        fm = FakeMessages(pages={}, failures={"m1": [429]})
+        svc = FakeService(fm)
+        with mock.patch("time.sleep"):
+            metas = gmail_ops.batch_get_messages(svc, "me", ["m1", "m2"])
+        self.assertEqual([m["id"] for m in metas], ["m1", "m2"])
+        self.assertLess(limiter.rate, 1000)
+
+    def test_list_is_retried(self):
+        pages = {"page1": {"messages": [{"id": "m1"}]}}
+        fm = FakeMessages(pages)
+        calls = {"n": 0}
+        real_list = fm.list
+
+        class Flaky:
+            def __init__(self, req):
+                self.req = req
+
+            def execute(self):
+                calls["n"] += 1
+                if calls["n"] == 1:
+                    raise HttpError(httplib2.Response({"status": 503}), b"")
+                return self.req.execute()
+
+        fm.list = lambda **kw: Flaky(real_list(**kw))
+        with mock.patch("time.sleep"):
+            self.assertEqual(gmail_ops.search_message_ids(FakeService(fm), "me", "q"), ["m1"])
+        self.assertEqual(calls["n"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import json
+import os
+import tempfile
+import unittest
+
+from benchmarks.fake_gmail import FakeGmail
+from src import gmail_ops
+from src.rules import Rule, RulesError, load_rules, parse_rules
+
+from test_stats import run_main
+
+try:
+    import yaml
+except ImportError:  # pragma: no cover - optional dependency
+    yaml = None
+
+
+RULES = {
+    "defaults": {"skip_sensitive": True},
+    "rules": [
+        {"name": "promotions", "query": "category:promotions"},
+        {"name": "shop", "query": "from:shop.example.com", "skip_starred": False},
+        {"name": "deals", "query": "subject:deals"},
+    ],
+}
+
+
+class ParseRulesTest(unittest.TestCase):
+    def test_defaults_and_names(self):
+        rules = parse_rules({"defaults": {"skip_starred": False}, "rules": [{"query": "a"}, {"name": "b", "query": "b", "limit": 5}]})
+        self.assertEqual(rules, [Rule("rule1", "a", skip_starred=False), Rule("b", "b", skip_starred=False, limit=5)])
+
+    def test_invalid_rules(self):
+        for data in ([], [{"name": "x"}], [{"query": "a", "skip": True}], [{"query": "a", "limit": True}], [{"name": "x", "query": "a"}, {"name": "x", "query": "b"}]):
+            with self.assertRaises(RulesError):
+                parse_rules(data)
+
+    @unittest.skipIf(yaml is None, "PyYAML not installed")
+    def test_yaml_file(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "rules.yaml")
+            with open(path, "w", encoding="utf-8") as f:
+                yaml.safe_dump(RULES, f)
+            self.assertEqual([r.name for r in load_rules(path)], ["promotions", "shop", "deals"])
+
+
+class RunRulesTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.rules_path = os.path.join(tmp.name, "rules.json")
+        with open(self.rules_path, "w", encoding="utf-8") as f:
+            json.dump(RULES, f)
+        self.argv = ["--rules", self.rules_path, "--quota-units", "0", "--token-path", os.path.join(tmp.name, "token.json")]
+        self.backend = FakeGmail(3000, seed=7, starred=0.2)
+        self.matched = {r["name"]: set(m["id"] for m in self.backend.list_page(r["query"], None, 10**6)["messages"]) for r in RULES["rules"]}
+
+    def expected_trash(self, name, **flags):
+        ids = sorted(self.matched[name])
+        return set(gmail_ops.filter_ids_for_trash([self.backend.get(mid) for mid in ids], **flags)[0])
+
+    def test_shared_fetch_and_merged_modify(self):
+        unique = set().union(*self.matched.values())
+        expected = self.expected_trash("promotions") | self.expected_trash("shop", skip_starred=False) | self.expected_trash("deals")
+        starred = {mid for mid in unique if "STARRED" in self.backend.messages[mid]["labelIds"]}
+        code, out, err = run_main(self.backend, self.argv)
+        self.assertEqual(code, 0, err)
+        # Every matched message is fetched exactly once, however many rules match it
+        self.assertEqual(self.backend.calls["messages.get"], len(unique))
+        self.assertEqual(self.backend.calls["messages.list"], 3 + sum(len(ids) // 500 for ids in self.matched.values()))
+        trashed = {mid for mid, m in self.backend.messages.items() if "TRASH" in m["labelIds"]}
+        self.assertEqual(trashed, expected)
+        # Only the shop rule trashes starred messages
+        self.assertTrue(starred & trashed)
+        self.assertLessEqual(starred & trashed, self.matched["shop"])
+        self.assertIn(f"3 條規則：命中 {len(unique)} 封（跨規則去重後）；已搬移至垃圾桶 {len(trashed)} 封。", out)
+        self.assertIn(f"- shop：命中 {len(self.matched['shop'])}", out)
+        # One call per distinct label delta per 1000 IDs, never per rule
+        self.assertLessEqual(self.backend.calls["messages.batchModify"], -(-len(trashed) // 1000) + 3)
+
+    def test_dry_run_only_lists(self):
+        code, out, _ = run_main(self.backend, [*self.argv, "--dry-run"])
+        self.assertEqual(code, 0)
+        self.assertEqual(set(self.backend.calls), {"messages.list"})
+        self.assertIn(f"- deals：命中 {len(self.matched['deals'])} 封", out)
+
+    def test_rejects_query_specific_modes(self):
+        code, _, err = run_main(self.backend, [*self.argv, "--stream"])
+        self.assertEqual(code, 1)
+        self.assertIn("--rules", err)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,95 @@
+import random
+import unittest
+from collections import Counter
+
+from benchmarks.fake_gmail import FakeGmail
+from src.meta_store import MetaStore
+from src.senders import SenderStats, SpaceSaving, group_key, registrable_domain
+
+from test_stats import run_main
+
+
+def meta(mid, sender):
+    return {"id": mid, "labelIds": [], "payload": {"headers": [{"name": "From", "value": sender}]}}
+
+
+class GroupKeyTest(unittest.TestCase):
+    def test_domain_rollups(self):
+        self.assertEqual(registrable_domain("mail.shop.example.com"), "example.com")
+        self.assertEqual(registrable_domain("news.shop.co.uk"), "shop.co.uk")
+        self.assertEqual(registrable_domain("edm.store.com.tw"), "store.com.tw")
+        self.assertEqual(registrable_domain("co.uk"), "co.uk")
+        self.assertEqual(registrable_domain("localhost"), "localhost")
+        raw = "Shop <Deals@News.Shop.CO.UK>"
+        self.assertEqual(group_key(raw), "deals@news.shop.co.uk")
+        self.assertEqual(group_key(raw, "domain"), "news.shop.co.uk")
+        self.assertEqual(group_key(raw, "registrable"), "shop.co.uk")
+        self.assertIsNone(group_key("undisclosed-recipients:;", "domain"))
+
+
+class SpaceSavingTest(unittest.TestCase):
+    def test_exact_until_capacity(self):
+        counter = SpaceSaving(3)
+        for key in "abacab":
+            counter.add(key)
+        self.assertTrue(counter.exact)
+        self.assertEqual(counter.top(2), [("a", 3, 0), ("b", 2, 0)])
+
+    def test_heavy_hitters_survive_with_bounded_error(self):
+        rng = random.Random(3)
+        # A few heavy senders over a long tail of one-off ones
+        stream = [f"heavy{rng.randrange(5)}" if rng.random() < 0.5 else f"tail{i}" for i in range(20000)]
+        truth = Counter(stream)
+        counter = SpaceSaving(100)
+        for key in stream:
+            counter.add(key)
+        self.assertFalse(counter.exact)
+        self.assertEqual(len(counter), 100)
+        top = counter.top(5)
+        self.assertEqual({key for key, _, _ in top}, {f"heavy{i}" for i in range(5)})
+        for key, n, err in top:
+            self.assertGreaterEqual(n, truth[key])
+            self.assertLessEqual(n - err, truth[key])
+            self.assertLessEqual(err, len(stream) // 100)
+
+
+class SenderStatsTest(unittest.TestCase):
+    def test_dicts_and_store_agree(self):
+        metas = [meta("a", "Foo <foo@a.example.com>"), meta("b", "foo@a.example.com"), meta("c", "bar@b.example.com"), {"id": "d"}]
+        for group_by, expected in (
+            ("sender", [("foo@a.example.com", 2), ("bar@b.example.com", 1)]),
+            ("domain", [("a.example.com", 2), ("b.example.com", 1)]),
+            ("registrable", [("example.com", 3)]),
+        ):
+            self.assertEqual(SenderStats(group_by).consume(metas).pairs(), expected)
+            self.assertEqual(SenderStats(group_by).consume(MetaStore(metas)).pairs(), expected)
+        streamed = SenderStats(top=1)
+        for page in (metas[:2], metas[2:]):
+            streamed.consume(page)
+        self.assertEqual((streamed.pairs(), streamed.messages), ([("foo@a.example.com", 2)], 4))
+
+
+class ListFromTopTest(unittest.TestCase):
+    def test_top_by_registrable_domain(self):
+        backend = FakeGmail(3000, seed=5)
+        query = "category:promotions"
+        ids = [m["id"] for m in backend.list_page(query, None, 10**6)["messages"]]
+        truth = Counter(registrable_domain(backend.messages[mid]["from"].rsplit("@", 1)[1].rstrip(">")) for mid in ids)
+        code, out, err = run_main(backend, ["--query", query, "--quota-units", "0", "--top", "2", "--group-by", "registrable"])
+        self.assertEqual(code, 0)
+        lines = out.splitlines()
+        self.assertEqual(lines[0], f"主網域前 2 名（統計 {len(ids)} 封）：")
+        self.assertEqual(lines[1:], [f"- {key}: {n}" for key, n in sorted(truth.items(), key=lambda x: (-x[1], x[0]))[:2]])
+        # Partial rankings are reported after each page but the last
+        self.assertGreater(len(ids), 500)
+        self.assertEqual(err.count("進度：已統計"), (len(ids) - 1) // 500)
+        self.assertNotIn("TRASH", {lid for m in backend.messages.values() for lid in m["labelIds"]})
+
+    def test_top_must_be_positive(self):
+        code, _, err = run_main(FakeGmail(10), ["--query", "q", "--top", "0"])
+        self.assertEqual(code, 1)
+        self.assertIn("--top", err)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import contextlib
+import io
+import json
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks.fake_gmail import FakeGmail
+from src import gmail_ops, gmail_trash
+from src.stats import RunStats
+
+
+def run_main(backend, argv):
+    out, err = io.StringIO(), io.StringIO()
+    with mock.patch.object(gmail_trash, "get_credentials", return_value=object()), mock.patch.object(
+        gmail_trash, "build_service", return_value=backend
+    ), mock.patch.object(gmail_trash, "load_dotenv"), contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+        code = gmail_trash.main(argv)
+    return code, out.getvalue(), err.getvalue()
+
+
+class RunStatsTest(unittest.TestCase):
+    def test_calls_units_and_percentiles(self):
+        ticks = iter([0.0, 1.0, 3.0, 10.0])
+        stats = RunStats(clock=lambda: next(ticks))
+        with stats.phase("search"):
+            pass
+        for ms in (3, 8, 8, 40):
+            stats.record_call("messages.get", 1, ms / 1000)
+        stats.record_call("messages.batchModify", 1, 0.2, 429)
+        stats.record_retry("messages.list", 2.0)
+        d = stats.as_dict()
+        self.assertEqual(d["total_s"], 10.0)
+        self.assertEqual(d["phases_s"], {"search": 2.0})
+        self.assertEqual(d["units"], 4 * 5 + 50)
+        get = d["methods"]["messages.get"]
+        self.assertEqual((get["calls"], get["latency_ms"]["p50"], get["latency_ms"]["p95"]), (4, 10, 40))
+        self.assertEqual(d["methods"]["messages.batchModify"]["errors"], {"429": 1})
+        self.assertEqual((d["retries"], d["backoff_s"]), ({"messages.list": 1}, 2.0))
+
+
+class MainStatsTest(unittest.TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.tmp = tmp.name
+        self.base = ["--query", "category:promotions", "--quota-units", "0", "--token-path", os.path.join(self.tmp, "token.json")]
+
+    @mock.patch("time.sleep")
+    def test_stats_json_reports_phases_calls_and_retries(self, _sleep):
+        backend = FakeGmail(600, seed=3, throttle_rate=0.05)
+        path = os.path.join(self.tmp, "stats.json")
+        code, _, err = run_main(backend, [*self.base, "--stats", "--stats-json", path])
+        self.assertEqual(code, 0)
+        self.assertIn("統計：", err)
+        with open(path, encoding="utf-8") as f:
+            report = json.load(f)
+        self.assertTrue({"auth", "search", "metadata", "plan", "modify"} <= set(report["phases_s"]))
+        methods = report["methods"]
+        self.assertEqual(methods["messages.list"]["calls"], backend.calls["messages.list"])
+        self.assertEqual(methods["messages.batchModify"]["calls"], backend.calls["messages.batchModify"])
+        self.assertEqual(methods["messages.get"]["errors"].get("429"), backend.throttled["messages.get"])
+        self.assertGreater(sum(report["retries"].values()), 0)
+        # Retries are keyed by the API method they repeated
+        self.assertLessEqual(set(report["retries"]), set(methods))
+        self.assertIsNone(gmail_ops._stats)
+
+    def test_disabled_by_default(self):
+        backend = FakeGmail(50, seed=3)
+        with mock.patch.object(gmail_trash, "set_stats") as set_stats:
+            code, _, err = run_main(backend, [*self.base, "--dry-run"])
+        self.assertEqual(code, 0)
+        set_stats.assert_not_called()
+        self.assertNotIn("統計：", err)
+
+    def test_profile_is_written(self):
+        path = os.path.join(self.tmp, "run.prof")
+        code, _, _ = run_main(FakeGmail(50, seed=3), [*self.base, "--dry-run", "--profile", path])
+        self.assertEqual(code, 0)
+        self.assertGreater(os.path.getsize(path), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()